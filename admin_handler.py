@@ -8,13 +8,169 @@ from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.error import TelegramError
 
-from database import DatabaseManager, User, Transaction, GiftCode
+from sqlalchemy import func
+
+from database import get_async_database, get_pool_stats, BalanceLedger, Money, User, Transaction, GiftCode
 from config import Config
 from keyboards import Keyboards
-from utils import format_currency, get_user_display_name
+from outbound import TRANSACTIONAL_LANE, get_outbound_scheduler, get_lane_request
+from broadcast import get_broadcast_engine
+from utils import format_currency, parse_amount, get_user_display_name
 
 logger = logging.getLogger(__name__)
-db = DatabaseManager()
+db = get_async_database()
+
+def _get_overview_stats(session):
+    """إحصائيات لوحة التحكم العامة"""
+    total_users = session.query(User).count()
+    total_balance = session.query(User).with_entities(func.sum(User.balance)).scalar() or 0
+    today_transactions = session.query(Transaction).filter(
+        Transaction.created_at >= datetime.now().date()
+    ).count()
+    return total_users, total_balance, today_transactions
+
+def _get_detailed_stats(session):
+    """الإحصائيات التفصيلية"""
+    # إحصائيات المستخدمين
+    total_users = session.query(User).count()
+    active_users_today = session.query(User).filter(
+        User.last_activity >= datetime.now().date()
+    ).count()
+    
+    # إحصائيات المعاملات
+    today = datetime.now().date()
+    week_ago = today - timedelta(days=7)
+    month_ago = today - timedelta(days=30)
+    
+    today_deposits = session.query(Transaction).filter(
+        Transaction.transaction_type == 'deposit',
+        Transaction.created_at >= today
+    ).count()
+    
+    today_withdrawals = session.query(Transaction).filter(
+        Transaction.transaction_type == 'withdraw',
+        Transaction.created_at >= today
+    ).count()
+    
+    week_transactions = session.query(Transaction).filter(
+        Transaction.created_at >= week_ago
+    ).count()
+    
+    month_transactions = session.query(Transaction).filter(
+        Transaction.created_at >= month_ago
+    ).count()
+    
+    # إحصائيات الأرصدة
+    total_balance = session.query(User).with_entities(func.sum(User.balance)).scalar() or 0
+    avg_balance = session.query(User).with_entities(func.avg(User.balance, type_=Money)).scalar() or 0
+    
+    return {
+        'total_users': total_users,
+        'active_users_today': active_users_today,
+        'today_deposits': today_deposits,
+        'today_withdrawals': today_withdrawals,
+        'week_transactions': week_transactions,
+        'month_transactions': month_transactions,
+        'total_balance': total_balance,
+        'avg_balance': avg_balance
+    }
+
+def _get_pending_transactions(session, limit=10):
+    """آخر المعاملات المعلقة مع أصحابها"""
+    return session.query(Transaction, User).join(User, User.id == Transaction.user_id).filter(
+        Transaction.status == 'pending'
+    ).order_by(Transaction.created_at.desc()).limit(limit).all()
+
+def _adjust_balance(session, telegram_id, amount, operation):
+    """تعديل رصيد مستخدم من الإدمن، وإرجاع (رسالة الخطأ، المستخدم)"""
+    user = session.query(User).filter(User.telegram_id == str(telegram_id)).first()
+    if not user:
+        return "❌ المستخدم غير موجود", None
+    
+    action = "إضافة" if operation == 'add' else "خصم"
+    
+    # سجل المعاملة
+    transaction = Transaction(
+        user_id=user.id,
+        transaction_type='admin_adjustment',
+        amount=amount if operation == 'add' else -amount,
+        status='completed',
+        description=f"{action} رصيد من الإدمن"
+    )
+    
+    if operation == 'add':
+        BalanceLedger.credit(session, user.id, amount, transaction)
+    elif BalanceLedger.debit(session, user.id, amount, transaction) is None:
+        return f"❌ رصيد المستخدم غير كافي\n💵 الرصيد الحالي: {format_currency(user.balance)}", user
+    
+    session.commit()
+    return None, user
+
+def _get_user_report(session, user_id):
+    """ملخص معاملات المستخدم"""
+    total_deposits = session.query(Transaction).filter(
+        Transaction.user_id == user_id,
+        Transaction.transaction_type == 'deposit',
+        Transaction.status == 'completed'
+    ).with_entities(func.sum(Transaction.amount)).scalar() or 0
+    
+    total_withdrawals = session.query(Transaction).filter(
+        Transaction.user_id == user_id,
+        Transaction.transaction_type == 'withdraw',
+        Transaction.status == 'completed'
+    ).with_entities(func.sum(Transaction.amount)).scalar() or 0
+    
+    transaction_count = session.query(Transaction).filter(
+        Transaction.user_id == user_id
+    ).count()
+    
+    return {
+        'total_deposits': total_deposits,
+        'total_withdrawals': total_withdrawals,
+        'transaction_count': transaction_count
+    }
+
+def _create_gift_code(session, code, amount, max_uses, created_by):
+    """إنشاء كود هدية، وإرجاع False إذا كان الكود موجوداً"""
+    # التحقق من عدم وجود الكود
+    existing = session.query(GiftCode).filter(GiftCode.code == code).first()
+    if existing:
+        return False
+    
+    # إنشاء الكود
+    gift_code = GiftCode(
+        code=code,
+        amount=amount,
+        max_uses=max_uses,
+        current_uses=0,
+        is_active=True,
+        created_by=created_by
+    )
+    session.add(gift_code)
+    session.commit()
+    return True
+
+def _apply_transaction_action(session, transaction_id, action):
+    """الموافقة على معاملة معلقة أو رفضها، وإرجاع (رسالة الخطأ، المعاملة، المستخدم)"""
+    transaction = session.query(Transaction).filter(Transaction.id == transaction_id).first()
+    if not transaction:
+        return "❌ المعاملة غير موجودة", None, None
+    
+    if transaction.status != 'pending':
+        return f"❌ المعاملة {transaction.status} بالفعل", None, None
+    
+    user = session.query(User).filter(User.id == transaction.user_id).first()
+    
+    if action == 'approve':
+        transaction.status = 'completed'
+        
+        if transaction.transaction_type == 'deposit':
+            BalanceLedger.credit(session, user.id, transaction.amount)
+    else:
+        transaction.status = 'rejected'
+    
+    session.commit()
+    return None, transaction, user
 
 class AdminHandler:
     """فئة معالج صلاحيات الإدمن"""
@@ -29,15 +185,9 @@ class AdminHandler:
             return
         
         # إحصائيات عامة
-        session = db.get_session()
-        try:
-            total_users = session.query(User).count()
-            total_balance = session.query(User).with_entities(db.func.sum(User.balance)).scalar() or 0
-            today_transactions = session.query(Transaction).filter(
-                Transaction.created_at >= datetime.now().date()
-            ).count()
-            
-            message = f"""
+        total_users, total_balance, today_transactions = await db.run(_get_overview_stats)
+        
+        message = f"""
 🔧 لوحة تحكم الإدمن
 
 📊 إحصائيات عامة:
@@ -46,20 +196,18 @@ class AdminHandler:
 📈 معاملات اليوم: {today_transactions}
 
 اختر العملية المطلوبة:
-            """
-            
-            if update.callback_query:
-                await update.callback_query.edit_message_text(
-                    message,
-                    reply_markup=Keyboards.admin_panel()
-                )
-            else:
-                await update.message.reply_text(
-                    message,
-                    reply_markup=Keyboards.admin_panel()
-                )
-        finally:
-            session.close()
+        """
+        
+        if update.callback_query:
+            await update.callback_query.edit_message_text(
+                message,
+                reply_markup=Keyboards.admin_panel()
+            )
+        else:
+            await update.message.reply_text(
+                message,
+                reply_markup=Keyboards.admin_panel()
+            )
     
     @staticmethod
     async def user_management(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -151,93 +299,77 @@ class AdminHandler:
     @staticmethod
     async def view_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """عرض الإحصائيات التفصيلية"""
-        session = db.get_session()
-        try:
-            # إحصائيات المستخدمين
-            total_users = session.query(User).count()
-            active_users_today = session.query(User).filter(
-                User.last_activity >= datetime.now().date()
-            ).count()
-            
-            # إحصائيات المعاملات
-            today = datetime.now().date()
-            week_ago = today - timedelta(days=7)
-            month_ago = today - timedelta(days=30)
-            
-            today_deposits = session.query(Transaction).filter(
-                Transaction.transaction_type == 'deposit',
-                Transaction.created_at >= today
-            ).count()
-            
-            today_withdrawals = session.query(Transaction).filter(
-                Transaction.transaction_type == 'withdraw',
-                Transaction.created_at >= today
-            ).count()
-            
-            week_transactions = session.query(Transaction).filter(
-                Transaction.created_at >= week_ago
-            ).count()
-            
-            month_transactions = session.query(Transaction).filter(
-                Transaction.created_at >= month_ago
-            ).count()
-            
-            # إحصائيات الأرصدة
-            total_balance = session.query(User).with_entities(db.func.sum(User.balance)).scalar() or 0
-            avg_balance = session.query(User).with_entities(db.func.avg(User.balance)).scalar() or 0
-            
-            message = f"""
+        stats = await db.run(_get_detailed_stats)
+        pool = next(iter(get_pool_stats()['async']), {})
+        cache = db.user_cache.stats()
+        outbound = get_outbound_scheduler().stats()
+        lanes = outbound['lanes']
+        pools = get_lane_request().stats()
+        
+        message = f"""
 📊 إحصائيات تفصيلية
 
 👥 المستخدمون:
-• إجمالي المستخدمين: {total_users}
-• نشطون اليوم: {active_users_today}
+• إجمالي المستخدمين: {stats['total_users']}
+• نشطون اليوم: {stats['active_users_today']}
 
 💰 المعاملات:
-• إيداعات اليوم: {today_deposits}
-• سحوبات اليوم: {today_withdrawals}
-• معاملات الأسبوع: {week_transactions}
-• معاملات الشهر: {month_transactions}
+• إيداعات اليوم: {stats['today_deposits']}
+• سحوبات اليوم: {stats['today_withdrawals']}
+• معاملات الأسبوع: {stats['week_transactions']}
+• معاملات الشهر: {stats['month_transactions']}
 
 💵 الأرصدة:
-• إجمالي الأرصدة: {format_currency(total_balance)}
-• متوسط الرصيد: {format_currency(avg_balance)}
-            """
-            
-            await update.callback_query.edit_message_text(
-                message,
-                reply_markup=Keyboards.admin_back_menu()
-            )
-        finally:
-            session.close()
+• إجمالي الأرصدة: {format_currency(stats['total_balance'])}
+• متوسط الرصيد: {format_currency(stats['avg_balance'])}
+
+🗄 مجمع الاتصالات:
+• النوع: {pool.get('pool_class', '-')}
+• مستخدمة حالياً: {pool.get('checked_out', '-')}
+• متاحة: {pool.get('checked_in', '-')}
+
+⚡ ذاكرة المستخدمين المؤقتة:
+• الحجم: {cache['size']}/{cache['max_size']}
+• نسبة الإصابة: {cache['hit_rate']:.1f}%
+• مطرودة: {cache['evictions']} | ملغاة: {cache['invalidations']}
+
+📤 الرسائل الصادرة (في الطابور / وسيط الانتظار / p95):
+• تفاعلية: {lanes['interactive']['depth']} / {lanes['interactive']['wait_p50']:.2f}ث / {lanes['interactive']['wait_p95']:.2f}ث
+• المعاملات: {lanes['transactional']['depth']} / {lanes['transactional']['wait_p50']:.2f}ث / {lanes['transactional']['wait_p95']:.2f}ث
+• جماعية: {lanes['bulk']['depth']} / {lanes['bulk']['wait_p50']:.2f}ث / {lanes['bulk']['wait_p95']:.2f}ث
+• RetryAfter: {outbound['retry_after']}
+
+🌐 مجمعات اتصالات تليجرام (الحجم / p50 / p99):
+• تفاعلية: {pools['interactive']['pool_size']} / {pools['interactive']['latency_p50']:.2f}ث / {pools['interactive']['latency_p99']:.2f}ث
+• المعاملات: {pools['transactional']['pool_size']} / {pools['transactional']['latency_p50']:.2f}ث / {pools['transactional']['latency_p99']:.2f}ث
+• جماعية: {pools['bulk']['pool_size']} / {pools['bulk']['latency_p50']:.2f}ث / {pools['bulk']['latency_p99']:.2f}ث
+        """
+        
+        await update.callback_query.edit_message_text(
+            message,
+            reply_markup=Keyboards.admin_back_menu()
+        )
     
     @staticmethod
     async def pending_transactions(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """عرض المعاملات المعلقة"""
-        session = db.get_session()
-        try:
-            pending = session.query(Transaction).filter(
-                Transaction.status == 'pending'
-            ).order_by(Transaction.created_at.desc()).limit(10).all()
-            
-            if not pending:
-                message = "✅ لا توجد معاملات معلقة حالياً"
-            else:
-                message = "⏳ المعاملات المعلقة:\n\n"
-                for i, transaction in enumerate(pending, 1):
-                    user = session.query(User).filter(User.id == transaction.user_id).first()
-                    message += f"{i}. {transaction.transaction_type.upper()}\n"
-                    message += f"👤 {get_user_display_name(user)}\n"
-                    message += f"💰 {format_currency(transaction.amount)}\n"
-                    message += f"📅 {transaction.created_at.strftime('%Y-%m-%d %H:%M')}\n"
-                    message += f"🆔 ID: {transaction.id}\n\n"
-            
-            await update.callback_query.edit_message_text(
-                message,
-                reply_markup=Keyboards.pending_transactions_menu()
-            )
-        finally:
-            session.close()
+        pending = await db.run(_get_pending_transactions)
+        
+        if not pending:
+            message = "✅ لا توجد معاملات معلقة حالياً"
+        else:
+            message = "⏳ المعاملات المعلقة:\n\n"
+            for i, (transaction, user) in enumerate(pending, 1):
+                message += f"{i}. {transaction.transaction_type.upper()}\n"
+                message += f"👤 {get_user_display_name(user)}\n"
+                message += f"💰 {format_currency(transaction.amount)}\n"
+                message += f"📅 {transaction.created_at.strftime('%Y-%m-%d %H:%M')}\n"
+                message += f"🆔 ID: {transaction.id}\n\n"
+        
+        await update.callback_query.edit_message_text(
+            message,
+            reply_markup=Keyboards.pending_transactions_menu()
+        )
     
     @staticmethod
     async def approve_transaction(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -273,16 +405,47 @@ class AdminHandler:
     
     @staticmethod
     async def broadcast_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """إرسال رسالة جماعية"""
-        message = """
+        """إرسال رسالة جماعية: اختيار الفئة المستهدفة أولاً"""
+        if Config.SHARDED or not db.recipients.loaded:
+            await db.load_recipient_index()
+        
+        segment_counts = {
+            segment: db.recipients.count(segment)
+            for segment in Config.get_broadcast_segments()
+        }
+        
+        await update.callback_query.edit_message_text(
+            "📢 إرسال رسالة جماعية\n\nاختر فئة المستخدمين المستهدفة:",
+            reply_markup=Keyboards.broadcast_segments_menu(segment_counts)
+        )
+    
+    @staticmethod
+    async def broadcast_segment(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """اختيار فئة الرسالة الجماعية (broadcast_segment:<الفئة>)"""
+        query = update.callback_query
+        await query.answer()
+        
+        if update.effective_user.id not in Config.ADMIN_IDS:
+            return
+        
+        segment = query.data.split(":", 1)[1]
+        segments = Config.get_broadcast_segments()
+        if segment not in segments:
+            await query.edit_message_text("❌ فئة غير معروفة", reply_markup=Keyboards.admin_panel())
+            return
+        
+        context.user_data['admin_operation'] = 'broadcast'
+        context.user_data['broadcast_segment'] = None if segment == "all" else segment
+        
+        message = f"""
 📢 إرسال رسالة جماعية
 
-أرسل الرسالة التي تريد إرسالها لجميع المستخدمين:
+🎯 الفئة: {segments[segment]} ({db.recipients.count(segment)} مستخدم)
+
+أرسل الرسالة التي تريد إرسالها:
         """
         
-        context.user_data['admin_operation'] = 'broadcast'
-        
-        await update.callback_query.edit_message_text(
+        await query.edit_message_text(
             message,
             reply_markup=Keyboards.cancel_admin_operation()
         )
@@ -324,59 +487,37 @@ class AdminHandler:
                 return
             
             user_id = int(parts[0])
-            amount = float(parts[1])
+            amount = parse_amount(parts[1])
             
-            session = db.get_session()
-            try:
-                user = session.query(User).filter(User.telegram_id == user_id).first()
-                if not user:
-                    await update.message.reply_text(
-                        "❌ المستخدم غير موجود",
-                        reply_markup=Keyboards.admin_panel()
-                    )
-                    return
-                
-                if operation == 'add':
-                    user.balance += amount
-                    action = "إضافة"
-                    emoji = "➕"
-                else:
-                    if user.balance < amount:
-                        await update.message.reply_text(
-                            f"❌ رصيد المستخدم غير كافي\n💵 الرصيد الحالي: {format_currency(user.balance)}",
-                            reply_markup=Keyboards.admin_panel()
-                        )
-                        return
-                    user.balance -= amount
-                    action = "خصم"
-                    emoji = "➖"
-                
-                # إضافة سجل المعاملة
-                transaction = Transaction(
-                    user_id=user.id,
-                    transaction_type='admin_adjustment',
-                    amount=amount if operation == 'add' else -amount,
-                    status='completed',
-                    description=f"{action} رصيد من الإدمن"
-                )
-                session.add(transaction)
-                session.commit()
-                
-                # إشعار المستخدم
-                try:
-                    await context.bot.send_message(
-                        chat_id=user.telegram_id,
-                        text=f"{emoji} تم {action} {format_currency(amount)} إلى رصيدك\n💵 رصيدك الحالي: {format_currency(user.balance)}"
-                    )
-                except TelegramError:
-                    logger.warning(f"لا يمكن إرسال إشعار للمستخدم {user.telegram_id}")
-                
+            error_msg, user = await db.run(_adjust_balance, user_id, amount, operation)
+            if error_msg:
                 await update.message.reply_text(
-                    f"✅ تم {action} {format_currency(amount)} بنجاح\n👤 المستخدم: {get_user_display_name(user)}\n💵 الرصيد الجديد: {format_currency(user.balance)}",
+                    error_msg,
                     reply_markup=Keyboards.admin_panel()
                 )
-            finally:
-                session.close()
+                return
+            
+            if operation == 'add':
+                action = "إضافة"
+                emoji = "➕"
+            else:
+                action = "خصم"
+                emoji = "➖"
+            
+            # إشعار المستخدم
+            try:
+                await context.bot.send_message(
+                    chat_id=user.telegram_id,
+                    text=f"{emoji} تم {action} {format_currency(amount)} إلى رصيدك\n💵 رصيدك الحالي: {format_currency(user.balance)}",
+                    rate_limit_args=TRANSACTIONAL_LANE
+                )
+            except TelegramError:
+                logger.warning(f"لا يمكن إرسال إشعار للمستخدم {user.telegram_id}")
+            
+            await update.message.reply_text(
+                f"✅ تم {action} {format_currency(amount)} بنجاح\n👤 المستخدم: {get_user_display_name(user)}\n💵 الرصيد الجديد: {format_currency(user.balance)}",
+                reply_markup=Keyboards.admin_panel()
+            )
                 
         except (ValueError, IndexError):
             await update.message.reply_text(
@@ -387,44 +528,19 @@ class AdminHandler:
     @staticmethod
     async def _handle_user_info(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
         """معالجة عرض معلومات المستخدم"""
-        session = db.get_session()
-        try:
-            user = None
-            
-            # البحث بمعرف التليجرام
-            if text.isdigit():
-                user = session.query(User).filter(User.telegram_id == int(text)).first()
-            
-            # البحث باسم المستخدم
-            if not user:
-                username = text.replace('@', '')
-                user = session.query(User).filter(User.username == username).first()
-            
-            if not user:
-                await update.message.reply_text(
-                    "❌ المستخدم غير موجود",
-                    reply_markup=Keyboards.admin_panel()
-                )
-                return
-            
-            # إحصائيات المستخدم
-            total_deposits = session.query(Transaction).filter(
-                Transaction.user_id == user.id,
-                Transaction.transaction_type == 'deposit',
-                Transaction.status == 'completed'
-            ).with_entities(db.func.sum(Transaction.amount)).scalar() or 0
-            
-            total_withdrawals = session.query(Transaction).filter(
-                Transaction.user_id == user.id,
-                Transaction.transaction_type == 'withdraw',
-                Transaction.status == 'completed'
-            ).with_entities(db.func.sum(Transaction.amount)).scalar() or 0
-            
-            transaction_count = session.query(Transaction).filter(
-                Transaction.user_id == user.id
-            ).count()
-            
-            message = f"""
+        user = await db.find_user(text)
+        
+        if not user:
+            await update.message.reply_text(
+                "❌ المستخدم غير موجود",
+                reply_markup=Keyboards.admin_panel()
+            )
+            return
+        
+        # إحصائيات المستخدم
+        report = await db.run(_get_user_report, user.id)
+        
+        message = f"""
 👤 معلومات المستخدم
 
 🆔 معرف التليجرام: {user.telegram_id}
@@ -435,8 +551,8 @@ class AdminHandler:
 
 💰 الأرصدة:
 💵 الرصيد الحالي: {format_currency(user.balance)}
-📈 إجمالي الإيداعات: {format_currency(total_deposits)}
-📉 إجمالي السحوبات: {format_currency(total_withdrawals)}
+📈 إجمالي الإيداعات: {format_currency(report['total_deposits'])}
+📉 إجمالي السحوبات: {format_currency(report['total_withdrawals'])}
 
 👥 الإحالات:
 🔗 كود الإحالة: {user.referral_code}
@@ -445,15 +561,13 @@ class AdminHandler:
 👤 أحاله: {user.referred_by or 'لا يوجد'}
 
 📊 الإحصائيات:
-📈 عدد المعاملات: {transaction_count}
-            """
-            
-            await update.message.reply_text(
-                message,
-                reply_markup=Keyboards.admin_panel()
-            )
-        finally:
-            session.close()
+📈 عدد المعاملات: {report['transaction_count']}
+        """
+        
+        await update.message.reply_text(
+            message,
+            reply_markup=Keyboards.admin_panel()
+        )
     
     @staticmethod
     async def _handle_create_gift_code(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
@@ -468,38 +582,21 @@ class AdminHandler:
                 return
             
             code = parts[0].upper()
-            amount = float(parts[1])
+            amount = parse_amount(parts[1])
             max_uses = int(parts[2])
             
-            session = db.get_session()
-            try:
-                # التحقق من عدم وجود الكود
-                existing = session.query(GiftCode).filter(GiftCode.code == code).first()
-                if existing:
-                    await update.message.reply_text(
-                        "❌ هذا الكود موجود بالفعل",
-                        reply_markup=Keyboards.admin_panel()
-                    )
-                    return
-                
-                # إنشاء الكود
-                gift_code = GiftCode(
-                    code=code,
-                    amount=amount,
-                    max_uses=max_uses,
-                    current_uses=0,
-                    is_active=True,
-                    created_by=update.effective_user.id
-                )
-                session.add(gift_code)
-                session.commit()
-                
+            created = await db.run(_create_gift_code, code, amount, max_uses, update.effective_user.id)
+            if not created:
                 await update.message.reply_text(
-                    f"✅ تم إنشاء كود الهدية بنجاح\n🎁 الكود: {code}\n💰 المبلغ: {format_currency(amount)}\n🔢 عدد الاستخدامات: {max_uses}",
+                    "❌ هذا الكود موجود بالفعل",
                     reply_markup=Keyboards.admin_panel()
                 )
-            finally:
-                session.close()
+                return
+            
+            await update.message.reply_text(
+                f"✅ تم إنشاء كود الهدية بنجاح\n🎁 الكود: {code}\n💰 المبلغ: {format_currency(amount)}\n🔢 عدد الاستخدامات: {max_uses}",
+                reply_markup=Keyboards.admin_panel()
+            )
                 
         except (ValueError, IndexError):
             await update.message.reply_text(
@@ -513,55 +610,35 @@ class AdminHandler:
         try:
             transaction_id = int(text)
             
-            session = db.get_session()
-            try:
-                transaction = session.query(Transaction).filter(Transaction.id == transaction_id).first()
-                if not transaction:
-                    await update.message.reply_text(
-                        "❌ المعاملة غير موجودة",
-                        reply_markup=Keyboards.admin_panel()
-                    )
-                    return
-                
-                if transaction.status != 'pending':
-                    await update.message.reply_text(
-                        f"❌ المعاملة {transaction.status} بالفعل",
-                        reply_markup=Keyboards.admin_panel()
-                    )
-                    return
-                
-                user = session.query(User).filter(User.id == transaction.user_id).first()
-                
-                if action == 'approve':
-                    transaction.status = 'completed'
-                    
-                    if transaction.transaction_type == 'deposit':
-                        user.balance += transaction.amount
-                    
-                    status_text = "تمت الموافقة على"
-                    emoji = "✅"
-                else:
-                    transaction.status = 'rejected'
-                    status_text = "تم رفض"
-                    emoji = "❌"
-                
-                session.commit()
-                
-                # إشعار المستخدم
-                try:
-                    await context.bot.send_message(
-                        chat_id=user.telegram_id,
-                        text=f"{emoji} {status_text} طلب {transaction.transaction_type} بقيمة {format_currency(transaction.amount)}"
-                    )
-                except TelegramError:
-                    logger.warning(f"لا يمكن إرسال إشعار للمستخدم {user.telegram_id}")
-                
+            error_msg, transaction, user = await db.run(_apply_transaction_action, transaction_id, action)
+            if error_msg:
                 await update.message.reply_text(
-                    f"{emoji} {status_text} المعاملة رقم {transaction_id} بنجاح",
+                    error_msg,
                     reply_markup=Keyboards.admin_panel()
                 )
-            finally:
-                session.close()
+                return
+            
+            if action == 'approve':
+                status_text = "تمت الموافقة على"
+                emoji = "✅"
+            else:
+                status_text = "تم رفض"
+                emoji = "❌"
+            
+            # إشعار المستخدم
+            try:
+                await context.bot.send_message(
+                    chat_id=user.telegram_id,
+                    text=f"{emoji} {status_text} طلب {transaction.transaction_type} بقيمة {format_currency(transaction.amount)}",
+                    rate_limit_args=TRANSACTIONAL_LANE
+                )
+            except TelegramError:
+                logger.warning(f"لا يمكن إرسال إشعار للمستخدم {user.telegram_id}")
+            
+            await update.message.reply_text(
+                f"{emoji} {status_text} المعاملة رقم {transaction_id} بنجاح",
+                reply_markup=Keyboards.admin_panel()
+            )
                 
         except ValueError:
             await update.message.reply_text(
@@ -572,27 +649,6 @@ class AdminHandler:
     @staticmethod
     async def _handle_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
         """معالجة الرسالة الجماعية"""
-        session = db.get_session()
-        try:
-            users = session.query(User).all()
-            sent_count = 0
-            failed_count = 0
-            
-            for user in users:
-                try:
-                    await context.bot.send_message(
-                        chat_id=user.telegram_id,
-                        text=f"📢 رسالة من الإدارة:\n\n{text}"
-                    )
-                    sent_count += 1
-                except TelegramError:
-                    failed_count += 1
-                    logger.warning(f"فشل إرسال الرسالة للمستخدم {user.telegram_id}")
-            
-            await update.message.reply_text(
-                f"📢 تم إرسال الرسالة الجماعية\n✅ تم الإرسال: {sent_count}\n❌ فشل الإرسال: {failed_count}",
-                reply_markup=Keyboards.admin_panel()
-            )
-        finally:
-            session.close()
-
+        # الإرسال يتم بالخلفية، ويتم تحديث رسالة تقدم واحدة للإدمن
+        segment = context.user_data.pop('broadcast_segment', None)
+        await get_broadcast_engine(context.bot).start(update.effective_chat.id, text, segment)
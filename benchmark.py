@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+قياس أداء قاعدة البيانات SQLite
+الاستخدام: python benchmark.py [--users 200] [--operations 2000] [--threads 8]
+           python benchmark.py --scenario jackpot [--bets 10000]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# إضافة مسار المشروع
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from database import DatabaseManager, get_engine, to_money
+
+def run_workload(db, users, operations, threads, read_ratio):
+    """تشغيل حمل مختلط من القراءة والكتابة على الجداول الحالية"""
+    user_ids = [db.create_user(100000 + i).id for i in range(users)]
+    telegram_ids = [100000 + i for i in range(users)]
+
+    counters = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def operation(index):
+        rng = random.Random(index)
+        kind = "reads" if rng.random() < read_ratio else "writes"
+        try:
+            if kind == "reads":
+                db.get_user_betting_stats(rng.choice(user_ids))
+            else:
+                db.update_user_balance(rng.choice(telegram_ids), 1, "deposit", "benchmark")
+        except Exception:
+            kind = "errors"
+        with lock:
+            counters[kind] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(operation, range(operations)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "elapsed": elapsed,
+        "ops_per_sec": operations / elapsed,
+        "reads_per_sec": counters["reads"] / elapsed,
+        "writes_per_sec": counters["writes"] / elapsed,
+        "errors": counters["errors"]
+    }
+
+def run_profile(name, pragmas, args):
+    """قياس أداء ملف قاعدة بيانات جديد بإعدادات محددة"""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        database_url = f"sqlite:///{os.path.join(temp_dir, f'{name}.db')}"
+        engine = get_engine(database_url, sqlite_pragmas=pragmas)
+        db = DatabaseManager(database_url)
+        db.create_tables()
+
+        result = run_workload(db, args.users, args.operations, args.threads, args.read_ratio)
+        engine.dispose()
+        return result
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def run_jackpot_ingestion(name, batched, args):
+    """قياس إدخال مساهمات الجاكبوت رهاناً برهان أو على دفعات"""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        database_url = f"sqlite:///{os.path.join(temp_dir, f'{name}.db')}"
+        engine = get_engine(database_url, sqlite_pragmas=Config.SQLITE_PRAGMAS)
+        db = DatabaseManager(database_url)
+        db.create_tables()
+
+        user_ids = [db.create_user(200000 + i).id for i in range(args.users)]
+        rng = random.Random(7)
+        contributions = [
+            (rng.choice(user_ids), None, to_money(rng.randint(1, 10000) / 100))
+            for _ in range(args.bets)
+        ]
+
+        started = time.perf_counter()
+        if batched:
+            for start in range(0, len(contributions), Config.JACKPOT_BATCH_SIZE):
+                db.add_jackpot_contributions(contributions[start:start + Config.JACKPOT_BATCH_SIZE])
+        else:
+            for user_id, bet_id, amount in contributions:
+                db.add_jackpot_contribution(user_id, bet_id, amount)
+        elapsed = time.perf_counter() - started
+
+        if db.reconcile_jackpot_pools():
+            raise RuntimeError("إجمالي الجاكبوت لا يطابق المساهمات")
+        engine.dispose()
+        return {"elapsed": elapsed, "bets_per_sec": args.bets / elapsed}
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def jackpot_main(args):
+    """مقارنة إدخال المساهمات رهاناً برهان مع الإدخال على دفعات"""
+    print(f"📊 {args.bets} رهان، دفعات من {Config.JACKPOT_BATCH_SIZE}")
+    print("-" * 60)
+
+    results = {
+        "per-bet": run_jackpot_ingestion("per_bet", False, args),
+        "batched": run_jackpot_ingestion("batched", True, args)
+    }
+
+    for name, result in results.items():
+        print(f"{name:>8}: {result['elapsed']:8.2f} ث | {result['bets_per_sec']:10.1f} رهان/ث")
+
+    speedup = results["batched"]["bets_per_sec"] / results["per-bet"]["bets_per_sec"]
+    print("-" * 60)
+    print(f"⚡ التحسن: {speedup:.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس أداء SQLite")
+    parser.add_argument("--scenario", choices=["pragmas", "jackpot"], default="pragmas",
+                        help="pragmas: قبل وبعد إعدادات الأداء | jackpot: إدخال مساهمات الجاكبوت")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--operations", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--read-ratio", type=float, default=0.8)
+    parser.add_argument("--bets", type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.scenario == "jackpot":
+        jackpot_main(args)
+        return
+
+    print(f"📊 {args.operations} عملية، {args.threads} خيوط، نسبة القراءة {args.read_ratio:.0%}")
+    print("-" * 60)
+
+    results = {
+        "default": run_profile("default", {}, args),
+        "tuned": run_profile("tuned", Config.SQLITE_PRAGMAS or {"journal_mode": "WAL"}, args)
+    }
+
+    for name, result in results.items():
+        print(
+            f"{name:>8}: {result['ops_per_sec']:8.1f} عملية/ث | "
+            f"قراءة {result['reads_per_sec']:8.1f}/ث | "
+            f"كتابة {result['writes_per_sec']:8.1f}/ث | "
+            f"أخطاء {result['errors']}"
+        )
+
+    speedup = results["tuned"]["ops_per_sec"] / results["default"]["ops_per_sec"]
+    print("-" * 60)
+    print(f"⚡ التحسن: {speedup:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+خط إدخال رهانات ichancy.com - من webhook موقّع أو من ملف JSONL
+
+الـ webhook يعمل داخل عملية البوت (main.py)، لأن تسوية الرهانات تضيف الأرباح
+للأرصدة وتلغي نسخ المستخدمين من الذاكرة المؤقتة لهذه العملية فقط؛ لو كتبت
+عملية أخرى في قاعدة البيانات لرأى المستخدمون أرصدة قديمة حتى انتهاء صلاحية
+النسخ. لذلك يُدخل ملف JSONL مسجل بإرساله إلى webhook البوت:
+الاستخدام: python bet_ingestion.py replay <ملف.jsonl> [--url http://127.0.0.1:8081/ichancy/bets]
+
+كل حدث رهان كائن JSON بالشكل:
+{"bet_id": "ich-1001", "telegram_id": "123456789", "game_type": "casino", "game_category": "slots",
+ "game_name": "Book of Ra", "amount": "10.00", "odds": 2.5, "potential_win": "25.00",
+ "status": "pending", "actual_win": "0", "placed_at": "2024-01-01T12:00:00"}
+
+الحالة pending لرهان جديد، و won أو lost أو cancelled لتسويته.
+"""
+
+import os
+import sys
+import json
+import hmac
+import asyncio
+import hashlib
+import argparse
+import logging
+from datetime import datetime
+
+import aiohttp
+from aiohttp import web
+
+# إضافة مسار المشروع
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from database import get_async_database, to_money
+from utils import RecentIds
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = "X-Ichancy-Signature"
+BET_STATUSES = ('pending', 'won', 'lost', 'cancelled')
+SETTLED_STATUSES = ('won', 'lost', 'cancelled')
+
+def sign_payload(body, secret):
+    """توقيع جسم الطلب بـ HMAC-SHA256 كما يرسله ichancy"""
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+def verify_signature(body, signature, secret):
+    """التحقق من توقيع جسم الطلب بمقارنة ثابتة الزمن"""
+    if not secret or not signature:
+        return False
+    return hmac.compare_digest(sign_payload(body, secret), signature)
+
+def parse_event(event):
+    """تحويل حدث رهان من ichancy إلى أعمدة جدول الرهانات، أو ValueError إذا كان غير صالح"""
+    if not isinstance(event, dict):
+        raise ValueError(f"حدث رهان غير صالح: {type(event).__name__} بدل كائن JSON")
+    try:
+        status = event.get('status', 'pending')
+        if status not in BET_STATUSES:
+            raise ValueError(f"حالة غير معروفة: {status}")
+
+        bet = {
+            'ichancy_bet_id': str(event['bet_id']),
+            'telegram_id': str(event['telegram_id']),
+            'game_type': event['game_type'],
+            'game_category': event.get('game_category'),
+            'game_name': event.get('game_name'),
+            'bet_amount': to_money(event['amount']),
+            'potential_win': to_money(event['potential_win']) if event.get('potential_win') is not None else None,
+            'odds': float(event['odds']) if event.get('odds') is not None else None,
+            'bet_details': json.dumps(event['details'], ensure_ascii=False) if event.get('details') else None,
+            'placed_at': datetime.fromisoformat(event['placed_at']) if event.get('placed_at') else None,
+            'status': status,
+            'actual_win': to_money(event.get('actual_win') or 0)
+        }
+    except (KeyError, TypeError, ArithmeticError) as e:
+        raise ValueError(f"حدث رهان غير صالح: {e}") from e
+
+    if bet['bet_amount'] <= 0:
+        raise ValueError("مبلغ الرهان يجب أن يكون موجباً")
+    return bet
+
+def parse_body(body):
+    """قراءة أحداث الرهانات من مصفوفة JSON أو {"events": [...]} أو أسطر JSONL"""
+    text = body.decode() if isinstance(body, bytes) else body
+    try:
+        payload = json.loads(text)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    if isinstance(payload, dict):
+        payload = payload.get('events', [payload])
+    if not isinstance(payload, list):
+        raise ValueError("صيغة الأحداث غير صحيحة")
+    return payload
+
+class BetIngestionPipeline:
+    """خط إدخال الرهانات على دفعات
+
+    يتجاهل الأحداث المكررة بمجموعة في الذاكرة لمفاتيح (bet_id, الحالة) المعالجة
+    مؤخراً، وبالفهرس الفريد على bets.ichancy_bet_id لما سبق إدخاله. لكل دفعة:
+    إدخال الرهانات الجديدة وتحديث إحصائياتها، ثم تسوية المنتهية منها، ثم كتابة
+    مساهمات الجاكبوت مرة واحدة.
+    """
+
+    def __init__(self, db=None, batch_size=None, recent_ids_size=None):
+        self.db = db or get_async_database()
+        self.batch_size = batch_size or Config.BET_INGESTION_CONFIG["batch_size"]
+        self.recent = RecentIds(recent_ids_size or Config.BET_INGESTION_CONFIG["recent_ids_size"])
+
+    async def ingest(self, events):
+        """إدخال قائمة أحداث على دفعات، وإرجاع عدادات النتيجة"""
+        counts = {'received': 0, 'inserted': 0, 'settled': 0, 'duplicates': 0, 'invalid': 0, 'unknown_users': 0}
+        batch = []
+        for event in events:
+            counts['received'] += 1
+            batch.append(event)
+            if len(batch) >= self.batch_size:
+                await self._ingest_batch(batch, counts)
+                batch = []
+        if batch:
+            await self._ingest_batch(batch, counts)
+        return counts
+
+    async def ingest_jsonl(self, path):
+        """إدخال أحداث مسجلة في ملف JSONL"""
+        def read_events():
+            with open(path, encoding="utf-8") as events_file:
+                for line in events_file:
+                    if line.strip():
+                        yield json.loads(line)
+
+        return await self.ingest(read_events())
+
+    async def _ingest_batch(self, events, counts):
+        """معالجة دفعة واحدة من الأحداث"""
+        bets = []
+        for event in events:
+            try:
+                bet = parse_event(event)
+            except ValueError as e:
+                logger.warning(str(e))
+                counts['invalid'] += 1
+                continue
+            if (bet['ichancy_bet_id'], bet['status']) in self.recent:
+                counts['duplicates'] += 1
+                continue
+            bets.append(bet)
+        if not bets:
+            return
+
+        stored = await self.db.ingest_bets(bets)
+
+        settlements = {}
+        contributions = False
+        for bet in bets:
+            ichancy_bet_id = bet['ichancy_bet_id']
+            if ichancy_bet_id not in stored:
+                counts['unknown_users'] += 1
+                continue
+
+            bet_id, user_id, created = stored[ichancy_bet_id]
+            if created:
+                # الحدث الأول لكل رهان جديد يُحتسب إدخالاً ويساهم في الجاكبوت
+                stored[ichancy_bet_id] = (bet_id, user_id, False)
+                counts['inserted'] += 1
+                self.db.jackpot.add_bet(bet['telegram_id'], bet_id, bet['bet_amount'], bet['game_type'])
+                contributions = True
+            elif bet['status'] == 'pending':
+                counts['duplicates'] += 1
+
+            if bet['status'] in SETTLED_STATUSES:
+                settlements[bet_id] = (bet_id, bet['status'], bet['actual_win'])
+
+        if settlements:
+            deltas = await self.db.settle_bets(settlements.values())
+            counts['settled'] += sum(delta['bets_settled'] for delta in deltas.values())
+        if contributions:
+            await self.db.flush_jackpot_contributions()
+
+        for bet in bets:
+            if bet['ichancy_bet_id'] in stored:
+                self.recent.add((bet['ichancy_bet_id'], bet['status']))
+
+    def create_webhook_app(self, secret=None, path=None):
+        """تطبيق aiohttp يستقبل أحداث الرهانات الموقعة من ichancy"""
+        secret = secret if secret is not None else Config.ICHANCY_CONFIG["webhook_secret"]
+        if not secret:
+            logger.warning("ICHANCY_WEBHOOK_SECRET غير معين، سيتم رفض جميع طلبات webhook")
+
+        async def handle_events(request):
+            body = await request.read()
+            if not verify_signature(body, request.headers.get(SIGNATURE_HEADER, ""), secret):
+                return web.json_response({"error": "unauthorized"}, status=401)
+            try:
+                events = parse_body(body)
+            except ValueError:
+                return web.json_response({"error": "invalid payload"}, status=400)
+            return web.json_response(await self.ingest(events))
+
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post(path or Config.BET_INGESTION_CONFIG["webhook_path"], handle_events)
+        return app
+
+async def start_ingestion_server(db=None):
+    """تشغيل webhook الرهانات داخل عملية البوت، وإرجاع AppRunner لإيقافه (cleanup)"""
+    runner = web.AppRunner(BetIngestionPipeline(db).create_webhook_app())
+    await runner.setup()
+    await web.TCPSite(
+        runner, Config.BET_INGESTION_CONFIG["webhook_host"], Config.BET_INGESTION_CONFIG["webhook_port"]
+    ).start()
+    logger.info(f"webhook الرهانات يعمل على المنفذ {Config.BET_INGESTION_CONFIG['webhook_port']}")
+    return runner
+
+async def replay_events(path, url, secret, batch_size=None):
+    """إعادة إرسال أحداث ملف JSONL مسجل إلى webhook كما يرسلها ichancy، وإرجاع مجموع العدادات"""
+    batch_size = batch_size or Config.BET_INGESTION_CONFIG["batch_size"]
+    with open(path, encoding="utf-8") as events_file:
+        lines = [line.strip() for line in events_file if line.strip()]
+
+    totals = {}
+    async with aiohttp.ClientSession() as session:
+        for start in range(0, len(lines), batch_size):
+            body = "\n".join(lines[start:start + batch_size]).encode()
+            async with session.post(url, data=body, headers={SIGNATURE_HEADER: sign_payload(body, secret)}) as response:
+                response.raise_for_status()
+                for name, value in (await response.json()).items():
+                    totals[name] = totals.get(name, 0) + value
+    return totals
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="إدخال رهانات ichancy (الـ webhook يعمل داخل عملية البوت)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    replay_parser = commands.add_parser("replay", help="إرسال ملف أحداث مسجل إلى webhook البوت")
+    replay_parser.add_argument("path")
+    replay_parser.add_argument(
+        "--url",
+        default=f"http://127.0.0.1:{Config.BET_INGESTION_CONFIG['webhook_port']}{Config.BET_INGESTION_CONFIG['webhook_path']}"
+    )
+
+    args = parser.parse_args()
+    print(asyncio.run(replay_events(args.path, args.url, Config.ICHANCY_CONFIG["webhook_secret"])))
+
+if __name__ == "__main__":
+    main()
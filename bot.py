@@ -5,12 +5,15 @@
 import logging
 import asyncio
 from telegram import Update, BotCommand
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
+from telegram.ext import CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
 from telegram.error import TelegramError
 
-from database import DatabaseManager, User
+from database import get_async_database, User
 from config import Config
 from keyboards import Keyboards
+from outbound import TRANSACTIONAL_LANE, build_application
+from webhook_server import run_webhook
+from bet_ingestion import start_ingestion_server
 from handlers import (
     start_handler, main_menu_handler, deposit_handler, withdraw_handler,
     referral_handler, gift_handler, admin_handler, transaction_handler,
@@ -28,23 +31,56 @@ class TelegramBot:
     """فئة البوت الرئيسية"""
     
     def __init__(self):
-        self.db = DatabaseManager()
+        self.db = get_async_database()
         self.application = None
+        self.bet_ingestion = None
         
     async def setup_bot(self):
         """إعداد البوت"""
         # إنشاء قاعدة البيانات
-        self.db.create_tables()
+        await self.db.create_tables()
         
         # إنشاء التطبيق
-        self.application = Application.builder().token(Config.BOT_TOKEN).build()
+        self.application = build_application()
         
         # إضافة المعالجات
         self.add_handlers()
         
+        # كتابة مساهمات الجاكبوت المتراكمة دورياً
+        self.application.job_queue.run_repeating(
+            self.flush_jackpot_contributions,
+            interval=Config.JACKPOT_FLUSH_INTERVAL,
+            name="flush_jackpot_contributions"
+        )
+        
+        # كتابة آخر نشاط المستخدمين المتراكم دورياً
+        self.application.job_queue.run_repeating(
+            self.flush_activity,
+            interval=Config.ACTIVITY_FLUSH_INTERVAL,
+            name="flush_activity"
+        )
+        
+        # webhook رهانات ichancy في نفس العملية، لتلغي التسويات نسخ المستخدمين من ذاكرتها
+        if Config.ICHANCY_CONFIG["webhook_secret"]:
+            self.bet_ingestion = await start_ingestion_server(self.db)
+        
         # إعداد أوامر البوت
         await self.setup_bot_commands()
         
+    async def flush_jackpot_contributions(self, context):
+        """كتابة مساهمات الجاكبوت المتراكمة في قاعدة البيانات"""
+        try:
+            await self.db.flush_jackpot_contributions()
+        except Exception as e:
+            logger.error(f"خطأ في كتابة مساهمات الجاكبوت: {e}")
+    
+    async def flush_activity(self, context):
+        """كتابة آخر نشاط المستخدمين المتراكم في قاعدة البيانات"""
+        try:
+            await self.db.flush_activity()
+        except Exception as e:
+            logger.error(f"خطأ في كتابة آخر نشاط المستخدمين: {e}")
+    
     async def setup_bot_commands(self):
         """إعداد أوامر البوت"""
         commands = [
@@ -56,7 +92,7 @@ class TelegramBot:
         ]
         
         try:
-            await self.application.bot.set_my_commands(commands)
+            await self.application.bot.set_my_commands(commands, rate_limit_args=TRANSACTIONAL_LANE)
             logger.info("تم إعداد أوامر البوت بنجاح")
         except TelegramError as e:
             logger.error(f"خطأ في إعداد أوامر البوت: {e}")
@@ -83,9 +119,9 @@ class TelegramBot:
         
     async def balance_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """أمر عرض الرصيد"""
-        user = self.db.get_user(update.effective_user.id)
+        user = await self.db.get_user(update.effective_user.id)
         if not user:
-            user = self.db.create_user(
+            user = await self.db.create_user(
                 telegram_id=update.effective_user.id,
                 username=update.effective_user.username,
                 first_name=update.effective_user.first_name,
@@ -153,12 +189,19 @@ class TelegramBot:
         try:
             await self.setup_bot()
             logger.info("تم بدء تشغيل البوت...")
-            await self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+            if Config.WEBHOOK_CONFIG["url"]:
+                await run_webhook(self.application, allowed_updates=Update.ALL_TYPES)
+            else:
+                await self.application.run_polling(allowed_updates=Update.ALL_TYPES)
         except Exception as e:
             logger.error(f"خطأ في تشغيل البوت: {e}")
         finally:
+            if self.bet_ingestion:
+                await self.bet_ingestion.cleanup()
             if self.application:
                 await self.application.shutdown()
+            await self.db.flush_activity()
+            await self.db.flush_jackpot_contributions()
 
 def main():
     """الدالة الرئيسية"""
@@ -0,0 +1,312 @@
+"""
+محرك الرسائل الجماعية - ichancy.com
+إرسال متوازٍ محدود المعدل مع احترام RetryAfter، وحفظ التقدم في جدول broadcasts
+لاستئناف الإرسال بعد إعادة التشغيل
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from telegram.error import TelegramError, RetryAfter, Forbidden, BadRequest, NetworkError
+
+from config import Config
+from database import get_async_database, Broadcast, User
+from keyboards import Keyboards
+from outbound import BULK_LANE, TRANSACTIONAL_LANE
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = ('completed', 'cancelled', 'failed')
+
+def _create_broadcast(session, admin_id, text, segment=None, total_recipients=None):
+    """إنشاء رسالة جماعية جديدة مع عدد مستلميها"""
+    broadcast = Broadcast(
+        admin_id=str(admin_id),
+        text=text,
+        segment=segment,
+        total_recipients=session.query(User).count() if total_recipients is None else total_recipients
+    )
+    session.add(broadcast)
+    session.commit()
+    return broadcast
+
+def _get_broadcast(session, broadcast_id):
+    return session.get(Broadcast, broadcast_id)
+
+def _get_interrupted_broadcasts(session):
+    """الرسائل الجماعية التي توقفت قبل اكتمالها (بإيقاف البوت أو انقطاعه)"""
+    return [broadcast_id for (broadcast_id,) in session.query(Broadcast.id).filter(
+        Broadcast.status.in_(('pending', 'running', 'paused'))
+    ).order_by(Broadcast.id)]
+
+def _get_recipients_page(session, after_user_id, limit):
+    """صفحة من (user_id, telegram_id) بعد معرف محدد بترتيب المعرف"""
+    return session.query(User.id, User.telegram_id).filter(
+        User.id > after_user_id
+    ).order_by(User.id).limit(limit).all()
+
+def _save_broadcast_progress(session, broadcast_id, **values):
+    """حفظ تقدم الرسالة الجماعية"""
+    session.query(Broadcast).filter(Broadcast.id == broadcast_id).update(values, synchronize_session=False)
+    session.commit()
+
+class TokenBucket:
+    """محدد معدل بدلو الرموز، مع إيقاف مؤقت مشترك عند RetryAfter"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """انتظار رمز واحد"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """إيقاف كل الإرسال مؤقتاً (مثلاً عند RetryAfter)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+class BroadcastEngine:
+    """محرك إرسال الرسائل الجماعية
+
+    الإرسال يمر بمسار الرسائل الجماعية في مجدول الرسائل الصادرة (outbound)،
+    فلا يؤخر الردود التفاعلية. يقرأ المستلمين على صفحات بترتيب المعرف (من فهرس المستلمين في الذاكرة إذا
+    كانت الرسالة لفئة محددة)، ويرسل عبر مجموعة عمال يشتركون في
+    دلو رموز واحد. يُحفظ في broadcasts آخر معرف اكتمل كل ما قبله، فيُستأنف
+    الإرسال منه بعد إعادة التشغيل، ويتم تعديل رسالة واحدة للإدمن بالتقدم.
+    """
+
+    def __init__(self, bot, db=None, config=None):
+        self.bot = bot
+        self.db = db or get_async_database()
+        self.config = config or Config.BROADCAST_CONFIG
+        self.bucket = TokenBucket(self.config["rate"])
+        self.tasks = {}
+        self._cancelled = set()
+
+    async def start(self, admin_chat_id, text, segment=None):
+        """إنشاء رسالة جماعية (لكل المستخدمين أو لفئة) وبدء إرسالها بالخلفية، وإرجاع معرفها"""
+        total_recipients = None
+        if segment:
+            # إعادة بناء الفهرس، فقد يتغير المستخدمون من عمليات معالجة أخرى
+            await self.db.load_recipient_index()
+            total_recipients = self.db.recipients.count(segment)
+        broadcast = await self.db.run(_create_broadcast, admin_chat_id, text, segment, total_recipients)
+        progress = await self.bot.send_message(
+            chat_id=admin_chat_id,
+            text=f"📢 جاري بدء الرسالة الجماعية #{broadcast.id} إلى {broadcast.total_recipients} مستخدم..."
+        )
+        await self.db.run(
+            _save_broadcast_progress, broadcast.id,
+            progress_chat_id=str(admin_chat_id), progress_message_id=progress.message_id
+        )
+        self._spawn(broadcast.id)
+        return broadcast.id
+
+    async def resume_interrupted(self):
+        """استئناف الرسائل الجماعية التي توقفت بسبب إعادة التشغيل"""
+        broadcast_ids = await self.db.run(_get_interrupted_broadcasts)
+        for broadcast_id in broadcast_ids:
+            if broadcast_id not in self.tasks:
+                logger.info(f"استئناف الرسالة الجماعية #{broadcast_id}")
+                self._spawn(broadcast_id)
+        return broadcast_ids
+
+    def cancel(self, broadcast_id):
+        """إيقاف رسالة جماعية جارية"""
+        self._cancelled.add(broadcast_id)
+
+    async def _ensure_index(self):
+        if not self.db.recipients.loaded:
+            await self.db.load_recipient_index()
+
+    async def _recipient_pages(self, segment, after_user_id):
+        """صفحات المستلمين [(user_id, telegram_id)] بعد after_user_id"""
+        if segment:
+            await self._ensure_index()
+            recipients = self.db.recipients.select(segment, after_user_id)
+            for start in range(0, len(recipients), self.config["page_size"]):
+                yield recipients[start:start + self.config["page_size"]]
+            return
+
+        while True:
+            page = await self.db.run(_get_recipients_page, after_user_id, self.config["page_size"])
+            if not page:
+                return
+            yield page
+            after_user_id = page[-1][0]
+
+    def _spawn(self, broadcast_id):
+        task = asyncio.create_task(self.run(broadcast_id))
+        self.tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(broadcast_id, None))
+        return task
+
+    async def _send(self, telegram_id, text):
+        """إرسال رسالة واحدة، وإرجاع sent أو blocked أو failed"""
+        for _ in range(self.config["max_retries"] + 1):
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=telegram_id, text=text, rate_limit_args=BULK_LANE)
+                return 'sent'
+            except RetryAfter as e:
+                # تجاوز حد تليجرام: إيقاف كل العمال ثم إعادة نفس الرسالة
+                logger.warning(f"RetryAfter {e.retry_after} ثانية أثناء الرسالة الجماعية")
+                self.bucket.pause(e.retry_after)
+            except Forbidden:
+                return 'blocked'  # المستخدم حظر البوت أو حذف حسابه
+            except BadRequest:
+                return 'failed'
+            except NetworkError:
+                # ربما وصلت الرسالة قبل انقطاع الاتصال، فلا يُعاد إرسالها
+                return 'failed'
+            except TelegramError:
+                return 'failed'
+        return 'failed'
+
+    async def run(self, broadcast_id):
+        """إرسال (أو استئناف) رسالة جماعية حتى اكتمالها، وإرجاع العدادات"""
+        broadcast = await self.db.run(_get_broadcast, broadcast_id)
+        if broadcast is None or broadcast.status in FINAL_STATUSES:
+            return None
+
+        await self.db.run(
+            _save_broadcast_progress, broadcast_id,
+            status='running', started_at=broadcast.started_at or datetime.utcnow()
+        )
+        text = f"📢 رسالة من الإدارة:\n\n{broadcast.text}"
+        counts = {'sent': broadcast.sent_count, 'failed': broadcast.failed_count, 'blocked': broadcast.blocked_count}
+        state = {'cursor': broadcast.last_user_id, 'started': time.monotonic(), 'started_done': sum(counts.values())}
+        dispatched = OrderedDict()  # user_id -> اكتمل؟ بترتيب الإرسال
+        queue = asyncio.Queue(maxsize=self.config["workers"] * 2)
+
+        def advance_cursor():
+            # تقديم المؤشر فقط عبر المستلمين الذين اكتمل كل ما قبلهم
+            while dispatched and next(iter(dispatched.values())):
+                state['cursor'], _ = dispatched.popitem(last=False)
+
+        async def save(status='running', final=False):
+            advance_cursor()
+            values = {
+                'last_user_id': state['cursor'], 'sent_count': counts['sent'],
+                'failed_count': counts['failed'], 'blocked_count': counts['blocked'], 'status': status
+            }
+            if final:
+                values['finished_at'] = datetime.utcnow()
+            await self.db.run(_save_broadcast_progress, broadcast_id, **values)
+            await self._report(broadcast, counts, state, status)
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                user_id, telegram_id = item
+                result = await self._send(telegram_id, text)
+                counts[result] += 1
+                dispatched[user_id] = True
+
+        async def reporter():
+            while True:
+                await asyncio.sleep(self.config["progress_interval"])
+                await save()
+
+        async def producer():
+            async for page in self._recipient_pages(broadcast.segment, state['cursor']):
+                for user_id, telegram_id in page:
+                    if broadcast_id in self._cancelled:
+                        break
+                    dispatched[user_id] = False
+                    await queue.put((user_id, telegram_id))
+                if broadcast_id in self._cancelled:
+                    break
+
+            for _ in workers:
+                await queue.put(None)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.config["workers"])]
+        tasks = workers + [asyncio.create_task(producer()), asyncio.create_task(reporter())]
+        status = 'failed'
+        try:
+            # الانتظار مع المنتج حتى لا يبقى معلقاً على الطابور إذا توقف العمال بخطأ
+            await asyncio.gather(*tasks[:-1])
+            status = 'cancelled' if broadcast_id in self._cancelled else 'completed'
+        except asyncio.CancelledError:
+            # إيقاف البوت: تُستأنف من المؤشر المحفوظ عند التشغيل التالي
+            status = 'paused'
+            raise
+        except Exception as e:
+            logger.error(f"خطأ في الرسالة الجماعية #{broadcast_id}: {str(e)}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._cancelled.discard(broadcast_id)
+            # حفظ المؤشر دائماً حتى لا يُعاد الإرسال لمن وصلتهم الرسالة
+            try:
+                await save(status, final=status in FINAL_STATUSES)
+            except Exception as e:
+                logger.error(f"خطأ في حفظ تقدم الرسالة الجماعية #{broadcast_id}: {str(e)}")
+
+        logger.info(f"انتهت الرسالة الجماعية #{broadcast_id} ({status}): {counts}")
+        return counts
+
+    async def _report(self, broadcast, counts, state, status):
+        """تعديل رسالة التقدم للإدمن"""
+        if not broadcast.progress_chat_id or not broadcast.progress_message_id:
+            return
+
+        done = sum(counts.values())
+        elapsed = max(time.monotonic() - state['started'], 0.001)
+        throughput = (done - state['started_done']) / elapsed
+        percent = done * 100 // broadcast.total_recipients if broadcast.total_recipients else 100
+        titles = {
+            'running': "📢 جاري الإرسال", 'completed': "📢 تم إرسال الرسالة الجماعية",
+            'cancelled': "⏹ تم إيقاف الرسالة الجماعية", 'paused': "⏸ توقف الإرسال مؤقتاً وسيُستأنف",
+            'failed': "⚠️ توقفت الرسالة الجماعية بسبب خطأ"
+        }
+        text = (
+            f"{titles.get(status, titles['running'])} #{broadcast.id}\n"
+            f"📊 التقدم: {done}/{broadcast.total_recipients} ({percent}%)\n"
+            f"✅ تم الإرسال: {counts['sent']}\n"
+            f"❌ فشل الإرسال: {counts['failed']}\n"
+            f"🚫 حظروا البوت: {counts['blocked']}\n"
+            f"⚡ السرعة: {throughput:.1f} رسالة/ث"
+        )
+        try:
+            await self.bot.edit_message_text(
+                text,
+                chat_id=broadcast.progress_chat_id,
+                message_id=broadcast.progress_message_id,
+                reply_markup=Keyboards.admin_panel() if status in FINAL_STATUSES else None,
+                rate_limit_args=TRANSACTIONAL_LANE
+            )
+        except TelegramError:
+            pass  # الرسالة لم تتغير أو حُذفت
+
+_engines = {}
+
+def get_broadcast_engine(bot):
+    """محرك الرسائل الجماعية المشترك لكل بوت"""
+    engine = _engines.get(id(bot))
+    if engine is None or engine.bot is not bot:
+        engine = _engines[id(bot)] = BroadcastEngine(bot)
+    return engine
@@ -0,0 +1,96 @@
+"""
+كتالوج ألعاب الكازينو والرهانات الرياضية - ichancy.com
+يُجلب دورياً من ichancy API إلى فهرس في الذاكرة حسب الفئة، وتُعرض صفحات
+القوائم منه دون طلب للمصدر مع كل ضغطة زر
+"""
+
+import logging
+from datetime import datetime
+from types import MappingProxyType
+
+from config import Config
+from ichancy_client import get_ichancy_client
+
+logger = logging.getLogger(__name__)
+
+# الفئة التي تُضاف إليها الرياضات غير المعرفة في Config.GAME_TYPES
+OTHER_SPORTS_CATEGORY = "other_sports"
+
+class CatalogSnapshot:
+    """نسخة ثابتة من الكتالوج: {(نوع اللعبة، الفئة): عناصر} ووقت الجلب"""
+
+    __slots__ = ("index", "fetched_at")
+
+    def __init__(self, index, fetched_at=None):
+        self.index = MappingProxyType({key: tuple(items) for key, items in index.items()})
+        self.fetched_at = fetched_at
+
+    def items(self, game_type, category):
+        return self.index.get((game_type, category), ())
+
+    def category_counts(self, game_type):
+        """عدد العناصر في كل فئة من فئات نوع اللعبة حسب ترتيب Config.GAME_TYPES"""
+        categories = Config.GAME_TYPES.get(game_type, {}).get("categories", {})
+        return {category: len(self.items(game_type, category)) for category in categories}
+
+def build_snapshot(games, odds):
+    """بناء نسخة جديدة من استجابات الألعاب والاحتمالات"""
+    index = {}
+    casino_categories = Config.GAME_TYPES["casino"]["categories"]
+    for game in games:
+        if game.get("category") in casino_categories:
+            index.setdefault(("casino", game["category"]), []).append(game)
+
+    sports_categories = Config.GAME_TYPES["sports"]["categories"]
+    for event in odds:
+        category = event.get("sport") if event.get("sport") in sports_categories else OTHER_SPORTS_CATEGORY
+        index.setdefault(("sports", category), []).append(event)
+
+    for key, items in index.items():
+        items.sort(key=lambda item: item.get("starts_at") or item.get("name") or "")
+
+    return CatalogSnapshot(index, datetime.now())
+
+class CatalogService:
+    """خدمة الكتالوج
+
+    refresh يبني نسخة كاملة جديدة ثم يستبدل المرجع بأمر إسناد واحد، فكل قارئ
+    يرى إما النسخة القديمة كاملة أو الجديدة كاملة. عند فشل الجلب تبقى النسخة
+    الحالية.
+    """
+
+    def __init__(self, client=None, page_size=None):
+        self.client = client
+        self.page_size = page_size or Config.CATALOG_CONFIG["page_size"]
+        self.snapshot = CatalogSnapshot({})
+
+    async def refresh(self):
+        """جلب الألعاب والاحتمالات واستبدال النسخة، وإرجاع True عند النجاح"""
+        client = self.client or get_ichancy_client()
+        try:
+            games = (await client.get_games()).get("games", [])
+            odds = (await client.get_odds()).get("events", [])
+        except Exception as e:
+            logger.warning(f"فشل تحديث الكتالوج، سيتم الإبقاء على النسخة الحالية: {str(e)}")
+            return False
+
+        self.snapshot = build_snapshot(games, odds)
+        logger.info(f"تم تحديث الكتالوج: {len(games)} لعبة، {len(odds)} حدث رياضي")
+        return True
+
+    def get_page(self, game_type, category, page=0, snapshot=None):
+        """صفحة من عناصر الفئة: (العناصر، رقم الصفحة، عدد الصفحات)"""
+        items = (snapshot or self.snapshot).items(game_type, category)
+        pages = max(1, -(-len(items) // self.page_size))
+        page = min(max(page, 0), pages - 1)
+        start = page * self.page_size
+        return items[start:start + self.page_size], page, pages
+
+_catalog = None
+
+def get_catalog_service():
+    """خدمة الكتالوج المشتركة للتطبيق"""
+    global _catalog
+    if _catalog is None:
+        _catalog = CatalogService()
+    return _catalog
@@ -3,6 +3,7 @@
 """
 
 import os
+from decimal import Decimal
 from typing import Dict, Any
 
 class Config:
@@ -15,8 +16,42 @@ class Config:
     # إعدادات قاعدة البيانات
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///telegram_bot.db")
     
+    # إعدادات مجمع اتصالات قاعدة البيانات (محرك واحد مشترك لكل العملية)
+    DATABASE_POOL_CONFIG = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),  # ثانية
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),  # ثانية
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    }
+    
+    # إعدادات أداء SQLite (تطبق عند فتح كل اتصال)
+    SQLITE_PRAGMAS = {
+        "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+        "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),  # ملي ثانية
+        "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),  # بايت
+        "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),  # سالب = كيلوبايت
+        "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+    } if os.getenv("SQLITE_TUNING_ENABLED", "true").lower() == "true" else {}
+    
+    # فترة كتابة آخر نشاط المستخدمين المتراكم (ثانية)
+    ACTIVITY_FLUSH_INTERVAL = int(os.getenv("ACTIVITY_FLUSH_INTERVAL", "60"))
+    
+    # فترة كتابة حالات المحادثة المتغيرة (ثانية)
+    USER_STATE_FLUSH_INTERVAL = int(os.getenv("USER_STATE_FLUSH_INTERVAL", "10"))
+    
+    # الذاكرة المؤقتة لبيانات المستخدمين (0 لتعطيلها)
+    USER_CACHE_CONFIG = {
+        "max_size": int(os.getenv("USER_CACHE_SIZE", "10000")),
+        "ttl": int(os.getenv("USER_CACHE_TTL", "30"))  # ثانية
+    }
+    
+    # عدد الخانات العشرية للعملة (المبالغ تُخزن كأعداد صحيحة بأصغر وحدة)
+    CURRENCY_DECIMALS = int(os.getenv("CURRENCY_DECIMALS", "2"))
+    
     # إعدادات الإحالات
-    REFERRAL_PERCENTAGE = float(os.getenv("REFERRAL_PERCENTAGE", "10"))  # نسبة الربح من الإحالات
+    REFERRAL_PERCENTAGE = Decimal(os.getenv("REFERRAL_PERCENTAGE", "10"))  # نسبة الربح من الإحالات
     
     # إعدادات الدفع
     PAYMENT_METHODS = {
@@ -41,11 +76,11 @@ class Config:
     }
     
     # الحد الأدنى والأقصى للمعاملات
-    MIN_DEPOSIT = float(os.getenv("MIN_DEPOSIT", "10"))
-    MAX_DEPOSIT = float(os.getenv("MAX_DEPOSIT", "10000"))
-    MIN_WITHDRAWAL = float(os.getenv("MIN_WITHDRAWAL", "20"))
-    MAX_WITHDRAWAL = float(os.getenv("MAX_WITHDRAWAL", "5000"))
-    MIN_GIFT = float(os.getenv("MIN_GIFT", "5"))
+    MIN_DEPOSIT = Decimal(os.getenv("MIN_DEPOSIT", "10"))
+    MAX_DEPOSIT = Decimal(os.getenv("MAX_DEPOSIT", "10000"))
+    MIN_WITHDRAWAL = Decimal(os.getenv("MIN_WITHDRAWAL", "20"))
+    MAX_WITHDRAWAL = Decimal(os.getenv("MAX_WITHDRAWAL", "5000"))
+    MIN_GIFT = Decimal(os.getenv("MIN_GIFT", "5"))
     
     # رسائل البوت
     MESSAGES = {
@@ -119,13 +154,89 @@ class Config:
                 "callback": f"payment_{method_id}"
             })
         return buttons
+    
+    @classmethod
+    def get_jackpot_pools(cls):
+        """مجموعات الجاكبوت المفعلة {المعرف: التعريف}"""
+        return {
+            pool_id: cls.JACKPOT_POOL_DEFINITIONS[pool_id]
+            for pool_id in cls.ENABLED_JACKPOT_POOLS
+            if pool_id in cls.JACKPOT_POOL_DEFINITIONS
+        }
+    
+    @classmethod
+    def get_matching_jackpot_pools(cls, game_type=None):
+        """مجموعات الجاكبوت المفعلة التي يساهم فيها رهان من نوع اللعبة المحدد"""
+        return {
+            pool_id: pool for pool_id, pool in cls.get_jackpot_pools().items()
+            if pool["game_type"] is None or pool["game_type"] == game_type
+        }
+    
+    @classmethod
+    def get_broadcast_segments(cls):
+        """فئات الرسائل الجماعية {الفئة: الاسم} (انظر database.RecipientIndex)"""
+        segments = {
+            "all": "👥 جميع المستخدمين",
+            "depositors": "💳 المودعون",
+            "never_deposited": "🆕 لم يودعوا أبداً",
+            "referrers": "🤝 أصحاب الإحالات"
+        }
+        for days in cls.BROADCAST_CONFIG["active_days"]:
+            segments[f"active:{days}"] = f"🟢 نشط خلال {days} يوم"
+        for level_id, level_info in cls.VIP_LEVELS.items():
+            segments[f"vip:{level_id}"] = f"VIP {level_info['name']}"
+        return segments
 
 
     
     # إعدادات الجاكبوت والألعاب
-    MIN_JACKPOT = float(os.getenv("MIN_JACKPOT", "1000"))  # الحد الأدنى لسحب الجاكبوت
-    JACKPOT_CONTRIBUTION_RATE = float(os.getenv("JACKPOT_CONTRIBUTION_RATE", "0.01"))  # 1% من كل رهان
+    MIN_JACKPOT = Decimal(os.getenv("MIN_JACKPOT", "1000"))  # الحد الأدنى لسحب الجاكبوت
+    JACKPOT_CONTRIBUTION_RATE = Decimal(os.getenv("JACKPOT_CONTRIBUTION_RATE", "0.01"))  # 1% من كل رهان
     JACKPOT_DRAW_TIME = os.getenv("JACKPOT_DRAW_TIME", "23:59")  # وقت سحب الجاكبوت اليومي
+    JACKPOT_FLUSH_INTERVAL = int(os.getenv("JACKPOT_FLUSH_INTERVAL", "5"))  # ثواني بين كتابة دفعات المساهمات
+    JACKPOT_BATCH_SIZE = int(os.getenv("JACKPOT_BATCH_SIZE", "500"))  # كتابة الدفعة فوراً عند بلوغ هذا العدد
+    
+    # مجموعات الجاكبوت المتاحة
+    # cadence: hourly أو daily أو weekly | game_type: نوع اللعبة أو None لكل الألعاب
+    # draw_time بصيغة HH:MM (الساعي يستخدم الدقائق فقط) | draw_day لليوم الأسبوعي (0 = الأحد)
+    JACKPOT_POOL_DEFINITIONS = {
+        "hourly": {
+            "name": "الجاكبوت الساعي",
+            "cadence": "hourly",
+            "contribution_rate": Decimal(os.getenv("HOURLY_JACKPOT_RATE", "0.002")),
+            "game_type": None,
+            "draw_time": "00:59",
+            "min_amount": Decimal(os.getenv("HOURLY_MIN_JACKPOT", "100"))
+        },
+        "daily": {
+            "name": "الجاكبوت اليومي",
+            "cadence": "daily",
+            "contribution_rate": JACKPOT_CONTRIBUTION_RATE,
+            "game_type": None,
+            "draw_time": JACKPOT_DRAW_TIME,
+            "min_amount": MIN_JACKPOT
+        },
+        "weekly": {
+            "name": "الجاكبوت الأسبوعي",
+            "cadence": "weekly",
+            "contribution_rate": Decimal(os.getenv("WEEKLY_JACKPOT_RATE", "0.005")),
+            "game_type": None,
+            "draw_time": "21:00",
+            "draw_day": 5,  # الجمعة
+            "min_amount": Decimal(os.getenv("WEEKLY_MIN_JACKPOT", "5000"))
+        },
+        "casino_daily": {
+            "name": "جاكبوت الكازينو اليومي",
+            "cadence": "daily",
+            "contribution_rate": Decimal(os.getenv("CASINO_JACKPOT_RATE", "0.003")),
+            "game_type": "casino",
+            "draw_time": "22:00",
+            "min_amount": Decimal(os.getenv("CASINO_MIN_JACKPOT", "500"))
+        }
+    }
+    
+    # المجموعات المفعلة مفصولة بفواصل
+    ENABLED_JACKPOT_POOLS = [pool_id.strip() for pool_id in os.getenv("JACKPOT_POOLS", "daily").split(",") if pool_id.strip()]
     
     # إعدادات ichancy.com
     ICHANCY_CONFIG = {
@@ -136,6 +247,111 @@ class Config:
         "webhook_secret": os.getenv("ICHANCY_WEBHOOK_SECRET", "")
     }
     
+    # عميل ichancy API: مجمع اتصالات دائمة، مهلات لكل نقطة، إعادة محاولة وقاطع دائرة
+    ICHANCY_CLIENT_CONFIG = {
+        "max_connections": int(os.getenv("ICHANCY_MAX_CONNECTIONS", "20")),
+        "max_keepalive_connections": int(os.getenv("ICHANCY_MAX_KEEPALIVE", "10")),
+        "keepalive_expiry": 30,  # ثانية
+        "timeouts": {  # ثانية لكل نقطة
+            "default": 10,
+            "games": 15,
+            "odds": 5,
+            "balance": 5
+        },
+        "retries": int(os.getenv("ICHANCY_RETRIES", "3")),
+        "backoff_base": 0.2,  # ثانية، تتضاعف مع كل محاولة مع تشويش عشوائي
+        "backoff_max": 2.0,
+        "breaker_threshold": 5,  # إخفاقات متتالية قبل فتح الدائرة
+        "breaker_reset_timeout": 30,  # ثانية قبل تجربة طلب واحد من جديد
+        "cache_ttl": {"games": 300, "odds": 15},  # مدة صلاحية الاستجابة
+        "cache_stale_ttl": {"games": 3600, "odds": 60}  # مدة تقديم القيمة القديمة أثناء التحديث بالخلفية
+    }
+    
+    # كتالوج الألعاب والرهانات الرياضية
+    CATALOG_CONFIG = {
+        "refresh_interval": int(os.getenv("CATALOG_REFRESH_INTERVAL", "300")),  # ثانية
+        "page_size": int(os.getenv("CATALOG_PAGE_SIZE", "8"))
+    }
+    
+    # عدد التحديثات التي تُعالج بالتوازي (تحديثات المستخدم الواحد تبقى متسلسلة)
+    UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "64"))
+    
+    # وضع webhook (إذا لم يُعين WEBHOOK_URL يعمل البوت بوضع polling)
+    WEBHOOK_CONFIG = {
+        "url": os.getenv("WEBHOOK_URL", ""),  # العنوان العام، مثلاً https://bot.example.com
+        "listen": os.getenv("WEBHOOK_LISTEN", "0.0.0.0"),
+        "port": int(os.getenv("WEBHOOK_PORT", "8443")),
+        "path": os.getenv("WEBHOOK_PATH", "/telegram"),
+        "secret_token": os.getenv("WEBHOOK_SECRET", ""),  # إذا كان فارغاً يُشتق من BOT_TOKEN (نفسه في كل النسخ)
+        "max_pending": 1000,  # بعدها يُرد بـ 503 ليعيد تليجرام الإرسال
+        "max_connections": 40,  # اتصالات تليجرام المتزامنة بالخادم
+        "workers": int(os.getenv("WORKER_PROCESSES", "1")),  # أكثر من 1: توزيع المستخدمين على عمليات منفصلة
+        "dedupe_size": 10000,
+        "latency_samples": 1000
+    }
+    
+    # وضع عدة عمليات معالجة: كل عملية لها ذاكرتها، فلا تُخزن نسخ المستخدمين
+    # (تعديلات العمليات الأخرى لا تلغيها) وتُكتب مساهمات الجاكبوت فوراً
+    SHARDED = bool(WEBHOOK_CONFIG["url"]) and WEBHOOK_CONFIG["workers"] > 1
+    if SHARDED:
+        USER_CACHE_CONFIG = dict(USER_CACHE_CONFIG, max_size=0)
+        JACKPOT_BATCH_SIZE = 1
+    
+    # مجدول الرسائل الصادرة (حدود تليجرام: ~30 رسالة/ث عامة، ~1/ث لكل محادثة، 20/دقيقة للمجموعة)
+    OUTBOUND_CONFIG = {
+        "rate": float(os.getenv("OUTBOUND_RATE", "30")),
+        "burst": 30,
+        "per_chat_rate": 1.0,
+        "per_chat_burst": 3,
+        "group_rate": 20 / 60,
+        "max_retries": 3,  # إعادة الطلب بعد RetryAfter
+        "wait_samples": 1000  # عدد أزمنة الانتظار المحفوظة لكل مسار
+    }
+    
+    # مجمعات اتصالات HTTP لطلبات البوت حسب المسار (وسائط HTTPXRequest)
+    TELEGRAM_POOLS = {
+        "interactive": {
+            "connection_pool_size": int(os.getenv("TELEGRAM_INTERACTIVE_POOL", "16")),
+            "connect_timeout": 5.0, "read_timeout": 10.0, "write_timeout": 10.0, "pool_timeout": 2.0
+        },
+        "transactional": {
+            "connection_pool_size": int(os.getenv("TELEGRAM_TRANSACTIONAL_POOL", "8")),
+            "connect_timeout": 5.0, "read_timeout": 15.0, "write_timeout": 15.0, "pool_timeout": 10.0
+        },
+        "bulk": {
+            "connection_pool_size": int(os.getenv("TELEGRAM_BULK_POOL", "8")),
+            "connect_timeout": 10.0, "read_timeout": 30.0, "write_timeout": 30.0, "pool_timeout": 30.0
+        }
+    }
+    
+    # الرسائل الجماعية
+    BROADCAST_CONFIG = {
+        "rate": float(os.getenv("BROADCAST_RATE", "25")),  # رسالة/ثانية (حد تليجرام ~30)
+        "workers": int(os.getenv("BROADCAST_WORKERS", "20")),
+        "page_size": 1000,  # عدد المستلمين في كل استعلام
+        "progress_interval": 3,  # ثواني بين حفظ التقدم وتحديث رسالة الإدمن
+        "max_retries": 3,  # إعادة الرسالة بعد RetryAfter فقط (خطأ الشبكة قد يعني أنها وصلت)
+        "active_days": (1, 7, 30)  # خيارات فئة "نشط خلال N يوم"
+    }
+    
+    # حد تليجرام العام للبوت كله، فيأخذ كل عامل حصته منه
+    if SHARDED:
+        OUTBOUND_CONFIG = dict(
+            OUTBOUND_CONFIG,
+            rate=OUTBOUND_CONFIG["rate"] / WEBHOOK_CONFIG["workers"],
+            burst=max(1, OUTBOUND_CONFIG["burst"] // WEBHOOK_CONFIG["workers"])
+        )
+        BROADCAST_CONFIG = dict(BROADCAST_CONFIG, rate=BROADCAST_CONFIG["rate"] / WEBHOOK_CONFIG["workers"])
+    
+    # إدخال رهانات ichancy (webhook أو ملف JSONL)
+    BET_INGESTION_CONFIG = {
+        "batch_size": int(os.getenv("BET_INGESTION_BATCH_SIZE", "500")),
+        "recent_ids_size": int(os.getenv("BET_INGESTION_RECENT_IDS", "100000")),  # معرفات الأحداث المعالجة مؤخراً في الذاكرة
+        "webhook_host": os.getenv("BET_WEBHOOK_HOST", "0.0.0.0"),
+        "webhook_port": int(os.getenv("BET_WEBHOOK_PORT", "8081")),
+        "webhook_path": os.getenv("BET_WEBHOOK_PATH", "/ichancy/bets")
+    }
+    
     # معلومات الدعم الفني
     SUPPORT_INFO = {
         "phone": os.getenv("SUPPORT_PHONE", "+963912345678"),
@@ -8,13 +8,41 @@ from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.error import TelegramError
 
-from database import DatabaseManager, User, Message
+from database import get_async_database, User, Message
 from config import Config
 from keyboards import Keyboards
+from outbound import TRANSACTIONAL_LANE
 from utils import get_user_display_name
 
 logger = logging.getLogger(__name__)
-db = DatabaseManager()
+db = get_async_database()
+
+def _save_message(session, user_id, message_type, content, admin_id=None):
+    """حفظ رسالة بين المستخدم والإدارة"""
+    message_record = Message(
+        user_id=user_id,
+        message_type=message_type,
+        content=content,
+        is_read=False,
+        admin_id=admin_id
+    )
+    session.add(message_record)
+    session.commit()
+
+def _get_unread_messages(session, limit=10):
+    """الرسائل غير المقروءة مع أصحابها"""
+    return session.query(Message, User).join(User, User.id == Message.user_id).filter(
+        Message.message_type == 'user_to_admin',
+        Message.is_read == False
+    ).order_by(Message.created_at.desc()).limit(limit).all()
+
+def _mark_messages_read(session):
+    """تمييز رسائل المستخدمين كمقروءة"""
+    session.query(Message).filter(
+        Message.message_type == 'user_to_admin',
+        Message.is_read == False
+    ).update({'is_read': True})
+    session.commit()
 
 class ContactHandler:
     """فئة معالج نظام التواصل"""
@@ -173,23 +201,14 @@ class ContactHandler:
     @staticmethod
     async def handle_admin_message_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """معالجة رسالة المستخدم للإدمن"""
-        user = db.get_user(update.effective_user.id)
+        user = await db.get_user(update.effective_user.id)
         message_text = update.message.text
         
         # حفظ الرسالة في قاعدة البيانات
-        session = db.get_session()
-        try:
-            message_record = Message(
-                user_id=user.id,
-                message_type='user_to_admin',
-                content=message_text,
-                is_read=False
-            )
-            session.add(message_record)
-            session.commit()
-            
-            # إرسال الرسالة للإدمن
-            admin_message = f"""
+        await db.run(_save_message, user.id, 'user_to_admin', message_text)
+        
+        # إرسال الرسالة للإدمن
+        admin_message = f"""
 📩 رسالة جديدة من مستخدم
 
 👤 المرسل: {get_user_display_name(user)}
@@ -201,26 +220,24 @@ class ContactHandler:
 
 🔗 للرد على المستخدم، استخدم الأمر:
 /reply {user.telegram_id} رسالتك هنا
-            """
-            
-            # إرسال للإدمن الأول
-            if Config.ADMIN_IDS:
-                try:
-                    await context.bot.send_message(
-                        chat_id=Config.ADMIN_IDS[0],
-                        text=admin_message
-                    )
-                except TelegramError:
-                    logger.error(f"فشل إرسال الرسالة للإدمن {Config.ADMIN_IDS[0]}")
-            
-            # تأكيد للمستخدم
-            await update.message.reply_text(
-                "✅ تم إرسال رسالتك بنجاح!\n📩 سيتم الرد عليك في أقرب وقت ممكن.",
-                reply_markup=Keyboards.main_menu()
-            )
-            
-        finally:
-            session.close()
+        """
+        
+        # إرسال للإدمن الأول
+        if Config.ADMIN_IDS:
+            try:
+                await context.bot.send_message(
+                    chat_id=Config.ADMIN_IDS[0],
+                    text=admin_message,
+                    rate_limit_args=TRANSACTIONAL_LANE
+                )
+            except TelegramError:
+                logger.error(f"فشل إرسال الرسالة للإدمن {Config.ADMIN_IDS[0]}")
+        
+        # تأكيد للمستخدم
+        await update.message.reply_text(
+            "✅ تم إرسال رسالتك بنجاح!\n📩 سيتم الرد عليك في أقرب وقت ممكن.",
+            reply_markup=Keyboards.main_menu()
+        )
         
         # مسح حالة المحادثة
         context.user_data.pop('contact_state', None)
@@ -244,45 +261,33 @@ class ContactHandler:
             reply_message = command_parts[2]
             
             # البحث عن المستخدم
-            session = db.get_session()
-            try:
-                user = session.query(User).filter(User.telegram_id == user_id).first()
-                if not user:
-                    await update.message.reply_text("❌ المستخدم غير موجود")
-                    return
-                
-                # حفظ رد الإدمن
-                message_record = Message(
-                    user_id=user.id,
-                    message_type='admin_to_user',
-                    content=reply_message,
-                    is_read=False,
-                    admin_id=update.effective_user.id
-                )
-                session.add(message_record)
-                session.commit()
-                
-                # إرسال الرد للمستخدم
-                user_message = f"""
+            user = await db.find_user(str(user_id))
+            if not user:
+                await update.message.reply_text("❌ المستخدم غير موجود")
+                return
+            
+            # حفظ رد الإدمن
+            await db.run(_save_message, user.id, 'admin_to_user', reply_message, update.effective_user.id)
+            
+            # إرسال الرد للمستخدم
+            user_message = f"""
 📧 رد من الإدارة
 
 {reply_message}
 
 📅 {datetime.now().strftime('%Y-%m-%d %H:%M')}
-                """
-                
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text=user_message,
-                    reply_markup=Keyboards.main_menu()
-                )
-                
-                await update.message.reply_text(
-                    f"✅ تم إرسال الرد إلى {get_user_display_name(user)} بنجاح"
-                )
-                
-            finally:
-                session.close()
+            """
+            
+            await context.bot.send_message(
+                chat_id=user_id,
+                text=user_message,
+                reply_markup=Keyboards.main_menu(),
+                rate_limit_args=TRANSACTIONAL_LANE
+            )
+            
+            await update.message.reply_text(
+                f"✅ تم إرسال الرد إلى {get_user_display_name(user)} بنجاح"
+            )
                 
         except (ValueError, IndexError):
             await update.message.reply_text(
@@ -297,29 +302,20 @@ class ContactHandler:
         if update.effective_user.id not in Config.ADMIN_IDS:
             return
         
-        session = db.get_session()
-        try:
-            # الرسائل غير المقروءة
-            unread_messages = session.query(Message).filter(
-                Message.message_type == 'user_to_admin',
-                Message.is_read == False
-            ).order_by(Message.created_at.desc()).limit(10).all()
-            
-            if not unread_messages:
-                message = "✅ لا توجد رسائل جديدة"
-            else:
-                message = "📩 الرسائل الجديدة:\n\n"
-                for i, msg in enumerate(unread_messages, 1):
-                    user = session.query(User).filter(User.id == msg.user_id).first()
-                    message += f"{i}. من: {get_user_display_name(user)}\n"
-                    message += f"📅 {msg.created_at.strftime('%Y-%m-%d %H:%M')}\n"
-                    message += f"💬 {msg.content[:100]}{'...' if len(msg.content) > 100 else ''}\n"
-                    message += f"🔗 /reply {user.telegram_id} رسالتك\n\n"
-            
-            await update.message.reply_text(message)
-            
-        finally:
-            session.close()
+        # الرسائل غير المقروءة
+        unread_messages = await db.run(_get_unread_messages)
+        
+        if not unread_messages:
+            message = "✅ لا توجد رسائل جديدة"
+        else:
+            message = "📩 الرسائل الجديدة:\n\n"
+            for i, (msg, user) in enumerate(unread_messages, 1):
+                message += f"{i}. من: {get_user_display_name(user)}\n"
+                message += f"📅 {msg.created_at.strftime('%Y-%m-%d %H:%M')}\n"
+                message += f"💬 {msg.content[:100]}{'...' if len(msg.content) > 100 else ''}\n"
+                message += f"🔗 /reply {user.telegram_id} رسالتك\n\n"
+        
+        await update.message.reply_text(message)
     
     @staticmethod
     async def mark_messages_read(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -327,16 +323,6 @@ class ContactHandler:
         if update.effective_user.id not in Config.ADMIN_IDS:
             return
         
-        session = db.get_session()
-        try:
-            session.query(Message).filter(
-                Message.message_type == 'user_to_admin',
-                Message.is_read == False
-            ).update({'is_read': True})
-            session.commit()
-            
-            await update.message.reply_text("✅ تم تمييز جميع الرسائل كمقروءة")
-            
-        finally:
-            session.close()
-
+        await db.run(_mark_messages_read)
+        
+        await update.message.reply_text("✅ تم تمييز جميع الرسائل كمقروءة")
@@ -2,15 +2,59 @@
 قاعدة البيانات المحدثة للبوت التليجرام - ichancy.com
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, func
+from sqlalchemy import event, create_engine, bindparam, literal, select, case, and_, or_, Index, Column, Integer, BigInteger, String, Float, DateTime, Boolean, Text, ForeignKey, func
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
+from sqlalchemy.orm import Session, sessionmaker, relationship
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, StaticPool
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+import itertools
+import random
+import re
+import threading
+import time
 import uuid
 import os
 
+from config import Config
+
 Base = declarative_base()
 
+# المبالغ تُخزن كأعداد صحيحة بأصغر وحدة للعملة (مثلاً 12.50 = 1250)
+MONEY_QUANTUM = Decimal(1).scaleb(-Config.CURRENCY_DECIMALS)
+MINOR_UNITS_PER_UNIT = 10 ** Config.CURRENCY_DECIMALS
+
+def to_money(value):
+    """تحويل رقم إلى Decimal مقرب لأصغر وحدة للعملة"""
+    if isinstance(value, float):
+        value = repr(value)  # تجنب تمثيل float الثنائي (0.1 -> 0.1000000000000000055)
+    return Decimal(value).quantize(MONEY_QUANTUM, rounding=ROUND_HALF_UP)
+
+class Money(TypeDecorator):
+    """نوع عمود للمبالغ: عدد صحيح 64 بت بأصغر وحدة، ويُقرأ كـ Decimal"""
+    impl = BigInteger
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int(to_money(value) * MINOR_UNITS_PER_UNIT)
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        # AVG أو أعمدة لم يتم ترحيلها في SQLite قد تُرجع float
+        minor_units = Decimal(value).quantize(Decimal(1), rounding=ROUND_HALF_UP)
+        return (minor_units / MINOR_UNITS_PER_UNIT).quantize(MONEY_QUANTUM)
+
 class User(Base):
     """جدول المستخدمين"""
     __tablename__ = 'users'
@@ -20,24 +64,32 @@ class User(Base):
     username = Column(String(100))
     first_name = Column(String(100))
     last_name = Column(String(100))
-    balance = Column(Float, default=0.0)
+    balance = Column(Money, default=0)
     referral_code = Column(String(20), unique=True)
     referred_by = Column(String(20))
     referral_count = Column(Integer, default=0)
-    referral_earnings = Column(Float, default=0.0)
-    total_bets = Column(Float, default=0.0)
-    total_wins = Column(Float, default=0.0)
+    referral_earnings = Column(Money, default=0)
+    total_bets = Column(Money, default=0)
+    total_wins = Column(Money, default=0)
     vip_level = Column(String(20), default='beginner')
     is_admin = Column(Boolean, default=False)
     is_banned = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     last_activity = Column(DateTime, default=datetime.utcnow)
     
+    # الفهارس
+    __table_args__ = (
+        Index('ix_users_username', 'username'),
+        Index('ix_users_referred_by', 'referred_by'),
+        Index('ix_users_last_activity', 'last_activity'),
+    )
+    
     # العلاقات
     transactions = relationship("Transaction", back_populates="user")
     sent_gifts = relationship("Gift", foreign_keys="Gift.sender_id", back_populates="sender")
     received_gifts = relationship("Gift", foreign_keys="Gift.receiver_id", back_populates="receiver")
     bets = relationship("Bet", back_populates="user")
+    betting_stats = relationship("UserBettingStats", uselist=False, back_populates="user")
     jackpot_entries = relationship("JackpotEntry", back_populates="user")
     jackpot_wins = relationship("JackpotWin", back_populates="user")
 
@@ -48,7 +100,7 @@ class Transaction(Base):
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     transaction_type = Column(String(30), nullable=False)  # deposit, withdraw, referral, gift, bet_win, bet_loss, jackpot_win, jackpot_contribution
-    amount = Column(Float, nullable=False)
+    amount = Column(Money, nullable=False)
     method = Column(String(50))  # syriatel_cash, bank, usdt
     status = Column(String(20), default='pending')  # pending, completed, failed, cancelled
     description = Column(Text)
@@ -57,6 +109,14 @@ class Transaction(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     processed_at = Column(DateTime)
     
+    # الفهارس
+    __table_args__ = (
+        Index('ix_transactions_user_type_status_created', 'user_id', 'transaction_type', 'status', 'created_at'),
+        Index('ix_transactions_type_status_created', 'transaction_type', 'status', 'created_at'),
+        Index('ix_transactions_status_created', 'status', 'created_at'),
+        Index('ix_transactions_created_at', 'created_at'),
+    )
+    
     # العلاقات
     user = relationship("User", back_populates="transactions")
 
@@ -67,7 +127,7 @@ class Gift(Base):
     id = Column(Integer, primary_key=True)
     sender_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     receiver_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    amount = Column(Float, nullable=False)
+    amount = Column(Money, nullable=False)
     message = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
     
@@ -81,7 +141,7 @@ class GiftCode(Base):
     
     id = Column(Integer, primary_key=True)
     code = Column(String(50), unique=True, nullable=False)
-    amount = Column(Float, nullable=False)
+    amount = Column(Money, nullable=False)
     max_uses = Column(Integer, default=1)
     current_uses = Column(Integer, default=0)
     is_active = Column(Boolean, default=True)
@@ -97,6 +157,11 @@ class GiftCodeUsage(Base):
     code_id = Column(Integer, ForeignKey('gift_codes.id'), nullable=False)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     used_at = Column(DateTime, default=datetime.utcnow)
+    
+    # الفهارس (استخدام واحد لكل مستخدم حتى مع الطلبات المتزامنة)
+    __table_args__ = (
+        Index('ux_gift_code_usage_code_user', 'code_id', 'user_id', unique=True),
+    )
 
 class Bet(Base):
     """جدول الرهانات"""
@@ -107,9 +172,9 @@ class Bet(Base):
     game_type = Column(String(50), nullable=False)  # casino, sports
     game_category = Column(String(50))  # slots, football, etc.
     game_name = Column(String(100))
-    bet_amount = Column(Float, nullable=False)
-    potential_win = Column(Float)
-    actual_win = Column(Float, default=0.0)
+    bet_amount = Column(Money, nullable=False)
+    potential_win = Column(Money)
+    actual_win = Column(Money, default=0)
     odds = Column(Float)
     status = Column(String(20), default='pending')  # pending, won, lost, cancelled
     bet_details = Column(Text)  # JSON string with bet details
@@ -117,9 +182,32 @@ class Bet(Base):
     placed_at = Column(DateTime, default=datetime.utcnow)
     settled_at = Column(DateTime)
     
+    # الفهارس
+    __table_args__ = (
+        Index('ix_bets_user_status', 'user_id', 'status'),
+        Index('ix_bets_user_placed', 'user_id', 'placed_at'),
+        Index('ux_bets_ichancy_bet_id', 'ichancy_bet_id', unique=True),
+    )
+    
     # العلاقات
     user = relationship("User", back_populates="bets")
 
+class UserBettingStats(Base):
+    """جدول إحصائيات الرهانات لكل مستخدم (يُحدث تدريجياً مع كل رهان)"""
+    __tablename__ = 'user_betting_stats'
+    
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    bets_count = Column(Integer, default=0, nullable=False)
+    total_bets = Column(Money, default=0, nullable=False)  # مجموع مبالغ جميع الرهانات
+    won_count = Column(Integer, default=0, nullable=False)
+    lost_count = Column(Integer, default=0, nullable=False)
+    total_wins = Column(Money, default=0, nullable=False)  # مجموع أرباح الرهانات الفائزة
+    biggest_win = Column(Money, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # العلاقات
+    user = relationship("User", back_populates="betting_stats")
+
 class JackpotEntry(Base):
     """جدول مشاركات الجاكبوت"""
     __tablename__ = 'jackpot_entries'
@@ -127,10 +215,16 @@ class JackpotEntry(Base):
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     bet_id = Column(Integer, ForeignKey('bets.id'))
-    contribution_amount = Column(Float, nullable=False)
+    contribution_amount = Column(Money, nullable=False)
     jackpot_pool_id = Column(String(50))  # معرف مجموعة الجاكبوت
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    # الفهارس
+    __table_args__ = (
+        Index('ix_jackpot_entries_pool_created', 'jackpot_pool_id', 'created_at'),
+        Index('ix_jackpot_entries_pool_id', 'jackpot_pool_id', 'id'),
+    )
+    
     # العلاقات
     user = relationship("User", back_populates="jackpot_entries")
     bet = relationship("Bet")
@@ -142,14 +236,25 @@ class JackpotWin(Base):
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     jackpot_pool_id = Column(String(50), nullable=False)
-    win_amount = Column(Float, nullable=False)
-    total_pool = Column(Float, nullable=False)
+    win_amount = Column(Money, nullable=False)
+    total_pool = Column(Money, nullable=False)
     participants_count = Column(Integer, default=0)
     win_date = Column(DateTime, default=datetime.utcnow)
     
     # العلاقات
     user = relationship("User", back_populates="jackpot_wins")
 
+class JackpotPool(Base):
+    """جدول الإجمالي الجاري لكل مجموعة جاكبوت"""
+    __tablename__ = 'jackpot_pools'
+    
+    pool_id = Column(String(50), primary_key=True)
+    current_amount = Column(Money, default=0, nullable=False)  # المبلغ المتراكم منذ آخر سحب
+    contributions_count = Column(Integer, default=0, nullable=False)
+    drawn_through_entry_id = Column(Integer, default=0, nullable=False)  # آخر مشاركة دخلت في سحب سابق
+    last_drawn_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class GameSession(Base):
     """جدول جلسات الألعاب"""
     __tablename__ = 'game_sessions'
@@ -158,10 +263,10 @@ class GameSession(Base):
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     session_id = Column(String(100), unique=True)
     game_type = Column(String(50), nullable=False)
-    start_balance = Column(Float, nullable=False)
-    end_balance = Column(Float)
-    total_bets = Column(Float, default=0.0)
-    total_wins = Column(Float, default=0.0)
+    start_balance = Column(Money, nullable=False)
+    end_balance = Column(Money)
+    total_bets = Column(Money, default=0)
+    total_wins = Column(Money, default=0)
     session_duration = Column(Integer)  # بالثواني
     started_at = Column(DateTime, default=datetime.utcnow)
     ended_at = Column(DateTime)
@@ -177,10 +282,10 @@ class Promotion(Base):
     title = Column(String(200), nullable=False)
     description = Column(Text)
     promo_type = Column(String(50), nullable=False)  # welcome, deposit, cashback, etc.
-    bonus_amount = Column(Float)
+    bonus_amount = Column(Money)
     bonus_percentage = Column(Float)
-    min_deposit = Column(Float)
-    max_bonus = Column(Float)
+    min_deposit = Column(Money)
+    max_bonus = Column(Money)
     wagering_requirement = Column(Float)
     is_active = Column(Boolean, default=True)
     valid_from = Column(DateTime, default=datetime.utcnow)
@@ -194,9 +299,9 @@ class UserPromotion(Base):
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     promotion_id = Column(Integer, ForeignKey('promotions.id'), nullable=False)
-    bonus_amount = Column(Float, nullable=False)
-    wagering_completed = Column(Float, default=0.0)
-    wagering_required = Column(Float, nullable=False)
+    bonus_amount = Column(Money, nullable=False)
+    wagering_completed = Column(Money, default=0)
+    wagering_required = Column(Money, nullable=False)
     status = Column(String(20), default='active')  # active, completed, expired
     claimed_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime)
@@ -217,6 +322,11 @@ class Message(Base):
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    # الفهارس
+    __table_args__ = (
+        Index('ix_messages_type_read_created', 'message_type', 'is_read', 'created_at'),
+    )
+    
     # العلاقات
     user = relationship("User", foreign_keys=[user_id])
     admin = relationship("User", foreign_keys=[admin_id])
@@ -233,294 +343,1842 @@ class SystemLog(Base):
     ip_address = Column(String(50))
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    # الفهارس
+    __table_args__ = (
+        Index('ix_system_logs_created_at', 'created_at'),
+    )
+    
     # العلاقات
     user = relationship("User")
 
+class Broadcast(Base):
+    """جدول الرسائل الجماعية وتقدم إرسالها"""
+    __tablename__ = 'broadcasts'
+    
+    id = Column(Integer, primary_key=True)
+    admin_id = Column(String(50), nullable=False)  # معرف التليجرام للإدمن
+    text = Column(Text, nullable=False)
+    segment = Column(String(100))  # شريحة المستلمين (None للجميع)
+    status = Column(String(20), default='pending', nullable=False)  # pending, running, paused, completed, cancelled, failed
+    last_user_id = Column(Integer, default=0, nullable=False)  # تم الانتهاء من كل المستلمين حتى هذا المعرف
+    total_recipients = Column(Integer, default=0, nullable=False)
+    sent_count = Column(Integer, default=0, nullable=False)
+    failed_count = Column(Integer, default=0, nullable=False)
+    blocked_count = Column(Integer, default=0, nullable=False)
+    progress_chat_id = Column(String(50))  # رسالة التقدم التي يتم تعديلها
+    progress_message_id = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # الفهارس
+    __table_args__ = (
+        Index('ix_broadcasts_status', 'status'),
+    )
+
+class UserState(Base):
+    """جدول حالة المحادثة لكل مستخدم (context.user_data بصيغة JSON)"""
+    __tablename__ = 'user_states'
+    
+    telegram_id = Column(BigInteger, primary_key=True)
+    data = Column(Text, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+def get_database_url(database_url=None):
+    """رابط قاعدة البيانات الافتراضي من متغيرات البيئة"""
+    if database_url is None:
+        database_url = os.getenv("DATABASE_URL", "sqlite:///data/telegram_bot.db")
+    return database_url
+
+def get_async_database_url(database_url):
+    """تحويل رابط قاعدة البيانات إلى المشغل غير المتزامن المقابل"""
+    url = make_url(database_url)
+    async_drivers = {
+        "sqlite": "sqlite+aiosqlite",
+        "mysql": "mysql+aiomysql",
+        "postgresql": "postgresql+asyncpg",
+    }
+    backend = url.get_backend_name()
+    if backend in async_drivers and url.drivername != async_drivers[backend]:
+        url = url.set(drivername=async_drivers[backend])
+    return str(url)
+
+# المحركات المشتركة على مستوى العملية (محرك واحد ومجمع اتصالات واحد لكل رابط)
+_engines = {}
+_async_engines = {}
+_managers = {}
+_user_caches = {}
+_recipient_indexes = {}
+_engines_lock = threading.Lock()
+
+def _engine_options(database_url, pool_class):
+    """خيارات مجمع الاتصالات حسب نوع قاعدة البيانات"""
+    url = make_url(database_url)
+    options = {}
+    
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            # قاعدة في الذاكرة: اتصال واحد مشترك وإلا ستختفي البيانات
+            options["poolclass"] = StaticPool
+            options["connect_args"] = {"check_same_thread": False}
+            return options
+        options["connect_args"] = {"check_same_thread": False}
+    
+    options["poolclass"] = pool_class
+    options.update(Config.DATABASE_POOL_CONFIG)
+    return options
+
+def _install_sqlite_pragmas(engine, pragmas):
+    """تطبيق إعدادات أداء SQLite على كل اتصال جديد"""
+    if engine.url.get_backend_name() != "sqlite" or not pragmas:
+        return
+    
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+def get_engine(database_url=None, sqlite_pragmas=None):
+    """المحرك المتزامن المشترك لرابط قاعدة البيانات"""
+    database_url = get_database_url(database_url)
+    if sqlite_pragmas is None:
+        sqlite_pragmas = Config.SQLITE_PRAGMAS
+    with _engines_lock:
+        if database_url not in _engines:
+            engine = create_engine(
+                database_url, **_engine_options(database_url, QueuePool)
+            )
+            _install_sqlite_pragmas(engine, sqlite_pragmas)
+            _engines[database_url] = engine
+        return _engines[database_url]
+
+def get_async_engine(database_url=None, sqlite_pragmas=None):
+    """المحرك غير المتزامن المشترك لرابط قاعدة البيانات"""
+    database_url = get_async_database_url(get_database_url(database_url))
+    if sqlite_pragmas is None:
+        sqlite_pragmas = Config.SQLITE_PRAGMAS
+    with _engines_lock:
+        if database_url not in _async_engines:
+            engine = create_async_engine(
+                database_url, **_engine_options(database_url, AsyncAdaptedQueuePool)
+            )
+            _install_sqlite_pragmas(engine.sync_engine, sqlite_pragmas)
+            _async_engines[database_url] = engine
+        return _async_engines[database_url]
+
+def get_user_cache(database_url=None):
+    """ذاكرة المستخدمين المؤقتة المشتركة لرابط قاعدة البيانات"""
+    database_url = get_database_url(database_url)
+    with _engines_lock:
+        if database_url not in _user_caches:
+            _user_caches[database_url] = UserCache(**Config.USER_CACHE_CONFIG)
+        return _user_caches[database_url]
+
+def get_recipient_index(database_url=None):
+    """فهرس مستلمي الرسائل الجماعية المشترك لرابط قاعدة البيانات"""
+    database_url = get_database_url(database_url)
+    with _engines_lock:
+        if database_url not in _recipient_indexes:
+            _recipient_indexes[database_url] = RecipientIndex()
+        return _recipient_indexes[database_url]
+
+def get_database(database_url=None):
+    """مدير قاعدة البيانات المتزامن المشترك"""
+    key = ("sync", get_database_url(database_url))
+    if key not in _managers:
+        _managers[key] = DatabaseManager(database_url)
+    return _managers[key]
+
+def get_async_database(database_url=None):
+    """مدير قاعدة البيانات غير المتزامن المشترك"""
+    key = ("async", get_database_url(database_url))
+    if key not in _managers:
+        _managers[key] = AsyncDatabaseManager(database_url)
+    return _managers[key]
+
+def _describe_pool(engine):
+    """إحصائيات مجمع اتصالات محرك واحد"""
+    pool = engine.pool
+    stats = {
+        "url": engine.url.render_as_string(hide_password=True),
+        "pool_class": type(pool).__name__,
+        "status": pool.status()
+    }
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow()
+        })
+    return stats
+
+def get_pool_stats():
+    """إحصائيات جميع مجمعات الاتصالات المفتوحة في العملية"""
+    with _engines_lock:
+        sync_engines = list(_engines.values())
+        async_engines = list(_async_engines.values())
+    return {
+        "sync": [_describe_pool(engine) for engine in sync_engines],
+        "async": [_describe_pool(engine.sync_engine) for engine in async_engines]
+    }
+
+async def dispose_engines():
+    """إغلاق جميع المحركات المشتركة (عند الإيقاف)"""
+    with _engines_lock:
+        sync_engines = list(_engines.values())
+        async_engines = list(_async_engines.values())
+        _engines.clear()
+        _async_engines.clear()
+        _managers.clear()
+        _user_caches.clear()
+        _recipient_indexes.clear()
+    for engine in sync_engines:
+        engine.dispose()
+    for engine in async_engines:
+        await engine.dispose()
+
+class UnknownUserError(LookupError):
+    """المستخدم المطلوب غير موجود (مثلاً مستلم تحويل حُذف حسابه)"""
+    
+    def __init__(self, user_id):
+        super().__init__(f"المستخدم {user_id} غير موجود")
+        self.user_id = user_id
+
+class UnconvertedMoneyError(RuntimeError):
+    """أعمدة المبالغ في قاعدة البيانات ما زالت Float (قبل ترحيل migrate-money)"""
+    
+    def __init__(self, pending):
+        columns = ", ".join(f"{table.name}.{column}" for table, columns in pending.items() for column in columns)
+        super().__init__(
+            f"أعمدة المبالغ ما زالت بأرقام عشرية ({columns})، "
+            "يرجى تشغيل python manage.py migrate-money قبل تشغيل البوت"
+        )
+        self.pending = pending
+
+def _check_money_columns(connection):
+    """رفض العمل على قاعدة بيانات لم تُحول مبالغها، لأن Money سيقرأ 12.5 كـ 0.13"""
+    from migrations import get_unconverted_money_columns  # migrations تستورد هذه الوحدة
+    pending = get_unconverted_money_columns(connection)
+    if pending:
+        raise UnconvertedMoneyError(pending)
+
+class BalanceLedger:
+    """خدمة الرصيد الذرية
+    
+    كل عملية هي أمر UPDATE شرطي واحد على users (balance = balance ± amount)
+    مع إضافة سجل المعاملة في نفس المعاملة، فلا تضيع التحديثات المتزامنة ولا
+    يصبح الرصيد سالباً. لا تقوم الدوال بالحفظ، ليتم دمجها داخل عمليات أكبر.
+    """
+    
+    @staticmethod
+    def _apply(session, user_id, delta, require_sufficient=False):
+        """تعديل الرصيد وإرجاع الرصيد الجديد، أو None إذا لم يتم التعديل"""
+        users = User.__table__
+        statement = users.update().where(users.c.id == user_id)
+        if require_sufficient:
+            statement = statement.where(users.c.balance >= -delta)
+        
+        result = session.execute(statement.values(balance=users.c.balance + delta))
+        if result.rowcount != 1:
+            return None
+        
+        # SQLAlchemy 1.4 لا يدعم RETURNING مع SQLite، لذلك نقرأ الرصيد داخل نفس المعاملة
+        new_balance = session.execute(select(users.c.balance).where(users.c.id == user_id)).scalar()
+        
+        # مزامنة كائن المستخدم المحمل في الجلسة إن وجد
+        user = session.identity_map.get(identity_key(User, user_id))
+        if user is not None:
+            set_committed_value(user, 'balance', new_balance)
+        
+        if 'user_cache' in session.info:
+            session.info.setdefault('changed_users', set()).add(user_id)
+        return new_balance
+    
+    @staticmethod
+    def credit(session, user_id, amount, transaction=None):
+        """إضافة مبلغ للرصيد مع سجل المعاملة، وإرجاع الرصيد الجديد"""
+        new_balance = BalanceLedger._apply(session, user_id, amount)
+        if new_balance is not None and transaction is not None:
+            session.add(transaction)
+        return new_balance
+    
+    @staticmethod
+    def debit(session, user_id, amount, transaction=None):
+        """خصم مبلغ إذا كان الرصيد كافياً، وإرجاع الرصيد الجديد أو None"""
+        new_balance = BalanceLedger._apply(session, user_id, -amount, require_sufficient=True)
+        if new_balance is not None and transaction is not None:
+            session.add(transaction)
+        return new_balance
+    
+    @staticmethod
+    def transfer(session, sender_id, receiver_id, amount, sender_transaction=None, receiver_transaction=None):
+        """تحويل مبلغ بين مستخدمين، وإرجاع رصيد المرسل الجديد أو None إذا كان رصيده غير كافٍ
+        
+        يرفع UnknownUserError إذا كان المستلم غير موجود.
+        """
+        sender_balance = BalanceLedger._apply(session, sender_id, -amount, require_sufficient=True)
+        if sender_balance is None:
+            return None
+        
+        if BalanceLedger._apply(session, receiver_id, amount) is None:
+            # المستلم غير موجود: إرجاع المبلغ للمرسل داخل نفس المعاملة
+            BalanceLedger._apply(session, sender_id, amount)
+            raise UnknownUserError(receiver_id)
+        
+        for transaction in (sender_transaction, receiver_transaction):
+            if transaction is not None:
+                session.add(transaction)
+        return sender_balance
+
+DAILY_JACKPOT_POOL = 'daily'
+
+class JackpotLedger:
+    """خدمة الإجمالي الجاري لمجموعات الجاكبوت
+    
+    قيمة كل مجموعة محفوظة في صف واحد في jackpot_pools ويتم تعديلها بأمر UPDATE
+    ذري مع كل مساهمة وسحب، فتُقرأ قيمة الجاكبوت دون جمع سجلات المساهمات.
+    لا تقوم الدوال بالحفظ، ليتم دمجها داخل عمليات أكبر.
+    """
+    
+    @staticmethod
+    def contribute(session, pool_id, amount, count=1):
+        """إضافة مساهمة (أو عدة مساهمات) إلى الإجمالي الجاري للمجموعة"""
+        pools = JackpotPool.__table__
+        now = datetime.utcnow()
+        result = session.execute(pools.update().where(pools.c.pool_id == pool_id).values(
+            current_amount=pools.c.current_amount + literal(amount, Money),
+            contributions_count=pools.c.contributions_count + count,
+            updated_at=now
+        ))
+        if result.rowcount == 0:
+            # مجموعة غير معرفة في Config (المعرفة تُنشأ صفوفها مع الجداول، انظر _seed_jackpot_pools)
+            session.execute(pools.insert().values(
+                pool_id=pool_id, current_amount=amount, contributions_count=count, updated_at=now
+            ))
+    
+    @staticmethod
+    def get_total(session, pool_id):
+        """قيمة الجاكبوت الحالية للمجموعة"""
+        pools = JackpotPool.__table__
+        total = session.execute(select(pools.c.current_amount).where(pools.c.pool_id == pool_id)).scalar()
+        return total if total is not None else to_money(0)
+    
+    @staticmethod
+    def pick_winner(session, pool_id, after_entry_id, through_entry_id, rng=random):
+        """اختيار فائز مرجح بمساهمته في مرور واحد على مشاركات الجولة
+        
+        اختيار عينة موزونة بحجم واحد: تستبدل كل مشاركة الفائز الحالي باحتمال
+        وزنها مقسوماً على مجموع الأوزان حتى الآن، فيكون احتمال فوز كل مستخدم
+        مساوياً لنسبة مساهماته من الجاكبوت. الأوزان بأصغر وحدة للعملة لتبقى
+        الاحتمالات دقيقة.
+        يرجع (معرف الفائز، إجمالي الجولة، عدد المشاركين، عدد المشاركات).
+        """
+        entries = JackpotEntry.__table__
+        statement = select(entries.c.user_id, entries.c.contribution_amount).where(
+            entries.c.jackpot_pool_id == pool_id,
+            entries.c.id > after_entry_id,
+            entries.c.id <= through_entry_id
+        )
+        result = session.execute(statement.execution_options(stream_results=True))
+        
+        winner_id = None
+        total_units = 0
+        entries_count = 0
+        participants = set()
+        for user_id, amount in result:
+            entries_count += 1
+            weight = int(amount * MINOR_UNITS_PER_UNIT)
+            participants.add(user_id)
+            if weight <= 0:
+                continue
+            total_units += weight
+            if rng.randrange(total_units) < weight:
+                winner_id = user_id
+        
+        total = to_money(Decimal(total_units) / MINOR_UNITS_PER_UNIT)
+        return winner_id, total, len(participants), entries_count
+    
+    @staticmethod
+    def close_round(session, pool_id, amount, entries_count, after_entry_id, through_entry_id):
+        """إغلاق الجولة: خصم المبلغ المسحوب وتقديم مؤشر آخر مشاركة مسحوبة
+        
+        يتم خصم مبلغ الجولة بدلاً من التصفير حتى تبقى المساهمات المضافة أثناء
+        السحب في الجولة التالية. يفشل إذا أغلق سحب آخر نفس الجولة.
+        """
+        pools = JackpotPool.__table__
+        now = datetime.utcnow()
+        result = session.execute(pools.update().where(
+            pools.c.pool_id == pool_id,
+            pools.c.drawn_through_entry_id == after_entry_id,
+            pools.c.current_amount >= literal(amount, Money)
+        ).values(
+            current_amount=pools.c.current_amount - literal(amount, Money),
+            contributions_count=pools.c.contributions_count - entries_count,
+            drawn_through_entry_id=through_entry_id,
+            last_drawn_at=now,
+            updated_at=now
+        ))
+        return result.rowcount == 1
+
+def _seed_jackpot_pools(connection):
+    """إنشاء صف لكل مجموعة جاكبوت معرفة في Config
+    
+    حتى تكون كل مساهمة UPDATE على صف موجود، فلا تُنشئ مساهمتان أولتان
+    متزامنتان نفس الصف (خطأ مفتاح مكرر يلغي معاملة المساهمة).
+    """
+    pools = JackpotPool.__table__
+    existing = {pool_id for (pool_id,) in connection.execute(select(pools.c.pool_id))}
+    missing = [pool_id for pool_id in Config.JACKPOT_POOL_DEFINITIONS if pool_id not in existing]
+    if missing:
+        now = datetime.utcnow()
+        connection.execute(pools.insert(), [
+            {'pool_id': pool_id, 'current_amount': to_money(0), 'contributions_count': 0,
+             'drawn_through_entry_id': 0, 'updated_at': now}
+            for pool_id in missing
+        ])
+        if DAILY_JACKPOT_POOL in missing:
+            _migrate_legacy_jackpot(connection)
+
+# معرفات المجموعات اليومية في النسخة القديمة (daily_YYYYMMDD)
+LEGACY_JACKPOT_POOL_PATTERN = re.compile(r'^daily_\d{8}$')
+
+def _migrate_legacy_jackpot(connection):
+    """نقل الجاكبوت غير المسحوب من النسخة القديمة إلى مجموعة daily
+    
+    النسخة القديمة كانت تحسب الجاكبوت من معاملات jackpot_contribution المكتملة
+    (السحب يحولها إلى processed). يُضاف لكل مساهم مشاركة واحدة بمجموع مساهماته
+    غير المسحوبة، فيبقى السحب مرجحاً ويطابق الإجمالي سجلات المشاركات. مشاركات
+    daily_YYYYMMDD القديمة تبقى كسجل فقط (لا تدخل في المطابقة). يُنفذ مرة واحدة
+    عند إنشاء صف المجموعة.
+    """
+    transactions = Transaction.__table__
+    rows = connection.execute(select(
+        transactions.c.user_id, func.sum(transactions.c.amount), func.max(transactions.c.created_at)
+    ).where(
+        transactions.c.transaction_type == 'jackpot_contribution',
+        transactions.c.status == 'completed'
+    ).group_by(transactions.c.user_id).order_by(transactions.c.user_id)).all()
+    
+    now = datetime.utcnow()
+    entries = [
+        {'user_id': user_id, 'bet_id': None, 'contribution_amount': amount,
+         'jackpot_pool_id': DAILY_JACKPOT_POOL, 'created_at': created_at or now}
+        for user_id, amount, created_at in rows
+        if amount and amount > 0
+    ]
+    if not entries:
+        return
+    
+    connection.execute(JackpotEntry.__table__.insert(), entries)
+    pools = JackpotPool.__table__
+    connection.execute(pools.update().where(pools.c.pool_id == DAILY_JACKPOT_POOL).values(
+        current_amount=sum(entry['contribution_amount'] for entry in entries),
+        contributions_count=len(entries)
+    ))
+
+# عمليات قاعدة البيانات المشتركة
+# كل عملية تستقبل جلسة متزامنة، وتُنفذ كما هي من DatabaseManager
+# أو من AsyncDatabaseManager عبر AsyncSession.run_sync
+
+def _generate_referral_code():
+    """توليد كود إحالة فريد"""
+    return str(uuid.uuid4())[:8].upper()
+
+def _create_user(session, telegram_id, username=None, first_name=None, last_name=None):
+    """إنشاء مستخدم جديد"""
+    # التحقق من وجود المستخدم
+    existing_user = session.query(User).filter(User.telegram_id == str(telegram_id)).first()
+    if existing_user:
+        return existing_user
+        
+    # إنشاء مستخدم جديد
+    referral_code = _generate_referral_code()
+    while session.query(User).filter(User.referral_code == referral_code).first():
+        referral_code = _generate_referral_code()
+        
+    user = User(
+        telegram_id=str(telegram_id),
+        username=username,
+        first_name=first_name,
+        last_name=last_name,
+        referral_code=referral_code,
+        betting_stats=UserBettingStats()
+    )
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+    return user
+
+def _get_user(session, telegram_id):
+    """الحصول على مستخدم بواسطة telegram_id (قراءة فقط، آخر نشاط يسجله ActivityTracker)"""
+    return session.query(User).filter(User.telegram_id == str(telegram_id)).first()
+
+def _flush_activity(session, touches):
+    """تحديث آخر نشاط لعدة مستخدمين في أمر UPDATE واحد"""
+    statement = User.__table__.update().where(
+        User.__table__.c.telegram_id == bindparam('touched_telegram_id')
+    ).values(last_activity=bindparam('touched_at'))
+    
+    session.execute(statement, [
+        {'touched_telegram_id': telegram_id, 'touched_at': touched_at}
+        for telegram_id, touched_at in touches.items()
+    ])
+    session.commit()
+
+def _get_user_by_id(session, user_id):
+    """الحصول على مستخدم بواسطة ID"""
+    return session.query(User).filter(User.id == user_id).first()
+
+def _find_user(session, identifier):
+    """البحث عن مستخدم بمعرف التليجرام أو اسم المستخدم"""
+    identifier = identifier.strip()
+    user = None
+    
+    # البحث بمعرف التليجرام
+    if identifier.isdigit():
+        user = session.query(User).filter(User.telegram_id == identifier).first()
+    
+    # البحث باسم المستخدم
+    if not user:
+        username = identifier[1:] if identifier.startswith('@') else identifier
+        user = session.query(User).filter(User.username == username).first()
+    
+    return user
+
+def _register_referral(session, user_id, referral_code):
+    """تسجيل إحالة مستخدم جديد"""
+    user = session.query(User).filter(User.id == user_id).first()
+    referrer = session.query(User).filter(User.referral_code == referral_code).first()
+    if not user or not referrer or referrer.id == user.id:
+        return None
+    
+    user.referred_by = referral_code
+    referrer.referral_count += 1
+    session.commit()
+    return referrer
+
+def _update_user_balance(session, telegram_id, amount, transaction_type="manual", description="", method=None):
+    """تحديث رصيد المستخدم"""
+    user_id = session.query(User.id).filter(User.telegram_id == str(telegram_id)).scalar()
+    if user_id is None:
+        return False
+    
+    transaction = Transaction(
+        user_id=user_id,
+        transaction_type=transaction_type,
+        amount=amount,
+        method=method,
+        status="completed",
+        description=description
+    )
+    BalanceLedger.credit(session, user_id, amount, transaction)
+    session.commit()
+    return True
+
+def _credit(session, user_id, amount, transaction_type, description=None, method=None):
+    """إضافة رصيد مع سجل معاملة مكتملة"""
+    transaction = Transaction(
+        user_id=user_id,
+        transaction_type=transaction_type,
+        amount=amount,
+        method=method,
+        status="completed",
+        description=description
+    )
+    new_balance = BalanceLedger.credit(session, user_id, amount, transaction)
+    session.commit()
+    return new_balance
+
+def _debit(session, user_id, amount, transaction_type, description=None, method=None):
+    """خصم رصيد إذا كان كافياً مع سجل معاملة مكتملة"""
+    transaction = Transaction(
+        user_id=user_id,
+        transaction_type=transaction_type,
+        amount=-amount,
+        method=method,
+        status="completed",
+        description=description
+    )
+    new_balance = BalanceLedger.debit(session, user_id, amount, transaction)
+    session.commit()
+    return new_balance
+
+def _transfer(session, sender_id, receiver_id, amount, transaction_type="transfer", description=None):
+    """تحويل رصيد بين مستخدمين مع سجل معاملة لكل طرف"""
+    new_balance = BalanceLedger.transfer(
+        session, sender_id, receiver_id, amount,
+        Transaction(user_id=sender_id, transaction_type=transaction_type, amount=-amount,
+                    status="completed", description=description),
+        Transaction(user_id=receiver_id, transaction_type=transaction_type, amount=amount,
+                    status="completed", description=description)
+    )
+    session.commit()
+    return new_balance
+
+def _add_bet(session, user_id, game_type, bet_amount, game_category=None, game_name=None, odds=None, bet_details=None):
+    """إضافة رهان جديد"""
+    bet = Bet(
+        user_id=user_id,
+        game_type=game_type,
+        game_category=game_category,
+        game_name=game_name,
+        bet_amount=bet_amount,
+        odds=odds,
+        bet_details=bet_details
+    )
+    session.add(bet)
+    _bump_betting_stats(session, user_id, bets_count=1, total_bets=bet_amount)
+    session.commit()
+    session.refresh(bet)
+    return bet
+
+def _bump_betting_stats(session, user_id, biggest_win=None, **deltas):
+    """تحديث إحصائيات رهانات المستخدم بأمر UPDATE واحد (أو إنشاؤها إن لم توجد)
+    
+    تُستدعى بعد تعديل الرهانات في الجلسة، فإذا لم يوجد صف للمستخدم يُحسب من
+    جدول الرهانات متضمناً هذا التعديل.
+    """
+    stats = UserBettingStats.__table__
+    values = {name: stats.c[name] + delta for name, delta in deltas.items() if delta}
+    if biggest_win:
+        biggest_win = literal(biggest_win, Money)
+        values['biggest_win'] = case(
+            (stats.c.biggest_win < biggest_win, biggest_win),
+            else_=stats.c.biggest_win
+        )
+    if not values:
+        return
+    values['updated_at'] = datetime.utcnow()
+    
+    result = session.execute(stats.update().where(stats.c.user_id == user_id).values(**values))
+    if result.rowcount == 0:
+        # مستخدم قديم قبل إعادة بناء الإحصائيات: حساب كل رهاناته بدل إدخال الفرق وحده
+        session.flush()
+        columns = ('bets_count', 'total_bets', 'won_count', 'lost_count', 'total_wins', 'biggest_win')
+        computed = _compute_betting_stats().where(Bet.__table__.c.user_id == user_id).subquery()
+        session.execute(stats.insert().from_select(
+            ('user_id',) + columns + ('updated_at',),
+            select(computed.c.user_id, *(computed.c[name] for name in columns), func.current_timestamp())
+        ))
+
+def _settle_bet(session, bet_id, status, actual_win=0):
+    """تسوية الرهان"""
+    bet = session.query(Bet).filter(Bet.id == bet_id).first()
+    if bet:
+        # عكس أثر التسوية السابقة على الإحصائيات ثم تطبيق الجديدة
+        previous_status = bet.status
+        previous_win = bet.actual_win if previous_status == 'won' else 0
+        won_win = actual_win if status == 'won' else 0
+        
+        bet.status = status
+        bet.actual_win = actual_win
+        bet.settled_at = datetime.utcnow()
+        _bump_betting_stats(
+            session, bet.user_id,
+            won_count=(status == 'won') - (previous_status == 'won'),
+            lost_count=(status == 'lost') - (previous_status == 'lost'),
+            total_wins=to_money(won_win) - to_money(previous_win or 0),
+            biggest_win=won_win
+        )
+        
+        # تحديث إجماليات المستخدم بأمر UPDATE ذري واحد (كما في _settle_bets)
+        credited_win = actual_win if status == 'won' and actual_win > 0 else 0
+        users = User.__table__
+        session.execute(users.update().where(users.c.id == bet.user_id).values(
+            total_wins=users.c.total_wins + literal(credited_win, Money),
+            total_bets=users.c.total_bets + literal(bet.bet_amount, Money)
+        ))
+        if 'user_cache' in session.info:
+            session.info.setdefault('changed_users', set()).add(bet.user_id)
+        
+        # إضافة الفوز للرصيد مع معاملته
+        if credited_win:
+            transaction = Transaction(
+                user_id=bet.user_id,
+                transaction_type='bet_win',
+                amount=actual_win,
+                status='completed',
+                description=f'فوز في {bet.game_name or bet.game_type}'
+            )
+            BalanceLedger.credit(session, bet.user_id, actual_win, transaction)
+        
+        session.commit()
+        return True
+    return False
+
+def _settle_bets(session, settlements):
+    """تسوية دفعة رهانات (bet_id, status, actual_win) في معاملة واحدة
+    
+    تُحمل الرهانات والمستخدمون باستعلامي IN، وتُجمع فروقات الرصيد والإحصائيات
+    لكل مستخدم وتُطبق بأوامر UPDATE متعددة الصفوف (executemany) مع إضافة
+    معاملات الفوز دفعة واحدة. تُسوى الرهانات المعلقة فقط، فإعادة إرسال نفس
+    الدفعة لا تدفع الأرباح مرتين. يرجع {user_id: الفروقات} لتجميع الإشعارات.
+    """
+    settlements = {bet_id: (status, to_money(actual_win or 0)) for bet_id, status, actual_win in settlements}
+    bets = []
+    bet_ids = list(settlements)
+    for start in range(0, len(bet_ids), 500):
+        bets.extend(session.query(Bet).filter(
+            Bet.id.in_(bet_ids[start:start + 500]),
+            Bet.status == 'pending'
+        ).all())
+    if not bets:
+        return {}
+    
+    user_ids = list({bet.user_id for bet in bets})
+    telegram_ids = {}
+    for start in range(0, len(user_ids), 500):
+        telegram_ids.update(session.execute(
+            select(User.id, User.telegram_id).where(User.id.in_(user_ids[start:start + 500]))
+        ).all())
+    
+    now = datetime.utcnow()
+    deltas = {}
+    bet_rows, win_transactions = [], []
+    for bet in bets:
+        if bet.user_id not in telegram_ids:
+            continue
+        status, actual_win = settlements[bet.id]
+        win = actual_win if status == 'won' and actual_win > 0 else to_money(0)
+        
+        delta = deltas.setdefault(bet.user_id, {
+            'telegram_id': telegram_ids[bet.user_id], 'bets_settled': 0, 'won_count': 0, 'lost_count': 0,
+            'total_bets': to_money(0), 'total_wins': to_money(0), 'biggest_win': to_money(0)
+        })
+        delta['bets_settled'] += 1
+        delta['won_count'] += status == 'won'
+        delta['lost_count'] += status == 'lost'
+        delta['total_bets'] += bet.bet_amount
+        delta['total_wins'] += win
+        delta['biggest_win'] = max(delta['biggest_win'], win)
+        
+        bet_rows.append({'b_id': bet.id, 'new_status': status, 'new_actual_win': actual_win, 'new_settled_at': now})
+        if win > 0:
+            win_transactions.append({
+                'user_id': bet.user_id, 'transaction_type': 'bet_win', 'amount': win, 'status': 'completed',
+                'description': f'فوز في {bet.game_name or bet.game_type}', 'created_at': now
+            })
+    
+    # تحديث الرهانات بشرط بقائها معلقة، والتراجع إذا سبقتنا تسوية أخرى
+    bets_table = Bet.__table__
+    result = session.execute(bets_table.update().where(
+        bets_table.c.id == bindparam('b_id'),
+        bets_table.c.status == 'pending'
+    ).values(
+        status=bindparam('new_status'),
+        actual_win=bindparam('new_actual_win', type_=Money),
+        settled_at=bindparam('new_settled_at')
+    ), bet_rows)
+    if result.rowcount != len(bet_rows):
+        session.rollback()
+        raise RuntimeError("تمت تسوية بعض الرهانات بالتزامن، يرجى إعادة المحاولة")
+    
+    users = User.__table__
+    session.execute(users.update().where(users.c.id == bindparam('u_id')).values(
+        balance=users.c.balance + bindparam('wins', type_=Money),
+        total_wins=users.c.total_wins + bindparam('wins', type_=Money),
+        total_bets=users.c.total_bets + bindparam('bets', type_=Money)
+    ), [
+        {'u_id': user_id, 'wins': delta['total_wins'], 'bets': delta['total_bets']}
+        for user_id, delta in deltas.items()
+    ])
+    if win_transactions:
+        session.execute(Transaction.__table__.insert(), win_transactions)
+    
+    # الإحصائيات: تحديث متعدد الصفوف للموجودة، وإنشاء المفقودة لمستخدمين قدامى
+    stats = UserBettingStats.__table__
+    existing = set()
+    for start in range(0, len(user_ids), 500):
+        existing.update(session.execute(
+            select(stats.c.user_id).where(stats.c.user_id.in_(user_ids[start:start + 500]))
+        ).scalars())
+    
+    biggest_win = bindparam('biggest', type_=Money)
+    stats_rows = [
+        {
+            'u_id': user_id, 'won': delta['won_count'], 'lost': delta['lost_count'],
+            'wins': delta['total_wins'], 'biggest': delta['biggest_win'], 'stats_updated_at': now
+        }
+        for user_id, delta in deltas.items() if user_id in existing
+    ]
+    if stats_rows:
+        session.execute(stats.update().where(stats.c.user_id == bindparam('u_id')).values(
+            won_count=stats.c.won_count + bindparam('won'),
+            lost_count=stats.c.lost_count + bindparam('lost'),
+            total_wins=stats.c.total_wins + bindparam('wins', type_=Money),
+            biggest_win=case((stats.c.biggest_win < biggest_win, biggest_win), else_=stats.c.biggest_win),
+            updated_at=bindparam('stats_updated_at')
+        ), stats_rows)
+    for user_id, delta in deltas.items():
+        if user_id not in existing:
+            _bump_betting_stats(
+                session, user_id, biggest_win=delta['biggest_win'],
+                won_count=delta['won_count'], lost_count=delta['lost_count'], total_wins=delta['total_wins']
+            )
+    
+    if 'user_cache' in session.info:
+        session.info.setdefault('changed_users', set()).update(deltas)
+    
+    session.commit()
+    return deltas
+
+def _ingest_bets(session, bets):
+    """إدخال دفعة رهانات خارجية مع تجاهل المكررة حسب ichancy_bet_id
+    
+    كل رهان dict بأعمدة جدول الرهانات مع telegram_id بدلاً من user_id.
+    تُحل المستخدمين والرهانات الموجودة باستعلامات IN، وتُضاف الرهانات الجديدة
+    بأمر INSERT متعدد الصفوف، وتُحدث إحصائيات كل مستخدم مرة واحدة للدفعة.
+    يرجع {ichancy_bet_id: (bet_id, user_id, أضيف الآن)} ويتجاهل المستخدمين غير المسجلين.
+    """
+    bets = {str(bet['ichancy_bet_id']): bet for bet in bets}
+    ichancy_ids = list(bets)
+    telegram_ids = list({str(bet['telegram_id']) for bet in bets.values()})
+    
+    user_ids = {}
+    for start in range(0, len(telegram_ids), 500):
+        user_ids.update(session.execute(
+            select(User.telegram_id, User.id).where(User.telegram_id.in_(telegram_ids[start:start + 500]))
+        ).all())
+    
+    def load_existing():
+        existing = {}
+        for start in range(0, len(ichancy_ids), 500):
+            for ichancy_bet_id, bet_id, user_id in session.execute(
+                select(Bet.ichancy_bet_id, Bet.id, Bet.user_id).where(Bet.ichancy_bet_id.in_(ichancy_ids[start:start + 500]))
+            ):
+                existing[ichancy_bet_id] = (bet_id, user_id, False)
+        return existing
+    
+    for attempt in range(2):
+        result = load_existing()
+        columns = [column.name for column in Bet.__table__.columns if column.name not in ('id', 'user_id')]
+        rows = [
+            dict({name: bet.get(name) for name in columns}, ichancy_bet_id=ichancy_bet_id,
+                 user_id=user_ids[str(bet['telegram_id'])], status='pending', actual_win=0,
+                 settled_at=None, placed_at=bet.get('placed_at') or datetime.utcnow())
+            for ichancy_bet_id, bet in bets.items()
+            if ichancy_bet_id not in result and str(bet['telegram_id']) in user_ids
+        ]
+        if not rows:
+            return result
+        
+        try:
+            session.execute(Bet.__table__.insert(), rows)
+            
+            totals = {}
+            for row in rows:
+                count, amount = totals.get(row['user_id'], (0, 0))
+                totals[row['user_id']] = (count + 1, amount + row['bet_amount'])
+            for user_id, (count, amount) in totals.items():
+                _bump_betting_stats(session, user_id, bets_count=count, total_bets=amount)
+            
+            session.commit()
+        except IntegrityError:
+            # أدخل عامل آخر نفس الرهانات بالتزامن: إعادة القراءة وإدخال الباقي
+            session.rollback()
+            if attempt:
+                raise
+            continue
+        
+        inserted = load_existing()
+        for row in rows:
+            bet_id, user_id, _ = inserted[row['ichancy_bet_id']]
+            result[row['ichancy_bet_id']] = (bet_id, user_id, True)
+        return result
+
+def _add_jackpot_contribution(session, user_id, bet_id, contribution_amount, pool_id=DAILY_JACKPOT_POOL, description=None):
+    """إضافة مساهمة في الجاكبوت"""
+    entry = JackpotEntry(
+        user_id=user_id,
+        bet_id=bet_id,
+        contribution_amount=contribution_amount,
+        jackpot_pool_id=pool_id
+    )
+    session.add(entry)
+    
+    # إضافة معاملة المساهمة
+    transaction = Transaction(
+        user_id=user_id,
+        transaction_type='jackpot_contribution',
+        amount=contribution_amount,
+        status='completed',
+        description=description or 'مساهمة في الجاكبوت اليومي'
+    )
+    session.add(transaction)
+    
+    JackpotLedger.contribute(session, pool_id, contribution_amount)
+    session.commit()
+    return True
+
+def _get_current_jackpot(session, pool_id=DAILY_JACKPOT_POOL):
+    """الحصول على قيمة الجاكبوت الحالية"""
+    return JackpotLedger.get_total(session, pool_id)
+
+def _insert_jackpot_contributions(session, contributions):
+    """إضافة دفعة مساهمات (user_id, bet_id, pool_id, amount) دون حفظ
+    
+    تُضاف المشاركات والمعاملات بأمر INSERT متعدد الصفوف (executemany) لكل
+    جدول، ثم يُحدث إجمالي كل مجموعة مرة واحدة.
+    """
+    now = datetime.utcnow()
+    entries, transactions, totals, counts = [], [], {}, {}
+    for user_id, bet_id, pool_id, amount in contributions:
+        pool_name = Config.JACKPOT_POOL_DEFINITIONS.get(pool_id, {}).get('name', pool_id)
+        entries.append({
+            'user_id': user_id, 'bet_id': bet_id, 'contribution_amount': amount,
+            'jackpot_pool_id': pool_id, 'created_at': now
+        })
+        transactions.append({
+            'user_id': user_id, 'transaction_type': 'jackpot_contribution', 'amount': amount,
+            'status': 'completed', 'description': f'مساهمة في {pool_name}', 'created_at': now
+        })
+        totals[pool_id] = totals.get(pool_id, 0) + amount
+        counts[pool_id] = counts.get(pool_id, 0) + 1
+    
+    if not entries:
+        return 0
+    
+    session.execute(JackpotEntry.__table__.insert(), entries)
+    session.execute(Transaction.__table__.insert(), transactions)
+    for pool_id, total in totals.items():
+        JackpotLedger.contribute(session, pool_id, total, counts[pool_id])
+    return len(entries)
+
+def _add_jackpot_contributions(session, contributions, pool_id=DAILY_JACKPOT_POOL):
+    """إضافة دفعة مساهمات (user_id, bet_id, amount) في معاملة واحدة، وإرجاع عددها"""
+    count = _insert_jackpot_contributions(session, (
+        (user_id, bet_id, pool_id, amount) for user_id, bet_id, amount in contributions
+    ))
+    session.commit()
+    return count
+
+def _flush_jackpot_contributions(session, contributions):
+    """كتابة دفعة مساهمات (telegram_id, bet_id, pool_id, amount) من المخزن في معاملة واحدة
+    
+    تُحل معرفات المستخدمين باستعلام واحد لكل 500 معرف، وتُتجاهل مساهمات
+    المستخدمين غير المسجلين.
+    """
+    telegram_ids = list({str(telegram_id) for telegram_id, _, _, _ in contributions})
+    user_ids = {}
+    for start in range(0, len(telegram_ids), 500):
+        chunk = telegram_ids[start:start + 500]
+        user_ids.update(session.execute(select(User.telegram_id, User.id).where(User.telegram_id.in_(chunk))).all())
+    
+    count = _insert_jackpot_contributions(session, (
+        (user_ids[str(telegram_id)], bet_id, pool_id, amount)
+        for telegram_id, bet_id, pool_id, amount in contributions
+        if str(telegram_id) in user_ids
+    ))
+    session.commit()
+    return count
+
+def _compute_jackpot_totals(session):
+    """حساب إجمالي كل مجموعة من السجلات: المساهمات ناقص المبالغ المسحوبة"""
+    contributed = dict(session.query(
+        JackpotEntry.jackpot_pool_id, func.sum(JackpotEntry.contribution_amount)
+    ).filter(JackpotEntry.jackpot_pool_id.isnot(None)).group_by(JackpotEntry.jackpot_pool_id).all())
+    
+    drawn = dict(session.query(
+        JackpotWin.jackpot_pool_id, func.sum(JackpotWin.total_pool)
+    ).group_by(JackpotWin.jackpot_pool_id).all())
+    
+    return {
+        pool_id: to_money(contributed.get(pool_id) or 0) - to_money(drawn.get(pool_id) or 0)
+        for pool_id in set(contributed) | set(drawn)
+        if not LEGACY_JACKPOT_POOL_PATTERN.match(pool_id)  # نُقلت إلى daily (انظر _migrate_legacy_jackpot)
+    }
+
+def _reconcile_jackpot_pools(session, fix=False):
+    """مقارنة الإجمالي الجاري لكل مجموعة بسجلات المساهمات والأرباح
+    
+    يرجع قائمة (المجموعة، القيمة المحسوبة، القيمة المخزنة) للمجموعات المختلفة،
+    ويصحح القيم المخزنة إذا كان fix=True.
+    """
+    expected = _compute_jackpot_totals(session)
+    stored = {pool.pool_id: pool for pool in session.query(JackpotPool).all()}
+    
+    mismatches = []
+    for pool_id in sorted(set(expected) | set(stored)):
+        expected_amount = expected.get(pool_id, to_money(0))
+        pool = stored.get(pool_id)
+        actual_amount = pool.current_amount if pool is not None else None
+        if actual_amount == expected_amount:
+            continue
+        
+        mismatches.append((pool_id, expected_amount, actual_amount))
+        if fix:
+            if pool is None:
+                session.add(JackpotPool(pool_id=pool_id, current_amount=expected_amount))
+            else:
+                pool.current_amount = expected_amount
+    
+    if fix and mismatches:
+        session.commit()
+    return mismatches
+
+def _get_recent_bets(session, user_id, limit=10, before=None):
+    """آخر رهانات المستخدم بترقيم keyset، before = (placed_at, id) لآخر رهان في الصفحة السابقة"""
+    query = session.query(Bet).filter(Bet.user_id == user_id)
+    if before is not None:
+        placed_at, bet_id = before
+        query = query.filter(or_(
+            Bet.placed_at < placed_at,
+            and_(Bet.placed_at == placed_at, Bet.id < bet_id)
+        ))
+    return query.order_by(Bet.placed_at.desc(), Bet.id.desc()).limit(limit).all()
+
+def _get_user_betting_stats(session, user_id):
+    """الحصول على إحصائيات رهانات المستخدم"""
+    stats = {
+        'total_bets': 0,
+        'total_wins': 0,
+        'total_losses': 0,
+        'win_rate': 0,
+        'biggest_win': 0,
+        'recent_bets': []
+    }
+    
+    row = session.get(UserBettingStats, user_id)
+    if not row:
+        return stats
+    
+    total_settled_bets = row.won_count + row.lost_count
+    stats.update({
+        'total_bets': row.total_bets,
+        'total_wins': row.total_wins,
+        'total_losses': row.total_bets - row.total_wins,
+        'win_rate': (row.won_count / total_settled_bets * 100) if total_settled_bets > 0 else 0,
+        'biggest_win': row.biggest_win,
+        'recent_bets': _get_recent_bets(session, user_id)
+    })
+    
+    return stats
+
+def _compute_betting_stats():
+    """استعلام حساب إحصائيات الرهانات من جدول الرهانات مباشرة"""
+    bets = Bet.__table__
+    won = bets.c.status == 'won'
+    return select(
+        bets.c.user_id,
+        func.count().label('bets_count'),
+        func.coalesce(func.sum(bets.c.bet_amount), 0).label('total_bets'),
+        func.coalesce(func.sum(case((won, 1), else_=0)), 0).label('won_count'),
+        func.coalesce(func.sum(case((bets.c.status == 'lost', 1), else_=0)), 0).label('lost_count'),
+        func.coalesce(func.sum(case((won, bets.c.actual_win), else_=0)), 0).label('total_wins'),
+        func.coalesce(func.max(case((won, bets.c.actual_win), else_=0)), 0).label('biggest_win')
+    ).group_by(bets.c.user_id)
+
+def _rebuild_betting_stats(session):
+    """إعادة حساب جدول إحصائيات الرهانات بالكامل من جدول الرهانات"""
+    stats = UserBettingStats.__table__
+    users = User.__table__
+    computed = _compute_betting_stats().subquery()
+    columns = ('bets_count', 'total_bets', 'won_count', 'lost_count', 'total_wins', 'biggest_win')
+    
+    session.execute(stats.delete())
+    session.execute(stats.insert().from_select(
+        ('user_id',) + columns + ('updated_at',),
+        select(
+            users.c.id,
+            *(func.coalesce(computed.c[name], 0) for name in columns),
+            func.current_timestamp()
+        ).select_from(users.outerjoin(computed, computed.c.user_id == users.c.id))
+    ))
+    session.commit()
+    return session.query(UserBettingStats).count()
+
+def _verify_betting_stats(session):
+    """مقارنة الإحصائيات المخزنة بالمحسوبة، وإرجاع المستخدمين المختلفين"""
+    computed = {row.user_id: row for row in session.execute(_compute_betting_stats())}
+    stored = {row.user_id: row for row in session.query(UserBettingStats)}
+    columns = ('bets_count', 'total_bets', 'won_count', 'lost_count', 'total_wins', 'biggest_win')
+    
+    mismatches = []
+    for user_id in set(computed) | set(stored):
+        expected, actual = computed.get(user_id), stored.get(user_id)
+        for name in columns:
+            expected_value = getattr(expected, name, 0) if expected else 0
+            actual_value = getattr(actual, name, 0) if actual else 0
+            if expected_value != actual_value:
+                mismatches.append((user_id, name, expected_value, actual_value))
+    return mismatches
+
+def _update_vip_level(session, user_id):
+    """تحديث مستوى VIP للمستخدم"""
+    user = session.query(User).filter(User.id == user_id).first()
+    if user:
+        from config import Config
+        level_id, level_info = Config.get_vip_level(user.total_bets)
+        
+        old_level = user.vip_level
+        user.vip_level = level_id
+        
+        session.commit()
+        
+        # إرجاع True إذا تم الترقية
+        return old_level != level_id
+    return False
+
+def _log_system_event(session, log_type, module, message, user_id=None):
+    """تسجيل حدث في النظام"""
+    log = SystemLog(
+        log_type=log_type,
+        module=module,
+        message=message,
+        user_id=user_id
+    )
+    session.add(log)
+    session.commit()
+
+class UserSnapshot:
+    """نسخة خفيفة للقراءة فقط من صف المستخدم (دون جلسة أو علاقات)"""
+    
+    __slots__ = tuple(column.key for column in User.__table__.columns)
+    
+    def __init__(self, user):
+        for key in self.__slots__:
+            setattr(self, key, getattr(user, key))
+    
+    def __repr__(self):
+        return f"<UserSnapshot id={self.id} telegram_id={self.telegram_id}>"
+
+class UserCache:
+    """ذاكرة مؤقتة محدودة (LRU + TTL) لنسخ المستخدمين حسب telegram_id
+    
+    تُلغى النسخة تلقائياً عند حفظ أي تعديل على المستخدم عبر الجلسة
+    (انظر _collect_changed_users)، ويمكن إلغاؤها يدوياً بعد أوامر UPDATE المباشرة.
+    كل إلغاء يزيد generation ويُسجل قيمتها للمستخدم الملغى، فالقراءة التي بدأت
+    قبل حفظ متزامن على نفس المستخدم لا تُخزن نسختها القديمة (انظر put)، بينما
+    تُخزن قراءات المستخدمين الآخرين.
+    """
+    
+    def __init__(self, max_size=10000, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # telegram_id -> (وقت الانتهاء، النسخة)
+        self._telegram_ids = {}  # user.id -> telegram_id
+        self._lock = threading.Lock()
+        self.generation = 0
+        self._invalidated = OrderedDict()  # ('telegram_id'|'user_id', المعرف) -> generation آخر إلغاء
+        self._forgotten = 0  # أكبر generation حُذف سجله من _invalidated (أو وقت آخر clear)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+    
+    def get(self, telegram_id):
+        """النسخة المخزنة أو None"""
+        telegram_id = str(telegram_id)
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            expires_at, snapshot = entry
+            if expires_at < time.monotonic():
+                self._remove(telegram_id)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(telegram_id)
+            self.hits += 1
+            return snapshot
+    
+    def put(self, user, generation=None):
+        """تخزين نسخة من المستخدم وإرجاعها
+        
+        generation: قيمة self.generation قبل بدء القراءة؛ إذا أُلغي نفس المستخدم
+        بعدها فقد تكون القراءة أقدم من الحفظ، فتُرجع النسخة دون تخزينها.
+        """
+        if self.max_size <= 0 or self.ttl <= 0:
+            return UserSnapshot(user)
+        
+        snapshot = UserSnapshot(user)
+        telegram_id = str(snapshot.telegram_id)
+        with self._lock:
+            if generation is not None and self._invalidated_since(generation, telegram_id, snapshot.id):
+                return snapshot
+            self._entries[telegram_id] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(telegram_id)
+            self._telegram_ids[snapshot.id] = telegram_id
+            
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return snapshot
+    
+    def invalidate(self, telegram_id):
+        """حذف نسخة المستخدم بعد تعديله"""
+        with self._lock:
+            self._mark_invalidated(('telegram_id', str(telegram_id)))
+            if self._remove(str(telegram_id)):
+                self.invalidations += 1
+    
+    def invalidate_user_id(self, user_id):
+        """حذف نسخة المستخدم بواسطة ID"""
+        with self._lock:
+            self._mark_invalidated(('user_id', user_id))
+            telegram_id = self._telegram_ids.get(user_id)
+            if telegram_id is not None and self._remove(telegram_id):
+                self.invalidations += 1
+    
+    def clear(self):
+        """حذف جميع النسخ"""
+        with self._lock:
+            self.generation += 1
+            self._forgotten = self.generation
+            self._invalidated.clear()
+            self._entries.clear()
+            self._telegram_ids.clear()
+    
+    def _mark_invalidated(self, key):
+        self.generation += 1
+        self._invalidated[key] = self.generation
+        self._invalidated.move_to_end(key)
+        # سجل محدود: القراءات التي بدأت قبل أقدم سجل محذوف لا تُخزن
+        while len(self._invalidated) > max(self.max_size, 1):
+            _, forgotten = self._invalidated.popitem(last=False)
+            self._forgotten = max(self._forgotten, forgotten)
+    
+    def _invalidated_since(self, generation, telegram_id, user_id):
+        if generation < self._forgotten:
+            return True
+        return (
+            self._invalidated.get(('telegram_id', telegram_id), 0) > generation
+            or self._invalidated.get(('user_id', user_id), 0) > generation
+        )
+    
+    def _remove(self, telegram_id):
+        entry = self._entries.pop(telegram_id, None)
+        if entry is None:
+            return False
+        self._telegram_ids.pop(entry[1].id, None)
+        return True
+    
+    def stats(self):
+        """عدادات الذاكرة المؤقتة لتحديد حجمها المناسب"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups * 100) if lookups else 0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session, flush_context):
+    """جمع المستخدمين المعدلين في الجلسة لإلغاء نسخهم بعد الحفظ"""
+    if 'user_cache' not in session.info:
+        return
+    changed = session.info.setdefault('changed_users', set())
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, User):
+            changed.add(obj.id)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    """إلغاء نسخ المستخدمين المعدلين بعد نجاح الحفظ"""
+    cache = session.info.get('user_cache')
+    for user_id in session.info.pop('changed_users', ()):
+        cache.invalidate_user_id(user_id)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_changed_users(session, previous_transaction):
+    """تجاهل التعديلات الملغاة"""
+    session.info.pop('changed_users', None)
+
+EPOCH = datetime(1970, 1, 1)
+
+def _epoch_seconds(moment):
+    return int((moment - EPOCH).total_seconds()) if moment else 0
+
+class RecipientIndex:
+    """فهرس مضغوط في الذاكرة لمستلمي الرسائل الجماعية
+    
+    مصفوفات متوازية مفهرسة بـ user.id: (telegram_id، مستوى VIP، آخر نشاط، أعلام)،
+    فيتم اختيار فئة من مئات آلاف المستخدمين بمرور واحد على المصفوفات دون
+    استعلام. يُبنى عند التشغيل (load) ويُحدث من مسارات الكتابة: حفظ المستخدمين
+    وإيداعاتهم عبر الجلسة (انظر _collect_recipient_changes) وكتابة آخر النشاط.
+    
+    الفئات: all، vip:<المستوى>، active:<عدد الأيام>، depositors، referrers، never_deposited
+    """
+    
+    DEPOSITOR = 1
+    REFERRER = 2
+    PRESENT = 4  # خانة لمستخدم موجود (المعرفات غير المستخدمة تبقى 0)
+    
+    VIP_CODES = {level_id: code for code, level_id in enumerate(Config.VIP_LEVELS)}
+    
+    def __init__(self):
+        self.telegram_ids = array('q')  # 0 = لا يوجد مستخدم بهذا المعرف
+        self.vip_levels = array('b')
+        self.last_activity = array('q')  # ثواني منذ 1970 (UTC)
+        self.flags = array('B')
+        self._slots = {}  # telegram_id -> user.id
+        self._lock = threading.Lock()
+        self.loaded = False
+    
+    def load(self, users, depositors):
+        """بناء الفهرس من صفوف (id، telegram_id، vip_level، last_activity، referral_count)"""
+        index = RecipientIndex()
+        depositors = set(depositors)
+        for user_id, telegram_id, vip_level, last_activity, referral_count in users:
+            index._set(user_id, telegram_id, vip_level, last_activity, referral_count, user_id in depositors)
+        
+        with self._lock:
+            self.telegram_ids, self.vip_levels = index.telegram_ids, index.vip_levels
+            self.last_activity, self.flags, self._slots = index.last_activity, index.flags, index._slots
+            self.loaded = True
+    
+    def _set(self, user_id, telegram_id, vip_level, last_activity, referral_count, depositor=None):
+        if not str(telegram_id).isdigit():
+            return
+        
+        missing = user_id + 1 - len(self.telegram_ids)
+        if missing > 0:
+            self.telegram_ids.extend(itertools.repeat(0, missing))
+            self.vip_levels.extend(itertools.repeat(-1, missing))
+            self.last_activity.extend(itertools.repeat(0, missing))
+            self.flags.extend(itertools.repeat(0, missing))
+        
+        flags = self.flags[user_id] | self.PRESENT
+        if depositor is not None:
+            flags = flags | self.DEPOSITOR if depositor else flags & ~self.DEPOSITOR
+        flags = flags | self.REFERRER if referral_count else flags & ~self.REFERRER
+        
+        self.telegram_ids[user_id] = int(telegram_id)
+        self.vip_levels[user_id] = self.VIP_CODES.get(vip_level, -1)
+        self.last_activity[user_id] = _epoch_seconds(last_activity)
+        self.flags[user_id] = flags
+        self._slots[str(telegram_id)] = user_id
+    
+    def update_user(self, user_id, telegram_id, vip_level, last_activity, referral_count):
+        """تحديث بيانات مستخدم (أو إضافته)"""
+        with self._lock:
+            self._set(user_id, telegram_id, vip_level, last_activity, referral_count)
+    
+    def mark_depositor(self, user_id):
+        """تسجيل أول إيداع مكتمل للمستخدم"""
+        with self._lock:
+            if user_id < len(self.flags):
+                self.flags[user_id] |= self.DEPOSITOR
+    
+    def touch(self, touches):
+        """تحديث آخر نشاط من {telegram_id: الوقت}"""
+        with self._lock:
+            for telegram_id, touched_at in touches.items():
+                user_id = self._slots.get(str(telegram_id))
+                if user_id is not None:
+                    self.last_activity[user_id] = _epoch_seconds(touched_at)
+    
+    @staticmethod
+    def _byte_mask(values, matches):
+        """قناع 0/1 لمصفوفة بايتات عبر جدول bytes.translate (دون حلقة Python)"""
+        return values.tobytes().translate(bytes(int(bool(matches(byte))) for byte in range(256)))
+    
+    def _mask(self, segment, start):
+        """قناع الفئة على المصفوفات من start، أو ValueError لفئة غير معروفة"""
+        name, _, value = (segment or "all").partition(":")
+        if name == "all":
+            return self._byte_mask(self.flags[start:], lambda flags: flags & self.PRESENT)
+        if name == "vip" and value in self.VIP_CODES:
+            return self._byte_mask(self.vip_levels[start:], self.VIP_CODES[value].__eq__)
+        if name == "active" and value.isdigit():
+            cutoff = _epoch_seconds(datetime.utcnow() - timedelta(days=int(value)))
+            return bytes(map(cutoff.__le__, self.last_activity[start:]))
+        if name == "depositors":
+            return self._byte_mask(self.flags[start:], lambda flags: flags & self.DEPOSITOR)
+        if name == "referrers":
+            return self._byte_mask(self.flags[start:], lambda flags: flags & self.REFERRER)
+        if name == "never_deposited":
+            return self._byte_mask(
+                self.flags[start:], lambda flags: flags & (self.PRESENT | self.DEPOSITOR) == self.PRESENT
+            )
+        raise ValueError(f"فئة غير معروفة: {segment}")
+    
+    def select(self, segment=None, after_user_id=0):
+        """مستلمو الفئة [(user_id، telegram_id)] بترتيب المعرف بعد after_user_id"""
+        start = after_user_id + 1
+        with self._lock:
+            mask = self._mask(segment, start)
+            return list(zip(
+                itertools.compress(range(start, len(self.telegram_ids)), mask),
+                itertools.compress(self.telegram_ids[start:], mask)
+            ))
+    
+    def count(self, segment=None):
+        """عدد مستلمي الفئة"""
+        with self._lock:
+            return self._mask(segment, 1).count(1)
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._slots)
+
+@event.listens_for(Session, "after_flush")
+def _collect_recipient_changes(session, flush_context):
+    """جمع المستخدمين والإيداعات المكتملة في الجلسة لتحديث فهرس المستلمين بعد الحفظ"""
+    if 'recipient_index' not in session.info:
+        return
+    users = session.info.setdefault('recipient_users', {})
+    depositors = session.info.setdefault('recipient_depositors', set())
+    for obj in itertools.chain(session.new, session.dirty):
+        if isinstance(obj, User):
+            users[obj.id] = (obj.telegram_id, obj.vip_level, obj.last_activity, obj.referral_count)
+        elif isinstance(obj, Transaction) and obj.transaction_type == 'deposit' and obj.status == 'completed':
+            depositors.add(obj.user_id)
+
+@event.listens_for(Session, "after_commit")
+def _apply_recipient_changes(session):
+    """تطبيق التعديلات على فهرس المستلمين بعد نجاح الحفظ"""
+    index = session.info.get('recipient_index')
+    for user_id, (telegram_id, vip_level, last_activity, referral_count) in session.info.pop('recipient_users', {}).items():
+        index.update_user(user_id, telegram_id, vip_level, last_activity, referral_count)
+    for user_id in session.info.pop('recipient_depositors', ()):
+        index.mark_depositor(user_id)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_recipient_changes(session, previous_transaction):
+    """تجاهل التعديلات الملغاة"""
+    session.info.pop('recipient_users', None)
+    session.info.pop('recipient_depositors', None)
+
+def _load_recipient_index(session):
+    """قراءة بيانات فهرس المستلمين: (صفوف المستخدمين، معرفات من لديهم إيداع مكتمل)"""
+    users = session.execute(select(
+        User.id, User.telegram_id, User.vip_level, User.last_activity, User.referral_count
+    )).all()
+    depositors = session.execute(select(Transaction.user_id).where(
+        Transaction.transaction_type == 'deposit', Transaction.status == 'completed'
+    ).distinct()).scalars().all()
+    return users, depositors
+
+class ActivityTracker:
+    """متتبع آخر نشاط للمستخدمين في الذاكرة
+    
+    يسجل كل لمسة دون الكتابة في قاعدة البيانات، ثم تُكتب اللمسات المتراكمة
+    دفعة واحدة كل Config.ACTIVITY_FLUSH_INTERVAL ثانية وعند الإيقاف.
+    """
+    
+    def __init__(self):
+        self._touches = {}
+        self._lock = threading.Lock()
+    
+    def touch(self, telegram_id):
+        """تسجيل نشاط المستخدم الآن"""
+        with self._lock:
+            self._touches[str(telegram_id)] = datetime.utcnow()
+    
+    def drain(self):
+        """سحب اللمسات المتراكمة وتفريغ المتتبع"""
+        with self._lock:
+            touches, self._touches = self._touches, {}
+        return touches
+    
+    def restore(self, touches):
+        """إعادة لمسات فشلت كتابتها دون تجاوز لمسات أحدث"""
+        with self._lock:
+            for telegram_id, touched_at in touches.items():
+                current = self._touches.get(telegram_id)
+                if current is None or current < touched_at:
+                    self._touches[telegram_id] = touched_at
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._touches)
+
+class JackpotBuffer:
+    """مخزن مساهمات الجاكبوت في الذاكرة
+    
+    يجمع مساهمات كل الرهانات لكل المجموعات، ثم تُكتب دفعة واحدة كل
+    Config.JACKPOT_FLUSH_INTERVAL ثانية، أو عند بلوغ max_size مساهمة،
+    وقبل كل سحب وعند الإيقاف.
+    """
+    
+    def __init__(self, max_size=None):
+        self.max_size = max_size or Config.JACKPOT_BATCH_SIZE
+        self._contributions = []
+        self._lock = threading.Lock()
+    
+    def add(self, telegram_id, bet_id, pool_id, amount):
+        """إضافة مساهمة لمجموعة جاكبوت، وإرجاع True إذا امتلأ المخزن"""
+        with self._lock:
+            self._contributions.append((str(telegram_id), bet_id, pool_id, amount))
+            return len(self._contributions) >= self.max_size
+    
+    def add_bet(self, telegram_id, bet_id, bet_amount, game_type=None):
+        """توزيع مساهمة رهان على كل مجموعات الجاكبوت المطابقة، وإرجاع True إذا امتلأ المخزن"""
+        bet_amount = to_money(bet_amount)
+        full = False
+        for pool_id, pool in Config.get_matching_jackpot_pools(game_type).items():
+            contribution = to_money(bet_amount * pool['contribution_rate'])
+            if contribution > 0:
+                full = self.add(telegram_id, bet_id, pool_id, contribution) or full
+        return full
+    
+    def drain(self):
+        """سحب المساهمات المتراكمة وتفريغ المخزن"""
+        with self._lock:
+            contributions, self._contributions = self._contributions, []
+        return contributions
+    
+    def restore(self, contributions):
+        """إعادة مساهمات فشلت كتابتها إلى بداية المخزن"""
+        with self._lock:
+            self._contributions[:0] = contributions
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._contributions)
+
 class DatabaseManager:
     """مدير قاعدة البيانات"""
     
     def __init__(self, database_url=None):
-        if database_url is None:
-            database_url = os.getenv("DATABASE_URL", "sqlite:///data/telegram_bot.db")
-        
-        self.engine = create_engine(database_url)
-        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.engine = get_engine(database_url)
+        self.user_cache = get_user_cache(database_url)
+        self.recipients = get_recipient_index(database_url)
+        # الكائنات المُرجعة تُستخدم بعد إغلاق الجلسة، لذلك لا تُلغى قيمها عند الحفظ
+        self.SessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, expire_on_commit=False, bind=self.engine,
+            info={'user_cache': self.user_cache, 'recipient_index': self.recipients}
+        )
         self.func = func  # إضافة func للاستعلامات المتقدمة
+        self.activity = ActivityTracker()
+        self.jackpot = JackpotBuffer()
         
     def create_tables(self):
-        """إنشاء الجداول"""
-        Base.metadata.create_all(bind=self.engine)
+        """إنشاء الجداول وصفوف مجموعات الجاكبوت (بعد التأكد من تحويل أعمدة المبالغ)"""
+        with self.engine.begin() as connection:
+            _check_money_columns(connection)
+            Base.metadata.create_all(connection)
+            _seed_jackpot_pools(connection)
         
     def get_session(self):
         """الحصول على جلسة قاعدة البيانات"""
         return self.SessionLocal()
+    
+    def run(self, operation, *args, **kwargs):
+        """تنفيذ عملية على جلسة جديدة ثم إغلاقها"""
+        session = self.get_session()
+        try:
+            return operation(session, *args, **kwargs)
+        finally:
+            session.close()
         
     def generate_referral_code(self):
         """توليد كود إحالة فريد"""
-        return str(uuid.uuid4())[:8].upper()
+        return _generate_referral_code()
         
     def create_user(self, telegram_id, username=None, first_name=None, last_name=None):
         """إنشاء مستخدم جديد"""
-        session = self.get_session()
-        try:
-            # التحقق من وجود المستخدم
-            existing_user = session.query(User).filter(User.telegram_id == str(telegram_id)).first()
-            if existing_user:
-                return existing_user
-                
-            # إنشاء مستخدم جديد
-            referral_code = self.generate_referral_code()
-            while session.query(User).filter(User.referral_code == referral_code).first():
-                referral_code = self.generate_referral_code()
-                
-            user = User(
-                telegram_id=str(telegram_id),
-                username=username,
-                first_name=first_name,
-                last_name=last_name,
-                referral_code=referral_code
-            )
-            session.add(user)
-            session.commit()
-            session.refresh(user)
-            return user
-        finally:
-            session.close()
+        return self.run(_create_user, telegram_id, username, first_name, last_name)
             
     def get_user(self, telegram_id):
-        """الحصول على مستخدم بواسطة telegram_id"""
-        session = self.get_session()
+        """الحصول على نسخة المستخدم بواسطة telegram_id (من الذاكرة المؤقتة إن وجدت)"""
+        self.activity.touch(telegram_id)
+        snapshot = self.user_cache.get(telegram_id)
+        if snapshot is None:
+            generation = self.user_cache.generation
+            user = self.run(_get_user, telegram_id)
+            snapshot = self.user_cache.put(user, generation) if user else None
+        return snapshot
+    
+    def flush_activity(self):
+        """كتابة آخر نشاط المتراكم في قاعدة البيانات، وإرجاع عدد المستخدمين"""
+        touches = self.activity.drain()
+        if not touches:
+            return 0
         try:
-            user = session.query(User).filter(User.telegram_id == str(telegram_id)).first()
-            if user:
-                # تحديث آخر نشاط
-                user.last_activity = datetime.utcnow()
-                session.commit()
-            return user
-        finally:
-            session.close()
+            self.run(_flush_activity, touches)
+        except Exception:
+            self.activity.restore(touches)
+            raise
+        self.recipients.touch(touches)
+        return len(touches)
+    
+    def load_recipient_index(self):
+        """بناء فهرس مستلمي الرسائل الجماعية من قاعدة البيانات، وإرجاع عدد المستخدمين"""
+        self.recipients.load(*self.run(_load_recipient_index))
+        return len(self.recipients)
+    
+    def get_user_by_id(self, user_id):
+        """الحصول على مستخدم بواسطة ID"""
+        return self.run(_get_user_by_id, user_id)
+    
+    def find_user(self, identifier):
+        """البحث عن مستخدم بمعرف التليجرام أو اسم المستخدم"""
+        return self.run(_find_user, identifier)
+    
+    def register_referral(self, user_id, referral_code):
+        """تسجيل إحالة مستخدم جديد"""
+        return self.run(_register_referral, user_id, referral_code)
             
     def update_user_balance(self, telegram_id, amount, transaction_type="manual", description="", method=None):
         """تحديث رصيد المستخدم"""
-        session = self.get_session()
-        try:
-            user = session.query(User).filter(User.telegram_id == str(telegram_id)).first()
-            if user:
-                user.balance += amount
-                
-                # إضافة معاملة
-                transaction = Transaction(
-                    user_id=user.id,
-                    transaction_type=transaction_type,
-                    amount=amount,
-                    method=method,
-                    status="completed",
-                    description=description
-                )
-                session.add(transaction)
-                session.commit()
-                return True
-            return False
-        finally:
-            session.close()
+        return self.run(_update_user_balance, telegram_id, amount, transaction_type, description, method)
+    
+    def credit(self, user_id, amount, transaction_type, description=None, method=None):
+        """إضافة رصيد ذرياً، وإرجاع الرصيد الجديد"""
+        return self.run(_credit, user_id, amount, transaction_type, description, method)
+    
+    def debit(self, user_id, amount, transaction_type, description=None, method=None):
+        """خصم رصيد ذرياً إذا كان كافياً، وإرجاع الرصيد الجديد أو None"""
+        return self.run(_debit, user_id, amount, transaction_type, description, method)
+    
+    def transfer(self, sender_id, receiver_id, amount, transaction_type="transfer", description=None):
+        """تحويل رصيد ذرياً، وإرجاع رصيد المرسل الجديد أو None"""
+        return self.run(_transfer, sender_id, receiver_id, amount, transaction_type, description)
     
     def add_bet(self, user_id, game_type, bet_amount, game_category=None, game_name=None, odds=None, bet_details=None):
         """إضافة رهان جديد"""
-        session = self.get_session()
-        try:
-            bet = Bet(
-                user_id=user_id,
-                game_type=game_type,
-                game_category=game_category,
-                game_name=game_name,
-                bet_amount=bet_amount,
-                odds=odds,
-                bet_details=bet_details
-            )
-            session.add(bet)
-            session.commit()
-            session.refresh(bet)
-            return bet
-        finally:
-            session.close()
+        return self.run(_add_bet, user_id, game_type, bet_amount, game_category, game_name, odds, bet_details)
     
-    def settle_bet(self, bet_id, status, actual_win=0.0):
+    def settle_bet(self, bet_id, status, actual_win=0):
         """تسوية الرهان"""
-        session = self.get_session()
-        try:
-            bet = session.query(Bet).filter(Bet.id == bet_id).first()
-            if bet:
-                bet.status = status
-                bet.actual_win = actual_win
-                bet.settled_at = datetime.utcnow()
-                
-                # تحديث رصيد المستخدم إذا فاز
-                if status == 'won' and actual_win > 0:
-                    user = session.query(User).filter(User.id == bet.user_id).first()
-                    if user:
-                        user.balance += actual_win
-                        user.total_wins += actual_win
-                        
-                        # إضافة معاملة الفوز
-                        transaction = Transaction(
-                            user_id=user.id,
-                            transaction_type='bet_win',
-                            amount=actual_win,
-                            status='completed',
-                            description=f'فوز في {bet.game_name or bet.game_type}'
-                        )
-                        session.add(transaction)
-                
-                # تحديث إجمالي الرهانات
-                user = session.query(User).filter(User.id == bet.user_id).first()
-                if user:
-                    user.total_bets += bet.bet_amount
-                
-                session.commit()
-                return True
-            return False
-        finally:
-            session.close()
+        return self.run(_settle_bet, bet_id, status, actual_win)
     
-    def add_jackpot_contribution(self, user_id, bet_id, contribution_amount):
+    def ingest_bets(self, bets):
+        """إدخال دفعة رهانات خارجية مع تجاهل المكررة حسب ichancy_bet_id"""
+        return self.run(_ingest_bets, list(bets))
+    
+    def settle_bets(self, settlements):
+        """تسوية دفعة رهانات (bet_id, status, actual_win)، وإرجاع فروقات كل مستخدم"""
+        return self.run(_settle_bets, list(settlements))
+    
+    def add_jackpot_contribution(self, user_id, bet_id, contribution_amount, pool_id=DAILY_JACKPOT_POOL):
         """إضافة مساهمة في الجاكبوت"""
-        session = self.get_session()
-        try:
-            # تحديد معرف مجموعة الجاكبوت (يومي)
-            today = datetime.utcnow().date()
-            jackpot_pool_id = f"daily_{today.strftime('%Y%m%d')}"
-            
-            entry = JackpotEntry(
-                user_id=user_id,
-                bet_id=bet_id,
-                contribution_amount=contribution_amount,
-                jackpot_pool_id=jackpot_pool_id
-            )
-            session.add(entry)
-            
-            # إضافة معاملة المساهمة
-            transaction = Transaction(
-                user_id=user_id,
-                transaction_type='jackpot_contribution',
-                amount=contribution_amount,
-                status='completed',
-                description=f'مساهمة في الجاكبوت اليومي'
-            )
-            session.add(transaction)
-            
-            session.commit()
-            return True
-        finally:
-            session.close()
+        return self.run(_add_jackpot_contribution, user_id, bet_id, contribution_amount, pool_id)
     
-    def get_current_jackpot(self):
+    def get_current_jackpot(self, pool_id=DAILY_JACKPOT_POOL):
         """الحصول على قيمة الجاكبوت الحالية"""
-        session = self.get_session()
+        return self.run(_get_current_jackpot, pool_id)
+    
+    def add_jackpot_contributions(self, contributions, pool_id=DAILY_JACKPOT_POOL):
+        """إضافة دفعة مساهمات (user_id, bet_id, amount) في معاملة واحدة"""
+        return self.run(_add_jackpot_contributions, list(contributions), pool_id)
+    
+    def flush_jackpot_contributions(self):
+        """كتابة مساهمات الجاكبوت المتراكمة دفعة واحدة، وإرجاع عدد المكتوب"""
+        contributions = self.jackpot.drain()
+        if not contributions:
+            return 0
         try:
-            today = datetime.utcnow().date()
-            jackpot_pool_id = f"daily_{today.strftime('%Y%m%d')}"
-            
-            total = session.query(func.sum(JackpotEntry.contribution_amount)).filter(
-                JackpotEntry.jackpot_pool_id == jackpot_pool_id
-            ).scalar() or 0
-            
-            return total
-        finally:
-            session.close()
+            return self.run(_flush_jackpot_contributions, contributions)
+        except Exception:
+            self.jackpot.restore(contributions)
+            raise
+    
+    def reconcile_jackpot_pools(self, fix=False):
+        """مقارنة إجماليات الجاكبوت بسجلات المساهمات وتصحيحها اختيارياً"""
+        return self.run(_reconcile_jackpot_pools, fix)
     
     def get_user_betting_stats(self, user_id):
         """الحصول على إحصائيات رهانات المستخدم"""
-        session = self.get_session()
-        try:
-            stats = {
-                'total_bets': 0,
-                'total_wins': 0,
-                'total_losses': 0,
-                'win_rate': 0,
-                'biggest_win': 0,
-                'recent_bets': []
-            }
-            
-            # إجمالي الرهانات
-            total_bet_amount = session.query(func.sum(Bet.bet_amount)).filter(
-                Bet.user_id == user_id
-            ).scalar() or 0
-            
-            # إجمالي الأرباح
-            total_win_amount = session.query(func.sum(Bet.actual_win)).filter(
-                Bet.user_id == user_id,
-                Bet.status == 'won'
-            ).scalar() or 0
-            
-            # عدد الرهانات الفائزة والخاسرة
-            won_bets = session.query(Bet).filter(
-                Bet.user_id == user_id,
-                Bet.status == 'won'
-            ).count()
-            
-            lost_bets = session.query(Bet).filter(
-                Bet.user_id == user_id,
-                Bet.status == 'lost'
-            ).count()
-            
-            total_settled_bets = won_bets + lost_bets
-            
-            # أكبر فوز
-            biggest_win = session.query(func.max(Bet.actual_win)).filter(
-                Bet.user_id == user_id,
-                Bet.status == 'won'
-            ).scalar() or 0
-            
-            # آخر الرهانات
-            recent_bets = session.query(Bet).filter(
-                Bet.user_id == user_id
-            ).order_by(Bet.placed_at.desc()).limit(10).all()
-            
-            stats.update({
-                'total_bets': total_bet_amount,
-                'total_wins': total_win_amount,
-                'total_losses': total_bet_amount - total_win_amount,
-                'win_rate': (won_bets / total_settled_bets * 100) if total_settled_bets > 0 else 0,
-                'biggest_win': biggest_win,
-                'recent_bets': recent_bets
-            })
-            
-            return stats
-        finally:
-            session.close()
+        return self.run(_get_user_betting_stats, user_id)
+    
+    def get_recent_bets(self, user_id, limit=10, before=None):
+        """آخر رهانات المستخدم (before = (placed_at, id) للصفحة التالية)"""
+        return self.run(_get_recent_bets, user_id, limit, before)
+    
+    def rebuild_betting_stats(self):
+        """إعادة حساب إحصائيات الرهانات من جدول الرهانات"""
+        return self.run(_rebuild_betting_stats)
+    
+    def verify_betting_stats(self):
+        """مقارنة إحصائيات الرهانات المخزنة بالمحسوبة"""
+        return self.run(_verify_betting_stats)
     
     def update_vip_level(self, user_id):
         """تحديث مستوى VIP للمستخدم"""
-        session = self.get_session()
-        try:
-            user = session.query(User).filter(User.id == user_id).first()
-            if user:
-                from config import Config
-                level_id, level_info = Config.get_vip_level(user.total_bets)
-                
-                old_level = user.vip_level
-                user.vip_level = level_id
-                
-                session.commit()
-                
-                # إرجاع True إذا تم الترقية
-                return old_level != level_id
-            return False
-        finally:
-            session.close()
+        return self.run(_update_vip_level, user_id)
     
     def log_system_event(self, log_type, module, message, user_id=None):
         """تسجيل حدث في النظام"""
-        session = self.get_session()
-        try:
-            log = SystemLog(
-                log_type=log_type,
-                module=module,
-                message=message,
-                user_id=user_id
-            )
-            session.add(log)
-            session.commit()
-        finally:
-            session.close()
+        return self.run(_log_system_event, log_type, module, message, user_id)
 
+class AsyncDatabaseManager:
+    """مدير قاعدة البيانات غير المتزامن
+    
+    يستخدم محركاً غير متزامن (aiosqlite لقاعدة SQLite الافتراضية) حتى لا
+    تُوقف عمليات قاعدة البيانات حلقة الأحداث أثناء معالجة تحديثات المستخدمين.
+    """
+    
+    def __init__(self, database_url=None):
+        self.engine = get_async_engine(database_url)
+        self.user_cache = get_user_cache(database_url)
+        self.recipients = get_recipient_index(database_url)
+        self.SessionLocal = sessionmaker(
+            self.engine, class_=AsyncSession, autoflush=False, expire_on_commit=False,
+            info={'user_cache': self.user_cache, 'recipient_index': self.recipients}
+        )
+        self.func = func  # إضافة func للاستعلامات المتقدمة
+        self.activity = ActivityTracker()
+        self.jackpot = JackpotBuffer()
+    
+    async def create_tables(self):
+        """إنشاء الجداول وصفوف مجموعات الجاكبوت (بعد التأكد من تحويل أعمدة المبالغ)"""
+        async with self.engine.begin() as connection:
+            await connection.run_sync(_check_money_columns)
+            await connection.run_sync(Base.metadata.create_all)
+            await connection.run_sync(_seed_jackpot_pools)
+    
+    def get_session(self):
+        """الحصول على جلسة قاعدة بيانات غير متزامنة"""
+        return self.SessionLocal()
+    
+    async def run(self, operation, *args, **kwargs):
+        """تنفيذ عملية متزامنة الكتابة على جلسة غير متزامنة
+        
+        تستقبل العملية جلسة عادية (Session) كأول معامل، ويتم تنفيذها عبر
+        AsyncSession.run_sync دون حجز حلقة الأحداث أثناء انتظار قاعدة البيانات.
+        """
+        async with self.get_session() as session:
+            return await session.run_sync(operation, *args, **kwargs)
+    
+    def generate_referral_code(self):
+        """توليد كود إحالة فريد"""
+        return _generate_referral_code()
+    
+    async def create_user(self, telegram_id, username=None, first_name=None, last_name=None):
+        """إنشاء مستخدم جديد"""
+        return await self.run(_create_user, telegram_id, username, first_name, last_name)
+    
+    async def get_user(self, telegram_id):
+        """الحصول على نسخة المستخدم بواسطة telegram_id (من الذاكرة المؤقتة إن وجدت)"""
+        self.activity.touch(telegram_id)
+        snapshot = self.user_cache.get(telegram_id)
+        if snapshot is None:
+            generation = self.user_cache.generation
+            user = await self.run(_get_user, telegram_id)
+            snapshot = self.user_cache.put(user, generation) if user else None
+        return snapshot
+    
+    async def flush_activity(self):
+        """كتابة آخر نشاط المتراكم في قاعدة البيانات، وإرجاع عدد المستخدمين"""
+        touches = self.activity.drain()
+        if not touches:
+            return 0
+        try:
+            await self.run(_flush_activity, touches)
+        except Exception:
+            self.activity.restore(touches)
+            raise
+        self.recipients.touch(touches)
+        return len(touches)
+    
+    async def load_recipient_index(self):
+        """بناء فهرس مستلمي الرسائل الجماعية من قاعدة البيانات، وإرجاع عدد المستخدمين"""
+        self.recipients.load(*(await self.run(_load_recipient_index)))
+        return len(self.recipients)
+    
+    async def get_user_by_id(self, user_id):
+        """الحصول على مستخدم بواسطة ID"""
+        return await self.run(_get_user_by_id, user_id)
+    
+    async def find_user(self, identifier):
+        """البحث عن مستخدم بمعرف التليجرام أو اسم المستخدم"""
+        return await self.run(_find_user, identifier)
+    
+    async def register_referral(self, user_id, referral_code):
+        """تسجيل إحالة مستخدم جديد"""
+        return await self.run(_register_referral, user_id, referral_code)
+    
+    async def update_user_balance(self, telegram_id, amount, transaction_type="manual", description="", method=None):
+        """تحديث رصيد المستخدم"""
+        return await self.run(_update_user_balance, telegram_id, amount, transaction_type, description, method)
+    
+    async def credit(self, user_id, amount, transaction_type, description=None, method=None):
+        """إضافة رصيد ذرياً، وإرجاع الرصيد الجديد"""
+        return await self.run(_credit, user_id, amount, transaction_type, description, method)
+    
+    async def debit(self, user_id, amount, transaction_type, description=None, method=None):
+        """خصم رصيد ذرياً إذا كان كافياً، وإرجاع الرصيد الجديد أو None"""
+        return await self.run(_debit, user_id, amount, transaction_type, description, method)
+    
+    async def transfer(self, sender_id, receiver_id, amount, transaction_type="transfer", description=None):
+        """تحويل رصيد ذرياً، وإرجاع رصيد المرسل الجديد أو None"""
+        return await self.run(_transfer, sender_id, receiver_id, amount, transaction_type, description)
+    
+    async def add_bet(self, user_id, game_type, bet_amount, game_category=None, game_name=None, odds=None, bet_details=None):
+        """إضافة رهان جديد"""
+        return await self.run(_add_bet, user_id, game_type, bet_amount, game_category, game_name, odds, bet_details)
+    
+    async def settle_bet(self, bet_id, status, actual_win=0):
+        """تسوية الرهان"""
+        return await self.run(_settle_bet, bet_id, status, actual_win)
+    
+    async def ingest_bets(self, bets):
+        """إدخال دفعة رهانات خارجية مع تجاهل المكررة حسب ichancy_bet_id"""
+        return await self.run(_ingest_bets, list(bets))
+    
+    async def settle_bets(self, settlements):
+        """تسوية دفعة رهانات (bet_id, status, actual_win)، وإرجاع فروقات كل مستخدم"""
+        return await self.run(_settle_bets, list(settlements))
+    
+    async def add_jackpot_contribution(self, user_id, bet_id, contribution_amount, pool_id=DAILY_JACKPOT_POOL):
+        """إضافة مساهمة في الجاكبوت"""
+        return await self.run(_add_jackpot_contribution, user_id, bet_id, contribution_amount, pool_id)
+    
+    async def get_current_jackpot(self, pool_id=DAILY_JACKPOT_POOL):
+        """الحصول على قيمة الجاكبوت الحالية"""
+        return await self.run(_get_current_jackpot, pool_id)
+    
+    async def add_jackpot_contributions(self, contributions, pool_id=DAILY_JACKPOT_POOL):
+        """إضافة دفعة مساهمات (user_id, bet_id, amount) في معاملة واحدة"""
+        return await self.run(_add_jackpot_contributions, list(contributions), pool_id)
+    
+    async def flush_jackpot_contributions(self):
+        """كتابة مساهمات الجاكبوت المتراكمة دفعة واحدة، وإرجاع عدد المكتوب"""
+        contributions = self.jackpot.drain()
+        if not contributions:
+            return 0
+        try:
+            return await self.run(_flush_jackpot_contributions, contributions)
+        except Exception:
+            self.jackpot.restore(contributions)
+            raise
+    
+    async def reconcile_jackpot_pools(self, fix=False):
+        """مقارنة إجماليات الجاكبوت بسجلات المساهمات وتصحيحها اختيارياً"""
+        return await self.run(_reconcile_jackpot_pools, fix)
+    
+    async def get_user_betting_stats(self, user_id):
+        """الحصول على إحصائيات رهانات المستخدم"""
+        return await self.run(_get_user_betting_stats, user_id)
+    
+    async def get_recent_bets(self, user_id, limit=10, before=None):
+        """آخر رهانات المستخدم (before = (placed_at, id) للصفحة التالية)"""
+        return await self.run(_get_recent_bets, user_id, limit, before)
+    
+    async def rebuild_betting_stats(self):
+        """إعادة حساب إحصائيات الرهانات من جدول الرهانات"""
+        return await self.run(_rebuild_betting_stats)
+    
+    async def verify_betting_stats(self):
+        """مقارنة إحصائيات الرهانات المخزنة بالمحسوبة"""
+        return await self.run(_verify_betting_stats)
+    
+    async def update_vip_level(self, user_id):
+        """تحديث مستوى VIP للمستخدم"""
+        return await self.run(_update_vip_level, user_id)
+    
+    async def log_system_event(self, log_type, module, message, user_id=None):
+        """تسجيل حدث في النظام"""
+        return await self.run(_log_system_event, log_type, module, message, user_id)
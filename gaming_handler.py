@@ -4,18 +4,104 @@
 
 import logging
 import random
-from datetime import datetime, timedelta
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.error import TelegramError
 
-from database import DatabaseManager, User, Transaction
+from sqlalchemy import func
+
+from database import (
+    get_async_database, BalanceLedger, JackpotLedger, User, Transaction, JackpotEntry, JackpotWin, JackpotPool,
+    to_money, DAILY_JACKPOT_POOL
+)
 from config import Config
 from keyboards import Keyboards
+from outbound import TRANSACTIONAL_LANE
+from catalog import get_catalog_service
 from utils import format_currency, get_user_display_name
 
 logger = logging.getLogger(__name__)
-db = DatabaseManager()
+db = get_async_database()
+catalog = get_catalog_service()
+
+BET_TRANSACTION_TYPES = ['bet_win', 'bet_loss', 'casino_win', 'casino_loss']
+
+def _get_jackpot_overview(session):
+    """قيم مجموعات الجاكبوت المفعلة وآخر فائز"""
+    pool_ids = list(Config.get_jackpot_pools())
+    totals = dict(session.query(JackpotPool.pool_id, JackpotPool.current_amount).filter(
+        JackpotPool.pool_id.in_(pool_ids)
+    ).all())
+    current_jackpots = {pool_id: totals.get(pool_id, to_money(0)) for pool_id in pool_ids}
+    
+    last_win = session.query(Transaction, User).join(User, User.id == Transaction.user_id).filter(
+        Transaction.transaction_type == 'jackpot_win'
+    ).order_by(Transaction.created_at.desc()).first()
+    
+    return current_jackpots, last_win
+
+def _get_recent_bet_transactions(session, user_id, limit=10):
+    """آخر معاملات الرهان للمستخدم"""
+    return session.query(Transaction).filter(
+        Transaction.user_id == user_id,
+        Transaction.transaction_type.in_(BET_TRANSACTION_TYPES)
+    ).order_by(Transaction.created_at.desc()).limit(limit).all()
+
+def _get_total_bets(session, user_id):
+    """إجمالي مبالغ رهانات المستخدم"""
+    return session.query(func.sum(Transaction.amount)).filter(
+        Transaction.user_id == user_id,
+        Transaction.transaction_type.in_(BET_TRANSACTION_TYPES)
+    ).scalar() or 0
+
+def _draw_jackpot(session, pool_id=DAILY_JACKPOT_POOL, rng=random):
+    """تنفيذ سحب مرجح للجاكبوت، وإرجاع (الفائز، المبلغ) أو (None, 0)"""
+    definition = Config.JACKPOT_POOL_DEFINITIONS.get(pool_id, {})
+    min_amount = definition.get('min_amount', Config.MIN_JACKPOT)
+    
+    pool = session.get(JackpotPool, pool_id)
+    if pool is None or pool.current_amount < min_amount:
+        return None, 0  # لا يوجد جاكبوت كافي
+    
+    # تثبيت حدود الجولة: المساهمات بعد هذه اللحظة تدخل الجولة التالية
+    after_entry_id = pool.drawn_through_entry_id
+    through_entry_id = session.query(func.max(JackpotEntry.id)).filter(
+        JackpotEntry.jackpot_pool_id == pool_id,
+        JackpotEntry.id > after_entry_id
+    ).scalar()
+    if through_entry_id is None:
+        return None, 0  # لا يوجد مشاركين
+    
+    winner_id, jackpot_amount, participants_count, entries_count = JackpotLedger.pick_winner(
+        session, pool_id, after_entry_id, through_entry_id, rng
+    )
+    if winner_id is None or jackpot_amount < min_amount:
+        return None, 0
+    
+    # إغلاق الجولة، وإلغاء السحب إذا سبقه سحب آخر
+    if not JackpotLedger.close_round(session, pool_id, jackpot_amount, entries_count, after_entry_id, through_entry_id):
+        session.rollback()
+        return None, 0
+    
+    # إضافة الجاكبوت للفائز مع تسجيل الفوز
+    win_transaction = Transaction(
+        user_id=winner_id,
+        transaction_type='jackpot_win',
+        amount=-jackpot_amount,  # سالب لأنه خرج من الجاكبوت
+        status='completed',
+        description=f"فوز ب{definition.get('name', 'الجاكبوت')}"
+    )
+    BalanceLedger.credit(session, winner_id, jackpot_amount, win_transaction)
+    session.add(JackpotWin(
+        user_id=winner_id,
+        jackpot_pool_id=pool_id,
+        win_amount=jackpot_amount,
+        total_pool=jackpot_amount,
+        participants_count=participants_count
+    ))
+    
+    session.commit()
+    return session.get(User, winner_id), jackpot_amount
 
 class GamingHandler:
     """فئة معالج الألعاب والجاكبوت"""
@@ -23,28 +109,23 @@ class GamingHandler:
     @staticmethod
     async def jackpot_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """قائمة الجاكبوت الرئيسية"""
-        session = db.get_session()
-        try:
-            # الحصول على قيمة الجاكبوت الحالية
-            current_jackpot = session.query(db.func.sum(Transaction.amount)).filter(
-                Transaction.transaction_type == 'jackpot_contribution',
-                Transaction.status == 'completed'
-            ).scalar() or 0
-            
-            # آخر فائز بالجاكبوت
-            last_winner = session.query(Transaction).filter(
-                Transaction.transaction_type == 'jackpot_win'
-            ).order_by(Transaction.created_at.desc()).first()
-            
-            last_winner_info = ""
-            if last_winner:
-                winner_user = session.query(User).filter(User.id == last_winner.user_id).first()
-                last_winner_info = f"\n🏆 آخر فائز: {get_user_display_name(winner_user)}\n💰 المبلغ: {format_currency(abs(last_winner.amount))}\n📅 التاريخ: {last_winner.created_at.strftime('%Y-%m-%d')}"
-            
-            message = f"""
+        # الحصول على قيمة الجاكبوت الحالية وآخر فائز بالجاكبوت
+        current_jackpots, last_win = await db.run(_get_jackpot_overview)
+        pools = Config.get_jackpot_pools()
+        jackpots_info = "\n".join(
+            f"💎 {pools[pool_id]['name']}: {format_currency(amount)}"
+            for pool_id, amount in current_jackpots.items()
+        )
+        
+        last_winner_info = ""
+        if last_win:
+            last_winner, winner_user = last_win
+            last_winner_info = f"\n🏆 آخر فائز: {get_user_display_name(winner_user)}\n💰 المبلغ: {format_currency(abs(last_winner.amount))}\n📅 التاريخ: {last_winner.created_at.strftime('%Y-%m-%d')}"
+        
+        message = f"""
 🎲 الجاكبوت - ichancy.com
 
-💎 قيمة الجاكبوت الحالية: {format_currency(current_jackpot)}
+{jackpots_info}
 
 🎯 كيف تلعب:
 • ادخل إلى موقع ichancy.com
@@ -59,176 +140,148 @@ class GamingHandler:
 {last_winner_info}
 
 🔗 العب الآن على ichancy.com
-            """
-            
-            if update.callback_query:
-                await update.callback_query.edit_message_text(
-                    message,
-                    reply_markup=Keyboards.jackpot_menu()
-                )
-            else:
-                await update.message.reply_text(
-                    message,
-                    reply_markup=Keyboards.jackpot_menu()
-                )
-        finally:
-            session.close()
+        """
+        
+        if update.callback_query:
+            await update.callback_query.edit_message_text(
+                message,
+                reply_markup=Keyboards.jackpot_menu()
+            )
+        else:
+            await update.message.reply_text(
+                message,
+                reply_markup=Keyboards.jackpot_menu()
+            )
     
     @staticmethod
     async def betting_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """سجل الرهانات"""
-        user = db.get_user(update.effective_user.id)
+        user = await db.get_user(update.effective_user.id)
         
-        session = db.get_session()
-        try:
-            # الحصول على رهانات المستخدم
-            bets = session.query(Transaction).filter(
-                Transaction.user_id == user.id,
-                Transaction.transaction_type.in_(['bet_win', 'bet_loss', 'casino_win', 'casino_loss'])
-            ).order_by(Transaction.created_at.desc()).limit(10).all()
-            
-            if not bets:
-                message = """
+        # الحصول على رهانات المستخدم
+        bets = await db.run(_get_recent_bet_transactions, user.id)
+        
+        if not bets:
+            message = """
 📜 سجل الرهانات
 
 ❌ لا توجد رهانات مسجلة حتى الآن
 
 🎯 ابدأ اللعب على ichancy.com لتسجيل رهاناتك هنا!
-                """
-            else:
-                message = "📜 سجل الرهانات\n\n"
-                
-                total_wins = 0
-                total_losses = 0
+            """
+        else:
+            message = "📜 سجل الرهانات\n\n"
+            
+            total_wins = 0
+            total_losses = 0
+            
+            for i, bet in enumerate(bets, 1):
+                bet_type = "🏆 فوز" if "win" in bet.transaction_type else "❌ خسارة"
+                game_type = "🎰 كازينو" if "casino" in bet.transaction_type else "⚽ رياضة"
                 
-                for i, bet in enumerate(bets, 1):
-                    bet_type = "🏆 فوز" if "win" in bet.transaction_type else "❌ خسارة"
-                    game_type = "🎰 كازينو" if "casino" in bet.transaction_type else "⚽ رياضة"
-                    
-                    if "win" in bet.transaction_type:
-                        total_wins += bet.amount
-                    else:
-                        total_losses += abs(bet.amount)
-                    
-                    message += f"{i}. {game_type} {bet_type}\n"
-                    message += f"💰 {format_currency(abs(bet.amount))}\n"
-                    message += f"📅 {bet.created_at.strftime('%Y-%m-%d %H:%M')}\n"
-                    if bet.description:
-                        message += f"📝 {bet.description}\n"
-                    message += "\n"
+                if "win" in bet.transaction_type:
+                    total_wins += bet.amount
+                else:
+                    total_losses += abs(bet.amount)
                 
-                # إحصائيات
-                net_result = total_wins - total_losses
-                message += f"📊 الإحصائيات:\n"
-                message += f"🏆 إجمالي الأرباح: {format_currency(total_wins)}\n"
-                message += f"❌ إجمالي الخسائر: {format_currency(total_losses)}\n"
-                message += f"📈 النتيجة الصافية: {format_currency(net_result)}\n"
+                message += f"{i}. {game_type} {bet_type}\n"
+                message += f"💰 {format_currency(abs(bet.amount))}\n"
+                message += f"📅 {bet.created_at.strftime('%Y-%m-%d %H:%M')}\n"
+                if bet.description:
+                    message += f"📝 {bet.description}\n"
+                message += "\n"
             
-            if update.callback_query:
-                await update.callback_query.edit_message_text(
-                    message,
-                    reply_markup=Keyboards.betting_history_menu()
-                )
-            else:
-                await update.message.reply_text(
-                    message,
-                    reply_markup=Keyboards.betting_history_menu()
-                )
-        finally:
-            session.close()
-    
-    @staticmethod
-    async def casino_games(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """ألعاب الكازينو"""
-        message = """
-🎰 ألعاب الكازينو - ichancy.com
-
-🌟 الألعاب المتاحة:
-
-🎲 **الألعاب السريعة:**
-• Crash - تحدي التوقيت المثالي
-• Dice - خمن الرقم التالي
-• Wheel - عجلة الحظ
-• Mines - تجنب الألغام
-
-🃏 **ألعاب الطاولة:**
-• Blackjack - 21
-• Roulette - الروليت
-• Baccarat - الباكارات
-• Poker - البوكر
-
-🎰 **ماكينات القمار:**
-• Slots - مئات الألعاب
-• Megaways - فوز ضخم
-• Progressive - جاكبوت متراكم
-
-🎪 **الكازينو المباشر:**
-• موزعين حقيقيين
-• بث مباشر عالي الجودة
-• تفاعل مع اللاعبين
-
-🔗 العب الآن على ichancy.com
-        """
+            # إحصائيات
+            net_result = total_wins - total_losses
+            message += f"📊 الإحصائيات:\n"
+            message += f"🏆 إجمالي الأرباح: {format_currency(total_wins)}\n"
+            message += f"❌ إجمالي الخسائر: {format_currency(total_losses)}\n"
+            message += f"📈 النتيجة الصافية: {format_currency(net_result)}\n"
         
         if update.callback_query:
             await update.callback_query.edit_message_text(
                 message,
-                reply_markup=Keyboards.casino_games_menu()
+                reply_markup=Keyboards.betting_history_menu()
             )
         else:
             await update.message.reply_text(
                 message,
-                reply_markup=Keyboards.casino_games_menu()
+                reply_markup=Keyboards.betting_history_menu()
             )
     
+    @staticmethod
+    async def casino_games(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """ألعاب الكازينو"""
+        await GamingHandler._show_catalog_categories(update, "casino", "🔗 العب الآن على ichancy.com")
+    
     @staticmethod
     async def sports_betting(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """الرهانات الرياضية"""
-        message = """
-⚽ الرهانات الرياضية - ichancy.com
-
-🏆 **الرياضات المتاحة:**
-
-⚽ **كرة القدم:**
-• الدوريات الأوروبية
-• كأس العالم
-• دوري أبطال أوروبا
-• الدوريات المحلية
-
-🏀 **كرة السلة:**
-• NBA
-• EuroLeague
-• الدوريات المحلية
-
-🎾 **التنس:**
-• بطولات الجراند سلام
-• ATP & WTA Tours
-
-🏈 **رياضات أخرى:**
-• كرة القدم الأمريكية
-• الهوكي
-• البيسبول
-• الملاكمة
-
-📊 **أنواع الرهانات:**
-• نتيجة المباراة
-• عدد الأهداف
-• الهداف الأول
-• رهانات مباشرة
-
-🔗 راهن الآن على ichancy.com
-        """
+        await GamingHandler._show_catalog_categories(update, "sports", "🔗 راهن الآن على ichancy.com")
+    
+    @staticmethod
+    async def _show_catalog_categories(update: Update, game_type, footer):
+        """عرض فئات الكتالوج من النسخة الحالية في الذاكرة"""
+        snapshot = catalog.snapshot
+        game = Config.GAME_TYPES[game_type]
+        counts = snapshot.category_counts(game_type)
         
+        lines = [f"{game['emoji']} {game['name']} - ichancy.com", ""]
+        lines.extend(f"• {game['categories'][category]}: {count}" for category, count in counts.items())
+        if snapshot.fetched_at:
+            lines.append(f"\n🕒 آخر تحديث: {snapshot.fetched_at.strftime('%H:%M')}")
+        lines.append(f"\n{footer}")
+        
+        message = "\n".join(lines)
+        keyboard = Keyboards.catalog_categories_menu(game_type, counts)
         if update.callback_query:
-            await update.callback_query.edit_message_text(
-                message,
-                reply_markup=Keyboards.sports_betting_menu()
-            )
+            await update.callback_query.edit_message_text(message, reply_markup=keyboard)
         else:
-            await update.message.reply_text(
-                message,
-                reply_markup=Keyboards.sports_betting_menu()
-            )
+            await update.message.reply_text(message, reply_markup=keyboard)
+    
+    @staticmethod
+    def _format_catalog_item(game_type, item):
+        """سطر عرض لعبة أو حدث رياضي"""
+        if game_type == "casino":
+            provider = f" - {item['provider']}" if item.get("provider") else ""
+            return f"• {item.get('name', '')}{provider}"
+        
+        line = f"• {item.get('home', '')} - {item.get('away', '')}"
+        odds = item.get("odds") or {}
+        if odds:
+            line += "\n   " + " | ".join(f"{label}: {odds[key]}" for key, label in (("home", "1"), ("draw", "X"), ("away", "2")) if key in odds)
+        if item.get("starts_at"):
+            line += f"\n   🕒 {item['starts_at']}"
+        return line
+    
+    @staticmethod
+    async def catalog_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """صفحة من فئة في الكتالوج (catalog:<نوع اللعبة>:<الفئة>:<الصفحة>)"""
+        query = update.callback_query
+        await query.answer()
+        
+        try:
+            _, game_type, category, page = query.data.split(":")
+            category_name = Config.GAME_TYPES[game_type]["categories"][category]
+            page = int(page)
+        except (ValueError, KeyError):
+            return
+        
+        items, page, pages = catalog.get_page(game_type, category, page)
+        if items:
+            body = "\n".join(GamingHandler._format_catalog_item(game_type, item) for item in items)
+        else:
+            body = "لا توجد عناصر متاحة حالياً في هذه الفئة"
+        
+        await query.edit_message_text(
+            f"{Config.GAME_TYPES[game_type]['emoji']} {category_name}\n\n{body}",
+            reply_markup=Keyboards.catalog_page(game_type, category, page, pages)
+        )
+    
+    @staticmethod
+    async def refresh_catalog(context: ContextTypes.DEFAULT_TYPE):
+        """تحديث الكتالوج من ichancy (مجدول)"""
+        await catalog.refresh()
     
     @staticmethod
     async def promotions_bonuses(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -282,52 +335,47 @@ class GamingHandler:
     @staticmethod
     async def vip_program(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """برنامج VIP"""
-        user = db.get_user(update.effective_user.id)
+        user = await db.get_user(update.effective_user.id)
         
         # حساب مستوى VIP بناءً على إجمالي الرهانات
-        session = db.get_session()
-        try:
-            total_bets = session.query(db.func.sum(Transaction.amount)).filter(
-                Transaction.user_id == user.id,
-                Transaction.transaction_type.in_(['bet_win', 'bet_loss', 'casino_win', 'casino_loss'])
-            ).scalar() or 0
-            
-            # تحديد مستوى VIP
-            if total_bets >= 100000:
-                vip_level = "💎 Diamond"
-                benefits = "• مدير حساب شخصي\n• مكافآت حصرية يومية\n• حدود سحب عالية\n• دعوات لأحداث خاصة"
-            elif total_bets >= 50000:
-                vip_level = "🥇 Gold"
-                benefits = "• مكافآت أسبوعية\n• كاش باك 15%\n• دعم أولوية\n• حدود سحب مرتفعة"
-            elif total_bets >= 20000:
-                vip_level = "🥈 Silver"
-                benefits = "• مكافآت شهرية\n• كاش باك 10%\n• دعم سريع\n• مكافآت إضافية"
-            elif total_bets >= 5000:
-                vip_level = "🥉 Bronze"
-                benefits = "• مكافأة شهرية\n• كاش باك 5%\n• دعم محسن"
-            else:
-                vip_level = "🆕 مبتدئ"
-                benefits = "• مكافأة ترحيب\n• دعم عادي\n• العب أكثر للترقية!"
-            
-            # حساب النقاط للمستوى التالي
+        total_bets = await db.run(_get_total_bets, user.id)
+        
+        # تحديد مستوى VIP
+        if total_bets >= 100000:
+            vip_level = "💎 Diamond"
+            benefits = "• مدير حساب شخصي\n• مكافآت حصرية يومية\n• حدود سحب عالية\n• دعوات لأحداث خاصة"
+        elif total_bets >= 50000:
+            vip_level = "🥇 Gold"
+            benefits = "• مكافآت أسبوعية\n• كاش باك 15%\n• دعم أولوية\n• حدود سحب مرتفعة"
+        elif total_bets >= 20000:
+            vip_level = "🥈 Silver"
+            benefits = "• مكافآت شهرية\n• كاش باك 10%\n• دعم سريع\n• مكافآت إضافية"
+        elif total_bets >= 5000:
+            vip_level = "🥉 Bronze"
+            benefits = "• مكافأة شهرية\n• كاش باك 5%\n• دعم محسن"
+        else:
+            vip_level = "🆕 مبتدئ"
+            benefits = "• مكافأة ترحيب\n• دعم عادي\n• العب أكثر للترقية!"
+        
+        # حساب النقاط للمستوى التالي
+        next_level_points = 0
+        if total_bets < 5000:
+            next_level_points = 5000 - total_bets
+            next_level = "🥉 Bronze"
+        elif total_bets < 20000:
+            next_level_points = 20000 - total_bets
+            next_level = "🥈 Silver"
+        elif total_bets < 50000:
+            next_level_points = 50000 - total_bets
+            next_level = "🥇 Gold"
+        elif total_bets < 100000:
+            next_level_points = 100000 - total_bets
+            next_level = "💎 Diamond"
+        else:
+            next_level = "أقصى مستوى"
             next_level_points = 0
-            if total_bets < 5000:
-                next_level_points = 5000 - total_bets
-                next_level = "🥉 Bronze"
-            elif total_bets < 20000:
-                next_level_points = 20000 - total_bets
-                next_level = "🥈 Silver"
-            elif total_bets < 50000:
-                next_level_points = 50000 - total_bets
-                next_level = "🥇 Gold"
-            elif total_bets < 100000:
-                next_level_points = 100000 - total_bets
-                next_level = "💎 Diamond"
-            else:
-                next_level = "أقصى مستوى"
-                next_level_points = 0
-            
-            message = f"""
+        
+        message = f"""
 👑 برنامج VIP - ichancy.com
 
 🏆 **مستواك الحالي:** {vip_level}
@@ -338,14 +386,14 @@ class GamingHandler:
 
 📈 **التقدم للمستوى التالي:**
 """
-            
-            if next_level_points > 0:
-                message += f"🎯 المستوى التالي: {next_level}\n"
-                message += f"💪 تحتاج: {format_currency(next_level_points)} رهان إضافي\n"
-            else:
-                message += "🏆 لقد وصلت لأقصى مستوى!\n"
-            
-            message += f"""
+        
+        if next_level_points > 0:
+            message += f"🎯 المستوى التالي: {next_level}\n"
+            message += f"💪 تحتاج: {format_currency(next_level_points)} رهان إضافي\n"
+        else:
+            message += "🏆 لقد وصلت لأقصى مستوى!\n"
+        
+        message += f"""
 
 🌟 **كيفية كسب النقاط:**
 • كل رهان = نقاط VIP
@@ -353,20 +401,18 @@ class GamingHandler:
 • مستوى أعلى = مزايا أكثر
 
 🔗 ارتقِ بمستواك على ichancy.com
-            """
-            
-            if update.callback_query:
-                await update.callback_query.edit_message_text(
-                    message,
-                    reply_markup=Keyboards.vip_program_menu()
-                )
-            else:
-                await update.message.reply_text(
-                    message,
-                    reply_markup=Keyboards.vip_program_menu()
-                )
-        finally:
-            session.close()
+        """
+        
+        if update.callback_query:
+            await update.callback_query.edit_message_text(
+                message,
+                reply_markup=Keyboards.vip_program_menu()
+            )
+        else:
+            await update.message.reply_text(
+                message,
+                reply_markup=Keyboards.vip_program_menu()
+            )
     
     @staticmethod
     async def live_support(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -461,56 +507,24 @@ https://www.ichancy.com/
             )
     
     @staticmethod
-    async def daily_jackpot_draw(context: ContextTypes.DEFAULT_TYPE):
-        """سحب الجاكبوت اليومي (مجدول)"""
-        session = db.get_session()
+    async def jackpot_draw(context: ContextTypes.DEFAULT_TYPE):
+        """سحب مجموعة جاكبوت (مجدول، context.job.data = معرف المجموعة)"""
+        pool_id = context.job.data if context.job and context.job.data else DAILY_JACKPOT_POOL
+        pool_name = Config.JACKPOT_POOL_DEFINITIONS.get(pool_id, {}).get('name', 'الجاكبوت')
         try:
-            # الحصول على قيمة الجاكبوت
-            jackpot_amount = session.query(db.func.sum(Transaction.amount)).filter(
-                Transaction.transaction_type == 'jackpot_contribution',
-                Transaction.status == 'completed'
-            ).scalar() or 0
-            
-            if jackpot_amount < Config.MIN_JACKPOT:
-                return  # لا يوجد جاكبوت كافي
-            
-            # الحصول على جميع المشاركين في الجاكبوت
-            participants = session.query(User).join(Transaction).filter(
-                Transaction.transaction_type == 'jackpot_contribution',
-                Transaction.created_at >= datetime.now() - timedelta(days=1)
-            ).distinct().all()
-            
-            if not participants:
-                return  # لا يوجد مشاركين
+            # إدخال المساهمات المتراكمة في الذاكرة قبل إغلاق الجولة
+            await db.flush_jackpot_contributions()
             
-            # اختيار فائز عشوائي
-            winner = random.choice(participants)
-            
-            # إضافة الجاكبوت للفائز
-            winner.balance += jackpot_amount
-            
-            # تسجيل الفوز
-            win_transaction = Transaction(
-                user_id=winner.id,
-                transaction_type='jackpot_win',
-                amount=-jackpot_amount,  # سالب لأنه خرج من الجاكبوت
-                status='completed',
-                description=f'فوز بالجاكبوت اليومي'
-            )
-            session.add(win_transaction)
-            
-            # إعادة تعيين مساهمات الجاكبوت
-            session.query(Transaction).filter(
-                Transaction.transaction_type == 'jackpot_contribution'
-            ).update({'status': 'processed'})
-            
-            session.commit()
+            winner, jackpot_amount = await db.run(_draw_jackpot, pool_id)
+            if not winner:
+                return
             
             # إشعار الفائز
             try:
                 await context.bot.send_message(
                     chat_id=winner.telegram_id,
-                    text=f"🎉 مبروك! لقد فزت بالجاكبوت!\n💰 المبلغ: {format_currency(jackpot_amount)}\n🎲 تم إضافة المبلغ لرصيدك"
+                    text=f"🎉 مبروك! لقد فزت ب{pool_name}!\n💰 المبلغ: {format_currency(jackpot_amount)}\n🎲 تم إضافة المبلغ لرصيدك",
+                    rate_limit_args=TRANSACTIONAL_LANE
                 )
             except TelegramError:
                 logger.warning(f"لا يمكن إرسال إشعار الفوز للمستخدم {winner.telegram_id}")
@@ -520,42 +534,35 @@ https://www.ichancy.com/
                 try:
                     await context.bot.send_message(
                         chat_id=Config.ADMIN_IDS[0],
-                        text=f"🎲 سحب الجاكبوت اليومي\n🏆 الفائز: {get_user_display_name(winner)}\n💰 المبلغ: {format_currency(jackpot_amount)}"
+                        text=f"🎲 سحب {pool_name}\n🏆 الفائز: {get_user_display_name(winner)}\n💰 المبلغ: {format_currency(jackpot_amount)}",
+                        rate_limit_args=TRANSACTIONAL_LANE
                     )
                 except TelegramError:
                     logger.warning("لا يمكن إرسال إشعار الجاكبوت للإدمن")
             
-            logger.info(f"تم سحب الجاكبوت: الفائز {winner.telegram_id}, المبلغ {jackpot_amount}")
+            logger.info(f"تم سحب الجاكبوت {pool_id}: الفائز {winner.telegram_id}, المبلغ {jackpot_amount}")
             
         except Exception as e:
-            logger.error(f"خطأ في سحب الجاكبوت: {str(e)}")
-            session.rollback()
-        finally:
-            session.close()
+            logger.error(f"خطأ في سحب الجاكبوت {pool_id}: {str(e)}")
     
     @staticmethod
-    async def add_jackpot_contribution(user_id, bet_amount):
-        """إضافة مساهمة في الجاكبوت"""
-        contribution = bet_amount * Config.JACKPOT_CONTRIBUTION_RATE
+    async def add_jackpot_contribution(user_id, bet_amount, game_type=None, bet_id=None):
+        """إضافة مساهمة الرهان لكل مجموعات الجاكبوت المطابقة
         
-        session = db.get_session()
-        try:
-            user = session.query(User).filter(User.telegram_id == user_id).first()
-            if user:
-                contribution_transaction = Transaction(
-                    user_id=user.id,
-                    transaction_type='jackpot_contribution',
-                    amount=contribution,
-                    status='completed',
-                    description=f'مساهمة في الجاكبوت من رهان {format_currency(bet_amount)}'
-                )
-                session.add(contribution_transaction)
-                session.commit()
-                
-                logger.info(f"تمت إضافة مساهمة جاكبوت: المستخدم {user_id}, المبلغ {contribution}")
-        except Exception as e:
-            logger.error(f"خطأ في إضافة مساهمة الجاكبوت: {str(e)}")
-            session.rollback()
-        finally:
-            session.close()
-
+        تُجمع المساهمات في الذاكرة وتُكتب دفعة واحدة كل Config.JACKPOT_FLUSH_INTERVAL
+        ثانية، أو فوراً عند بلوغ Config.JACKPOT_BATCH_SIZE مساهمة.
+        """
+        await GamingHandler.add_jackpot_contributions([(user_id, bet_id, bet_amount, game_type)])
+    
+    @staticmethod
+    async def add_jackpot_contributions(bets):
+        """إضافة مساهمات دفعة رهانات (user_id, bet_id, bet_amount, game_type) لمجموعات الجاكبوت"""
+        full = False
+        for user_id, bet_id, bet_amount, game_type in bets:
+            full = db.jackpot.add_bet(user_id, bet_id, bet_amount, game_type) or full
+        
+        if full:
+            try:
+                await db.flush_jackpot_contributions()
+            except Exception as e:
+                logger.error(f"خطأ في كتابة مساهمات الجاكبوت: {str(e)}")
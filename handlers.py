@@ -3,14 +3,16 @@
 """
 
 import logging
+from sqlalchemy.exc import IntegrityError
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.error import TelegramError
 
-from database import DatabaseManager, User, Transaction
+from database import get_async_database, BalanceLedger, UnknownUserError, User, Transaction, Gift, GiftCode, GiftCodeUsage, Message
 from config import Config
 from keyboards import Keyboards
-from utils import format_currency, validate_amount, get_user_display_name
+from outbound import TRANSACTIONAL_LANE
+from utils import format_currency, validate_amount, parse_amount, get_user_display_name
 from payment_handler import PaymentHandler
 from referral_handler import ReferralHandler
 from admin_handler import AdminHandler
@@ -18,7 +20,7 @@ from contact_handler import ContactHandler
 from gaming_handler import GamingHandler
 
 logger = logging.getLogger(__name__)
-db = DatabaseManager()
+db = get_async_database()
 
 # حالات المحادثة
 WAITING_FOR_AMOUNT = "waiting_for_amount"
@@ -36,9 +38,9 @@ async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         referral_code = context.args[0]
     
     # إنشاء أو الحصول على المستخدم
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
-        user = db.create_user(
+        user = await db.create_user(
             telegram_id=user_id,
             username=update.effective_user.username,
             first_name=update.effective_user.first_name,
@@ -62,7 +64,7 @@ async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def main_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالج القائمة الرئيسية"""
-    user = db.get_user(update.effective_user.id)
+    user = await db.get_user(update.effective_user.id)
     if not user:
         await start_handler(update, context)
         return
@@ -99,7 +101,7 @@ async def deposit_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def withdraw_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالج السحب"""
-    user = db.get_user(update.effective_user.id)
+    user = await db.get_user(update.effective_user.id)
     
     if user.balance < Config.MIN_WITHDRAWAL:
         message = f"❌ الحد الأدنى للسحب هو {format_currency(Config.MIN_WITHDRAWAL)}\n💵 رصيدك الحالي: {format_currency(user.balance)}"
@@ -133,7 +135,7 @@ async def withdraw_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def referral_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالج نظام الإحالات"""
-    user = db.get_user(update.effective_user.id)
+    user = await db.get_user(update.effective_user.id)
     
     bot_username = context.bot.username
     referral_link = f"https://t.me/{bot_username}?start={user.referral_code}"
@@ -168,7 +170,7 @@ async def referral_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def gift_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالج إهداء الرصيد"""
-    user = db.get_user(update.effective_user.id)
+    user = await db.get_user(update.effective_user.id)
     
     if user.balance < Config.MIN_GIFT:
         message = f"❌ الحد الأدنى للإهداء هو {format_currency(Config.MIN_GIFT)}\n💵 رصيدك الحالي: {format_currency(user.balance)}"
@@ -337,26 +339,20 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_referral(user, referral_code):
     """معالجة الإحالة"""
-    session = db.get_session()
-    try:
-        referrer = session.query(User).filter(User.referral_code == referral_code).first()
-        if referrer and referrer.id != user.id:
-            user.referred_by = referral_code
-            referrer.referral_count += 1
-            session.commit()
-            logger.info(f"تم تسجيل إحالة جديدة: {user.telegram_id} -> {referrer.telegram_id}")
-    finally:
-        session.close()
+    referrer = await db.register_referral(user.id, referral_code)
+    if referrer:
+        user.referred_by = referral_code
+        logger.info(f"تم تسجيل إحالة جديدة: {user.telegram_id} -> {referrer.telegram_id}")
 
 async def handle_amount_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالجة إدخال المبلغ"""
     try:
-        amount = float(update.message.text)
+        amount = parse_amount(update.message.text)
         operation = context.user_data.get('operation')
         method = context.user_data.get('method')
         
         if operation == 'gift':
-            user = db.get_user(update.effective_user.id)
+            user = await db.get_user(update.effective_user.id)
             
             if amount < Config.MIN_GIFT:
                 await update.message.reply_text(
@@ -396,80 +392,92 @@ async def handle_amount_input(update: Update, context: ContextTypes.DEFAULT_TYPE
             reply_markup=Keyboards.cancel_operation()
         )
 
+def _send_gift(session, sender_telegram_id, recipient_id, amount):
+    """تنفيذ عملية الإهداء داخل جلسة واحدة، وإرجاع المرسل أو None إذا كان رصيده غير كافٍ
+    
+    يرفع UnknownUserError إذا كان المرسل أو المستلم غير موجود.
+    """
+    sender = session.query(User).filter(User.telegram_id == str(sender_telegram_id)).first()
+    if not sender:
+        raise UnknownUserError(sender_telegram_id)
+    recipient = session.query(User).filter(User.id == recipient_id).first()
+    if not recipient:
+        raise UnknownUserError(recipient_id)
+    
+    # خصم من المرسل وإضافة للمستلم ذرياً
+    new_balance = BalanceLedger.transfer(
+        session, sender.id, recipient.id, amount,
+        Transaction(user_id=sender.id, transaction_type='gift', amount=-amount, status='completed',
+                    description=f"هدية إلى {get_user_display_name(recipient)}"),
+        Transaction(user_id=recipient.id, transaction_type='gift', amount=amount, status='completed',
+                    description=f"هدية من {get_user_display_name(sender)}")
+    )
+    if new_balance is None:
+        return None  # رصيد غير كافي
+    
+    # إضافة سجل الهدية
+    gift = Gift(
+        sender_id=sender.id,
+        receiver_id=recipient.id,
+        amount=amount
+    )
+    session.add(gift)
+    session.commit()
+    return sender
+
 async def handle_recipient_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالجة إدخال المستلم"""
     recipient_input = update.message.text.strip()
     
     # البحث عن المستخدم
-    session = db.get_session()
+    recipient = await db.find_user(recipient_input)
+    
+    if not recipient:
+        await update.message.reply_text(
+            "❌ المستخدم غير موجود. تأكد من صحة المعرف أو اسم المستخدم",
+            reply_markup=Keyboards.cancel_operation()
+        )
+        return
+    
+    # تنفيذ عملية الإهداء
+    amount = context.user_data['amount']
     try:
-        recipient = None
-        
-        # البحث بمعرف التليجرام
-        if recipient_input.isdigit():
-            recipient = session.query(User).filter(User.telegram_id == recipient_input).first()
-        
-        # البحث باسم المستخدم
-        if not recipient and recipient_input.startswith('@'):
-            username = recipient_input[1:]
-            recipient = session.query(User).filter(User.username == username).first()
-        elif not recipient:
-            recipient = session.query(User).filter(User.username == recipient_input).first()
-        
-        if not recipient:
-            await update.message.reply_text(
-                "❌ المستخدم غير موجود. تأكد من صحة المعرف أو اسم المستخدم",
-                reply_markup=Keyboards.cancel_operation()
-            )
-            return
-        
-        # تنفيذ عملية الإهداء
-        amount = context.user_data['amount']
-        sender = db.get_user(update.effective_user.id)
-        
-        if sender.balance >= amount:
-            # خصم من المرسل
-            sender.balance -= amount
-            # إضافة للمستلم
-            recipient.balance += amount
-            
-            # إضافة سجل الهدية
-            from database import Gift
-            gift = Gift(
-                sender_id=sender.id,
-                receiver_id=recipient.id,
-                amount=amount
-            )
-            session.add(gift)
-            session.commit()
-            
-            # رسالة تأكيد للمرسل
-            await update.message.reply_text(
-                f"✅ تم إهداء {format_currency(amount)} بنجاح!\n👤 إلى: {get_user_display_name(recipient)}",
-                reply_markup=Keyboards.main_menu()
-            )
-            
-            # إشعار للمستلم
-            try:
-                await context.bot.send_message(
-                    chat_id=recipient.telegram_id,
-                    text=f"🎁 تهانينا! لقد تلقيت هدية بقيمة {format_currency(amount)}\n👤 من: {get_user_display_name(sender)}",
-                    reply_markup=Keyboards.main_menu()
-                )
-            except TelegramError:
-                logger.warning(f"لا يمكن إرسال إشعار للمستخدم {recipient.telegram_id}")
-        
+        sender = await db.run(_send_gift, update.effective_user.id, recipient.id, amount)
+    except UnknownUserError as e:
+        if e.user_id == recipient.id:
+            message = "❌ حساب المستلم لم يعد موجوداً، لم يتم خصم أي مبلغ"
         else:
-            await update.message.reply_text(
-                "❌ رصيدك غير كافي لإتمام هذه العملية",
-                reply_markup=Keyboards.main_menu()
-            )
-        
-        # مسح حالة المحادثة
+            message = "❌ حسابك غير مسجل، يرجى إرسال /start أولاً"
+        await update.message.reply_text(message, reply_markup=Keyboards.main_menu())
         context.user_data.clear()
+        return
+    
+    if sender:
+        # رسالة تأكيد للمرسل
+        await update.message.reply_text(
+            f"✅ تم إهداء {format_currency(amount)} بنجاح!\n👤 إلى: {get_user_display_name(recipient)}",
+            reply_markup=Keyboards.main_menu()
+        )
         
-    finally:
-        session.close()
+        # إشعار للمستلم
+        try:
+            await context.bot.send_message(
+                chat_id=recipient.telegram_id,
+                text=f"🎁 تهانينا! لقد تلقيت هدية بقيمة {format_currency(amount)}\n👤 من: {get_user_display_name(sender)}",
+                reply_markup=Keyboards.main_menu(),
+                rate_limit_args=TRANSACTIONAL_LANE
+            )
+        except TelegramError:
+            logger.warning(f"لا يمكن إرسال إشعار للمستخدم {recipient.telegram_id}")
+    
+    else:
+        await update.message.reply_text(
+            "❌ رصيدك غير كافي لإتمام هذه العملية",
+            reply_markup=Keyboards.main_menu()
+        )
+    
+    # مسح حالة المحادثة
+    context.user_data.clear()
 
 async def handle_gift_code_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالجة قائمة كود الهدية"""
@@ -486,73 +494,85 @@ async def handle_gift_code_menu(update: Update, context: ContextTypes.DEFAULT_TY
         reply_markup=Keyboards.cancel_operation()
     )
 
+def _redeem_gift_code(session, telegram_id, code):
+    """تطبيق كود الهدية، وإرجاع (رسالة الخطأ، المبلغ، الرصيد الجديد)"""
+    # البحث عن الكود
+    gift_code = session.query(GiftCode).filter(
+        GiftCode.code == code,
+        GiftCode.is_active == True
+    ).first()
+    
+    if not gift_code:
+        return "❌ كود الهدية غير صحيح أو منتهي الصلاحية", None, None
+    
+    # التحقق من عدد الاستخدامات
+    if gift_code.current_uses >= gift_code.max_uses:
+        return "❌ تم استنفاد عدد استخدامات هذا الكود", None, None
+    
+    # التحقق من استخدام المستخدم للكود مسبقاً
+    user = session.query(User).filter(User.telegram_id == str(telegram_id)).first()
+    existing_usage = session.query(GiftCodeUsage).filter(
+        GiftCodeUsage.code_id == gift_code.id,
+        GiftCodeUsage.user_id == user.id
+    ).first()
+    
+    if existing_usage:
+        return "❌ لقد استخدمت هذا الكود من قبل", None, None
+    
+    # حجز استخدام من الكود بشرط عدم استنفاده (آمن مع الاستخدام المتزامن)
+    codes = GiftCode.__table__
+    reserved = session.execute(
+        codes.update().where(
+            codes.c.id == gift_code.id,
+            codes.c.current_uses < codes.c.max_uses
+        ).values(current_uses=codes.c.current_uses + 1)
+    ).rowcount
+    if not reserved:
+        return "❌ تم استنفاد عدد استخدامات هذا الكود", None, None
+    
+    # تطبيق الكود
+    new_balance = BalanceLedger.credit(session, user.id, gift_code.amount, Transaction(
+        user_id=user.id,
+        transaction_type='gift',
+        amount=gift_code.amount,
+        status='completed',
+        description=f"كود هدية {gift_code.code}"
+    ))
+    
+    # تسجيل الاستخدام
+    usage = GiftCodeUsage(
+        code_id=gift_code.id,
+        user_id=user.id
+    )
+    session.add(usage)
+    try:
+        session.commit()
+    except IntegrityError:
+        # طلب متزامن آخر للمستخدم نفسه سجل الاستخدام أولاً
+        session.rollback()
+        return "❌ لقد استخدمت هذا الكود من قبل", None, None
+    return None, gift_code.amount, new_balance
+
 async def handle_gift_code_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالجة إدخال كود الهدية"""
     code = update.message.text.strip().upper()
     
-    session = db.get_session()
-    try:
-        from database import GiftCode, GiftCodeUsage
-        
-        # البحث عن الكود
-        gift_code = session.query(GiftCode).filter(
-            GiftCode.code == code,
-            GiftCode.is_active == True
-        ).first()
-        
-        if not gift_code:
-            await update.message.reply_text(
-                "❌ كود الهدية غير صحيح أو منتهي الصلاحية",
-                reply_markup=Keyboards.main_menu()
-            )
-            context.user_data.clear()
-            return
-        
-        # التحقق من عدد الاستخدامات
-        if gift_code.current_uses >= gift_code.max_uses:
-            await update.message.reply_text(
-                "❌ تم استنفاد عدد استخدامات هذا الكود",
-                reply_markup=Keyboards.main_menu()
-            )
-            context.user_data.clear()
-            return
-        
-        # التحقق من استخدام المستخدم للكود مسبقاً
-        user = db.get_user(update.effective_user.id)
-        existing_usage = session.query(GiftCodeUsage).filter(
-            GiftCodeUsage.code_id == gift_code.id,
-            GiftCodeUsage.user_id == user.id
-        ).first()
-        
-        if existing_usage:
-            await update.message.reply_text(
-                "❌ لقد استخدمت هذا الكود من قبل",
-                reply_markup=Keyboards.main_menu()
-            )
-            context.user_data.clear()
-            return
-        
-        # تطبيق الكود
-        user.balance += gift_code.amount
-        gift_code.current_uses += 1
-        
-        # تسجيل الاستخدام
-        usage = GiftCodeUsage(
-            code_id=gift_code.id,
-            user_id=user.id
-        )
-        session.add(usage)
-        session.commit()
-        
+    error_msg, amount, new_balance = await db.run(_redeem_gift_code, update.effective_user.id, code)
+    
+    if error_msg:
         await update.message.reply_text(
-            f"🎉 تهانينا! تم إضافة {format_currency(gift_code.amount)} إلى رصيدك\n💵 رصيدك الجديد: {format_currency(user.balance)}",
+            error_msg,
             reply_markup=Keyboards.main_menu()
         )
-        
         context.user_data.clear()
-        
-    finally:
-        session.close()
+        return
+    
+    await update.message.reply_text(
+        f"🎉 تهانينا! تم إضافة {format_currency(amount)} إلى رصيدك\n💵 رصيدك الجديد: {format_currency(new_balance)}",
+        reply_markup=Keyboards.main_menu()
+    )
+    
+    context.user_data.clear()
 
 async def handle_message_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالجة إرسال رسالة للإدمن"""
@@ -569,41 +589,41 @@ async def handle_message_admin(update: Update, context: ContextTypes.DEFAULT_TYP
         reply_markup=Keyboards.cancel_operation()
     )
 
+def _save_admin_message(session, user_id, message_text):
+    """حفظ رسالة المستخدم للإدارة"""
+    admin_message = Message(
+        user_id=user_id,
+        message_type='user_to_admin',
+        content=message_text,
+        is_read=False
+    )
+    session.add(admin_message)
+    session.commit()
+
 async def handle_message_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالجة إدخال الرسالة"""
     message_text = update.message.text
-    user = db.get_user(update.effective_user.id)
+    user = await db.get_user(update.effective_user.id)
     
-    session = db.get_session()
-    try:
-        from database import AdminMessage
-        
-        admin_message = AdminMessage(
-            user_id=user.id,
-            message=message_text
-        )
-        session.add(admin_message)
-        session.commit()
-        
-        # إشعار الإدمن
-        for admin_id in Config.ADMIN_IDS:
-            try:
-                await context.bot.send_message(
-                    chat_id=admin_id,
-                    text=f"📩 رسالة جديدة من المستخدم {get_user_display_name(user)}\n\n{message_text}"
-                )
-            except TelegramError:
-                logger.warning(f"لا يمكن إرسال إشعار للإدمن {admin_id}")
-        
-        await update.message.reply_text(
-            "✅ تم إرسال رسالتك للإدارة. سيتم الرد عليك قريباً",
-            reply_markup=Keyboards.main_menu()
-        )
-        
-        context.user_data.clear()
-        
-    finally:
-        session.close()
+    await db.run(_save_admin_message, user.id, message_text)
+    
+    # إشعار الإدمن
+    for admin_id in Config.ADMIN_IDS:
+        try:
+            await context.bot.send_message(
+                chat_id=admin_id,
+                text=f"📩 رسالة جديدة من المستخدم {get_user_display_name(user)}\n\n{message_text}",
+                rate_limit_args=TRANSACTIONAL_LANE
+            )
+        except TelegramError:
+            logger.warning(f"لا يمكن إرسال إشعار للإدمن {admin_id}")
+    
+    await update.message.reply_text(
+        "✅ تم إرسال رسالتك للإدارة. سيتم الرد عليك قريباً",
+        reply_markup=Keyboards.main_menu()
+    )
+    
+    context.user_data.clear()
 
 async def handle_terms(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالجة الشروط والأحكام"""
@@ -665,7 +685,7 @@ async def handle_payment_method(update: Update, context: ContextTypes.DEFAULT_TY
 أرسل المبلغ الآن:
         """
     else:  # withdraw
-        user = db.get_user(update.effective_user.id)
+        user = await db.get_user(update.effective_user.id)
         message = f"""
 💸 السحب عبر {method_info['name']} {method_info['emoji']}
 
@@ -0,0 +1,247 @@
+"""
+عميل ichancy.com API غير المتزامن
+مجمع اتصالات دائمة مشترك، مهلات لكل نقطة، إعادة محاولة مع تشويش، قاطع دائرة،
+وذاكرة مؤقتة بمدة صلاحية مع تقديم القيمة القديمة أثناء التحديث لنقاط القراءة
+"""
+
+import asyncio
+import logging
+import random
+import time
+
+import httpx
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class IchancyAPIError(Exception):
+    """خطأ في طلب ichancy API"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class CircuitOpenError(IchancyAPIError):
+    """الدائرة مفتوحة بعد إخفاقات متتالية، لم يتم إرسال الطلب"""
+
+class CircuitBreaker:
+    """قاطع دائرة: يفتح بعد عدد من الإخفاقات المتتالية ويرفض الطلبات
+    حتى انتهاء مهلة إعادة التعيين، ثم يسمح بطلب تجريبي واحد"""
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """هل يُسمح بإرسال طلب الآن"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+class TTLCache:
+    """ذاكرة مؤقتة بمدة صلاحية مع تقديم القيمة القديمة أثناء التحديث
+
+    خلال ttl تُقدم القيمة مباشرة، وبعدها وحتى ttl + stale_ttl تُقدم القيمة
+    القديمة ويُحدث المفتاح بالخلفية. الطلبات المتزامنة لنفس المفتاح تشترك
+    في طلب واحد للمصدر.
+    """
+
+    def __init__(self):
+        self._entries = {}  # key -> (value, fetched_at)
+        self._inflight = {}  # key -> Future
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    async def get(self, key, fetch, ttl, stale_ttl=0):
+        """قراءة المفتاح أو جلبه باستدعاء fetch()"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < ttl:
+                self.hits += 1
+                return value
+            if age < ttl + stale_ttl:
+                self.stale_hits += 1
+                if key not in self._inflight:
+                    self._start_fetch(key, fetch).add_done_callback(self._log_refresh_error)
+                return value
+
+        self.misses += 1
+        future = self._inflight.get(key) or self._start_fetch(key, fetch)
+        return await asyncio.shield(future)
+
+    def _start_fetch(self, key, fetch):
+        async def run():
+            try:
+                value = await fetch()
+                self._entries[key] = (value, time.monotonic())
+                return value
+            finally:
+                self._inflight.pop(key, None)
+
+        future = asyncio.ensure_future(run())
+        self._inflight[key] = future
+        return future
+
+    @staticmethod
+    def _log_refresh_error(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"فشل تحديث الذاكرة المؤقتة بالخلفية: {future.exception()}")
+
+    def invalidate(self, key=None):
+        """حذف مفتاح أو كل المفاتيح"""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses
+        }
+
+class IchancyClient:
+    """عميل ichancy API بمجمع اتصالات مشترك لكل العمليات"""
+
+    def __init__(self, base_url=None, api_key=None, partner_id=None, config=None, transport=None):
+        self.config = config or Config.ICHANCY_CLIENT_CONFIG
+        headers = {"Accept": "application/json"}
+        api_key = api_key if api_key is not None else Config.ICHANCY_CONFIG["api_key"]
+        partner_id = partner_id if partner_id is not None else Config.ICHANCY_CONFIG["partner_id"]
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        if partner_id:
+            headers["X-Partner-ID"] = partner_id
+
+        self._client = httpx.AsyncClient(
+            base_url=base_url or Config.ICHANCY_CONFIG["api_base_url"],
+            headers=headers,
+            timeout=self.config["timeouts"]["default"],
+            limits=httpx.Limits(
+                max_connections=self.config["max_connections"],
+                max_keepalive_connections=self.config["max_keepalive_connections"],
+                keepalive_expiry=self.config["keepalive_expiry"]
+            ),
+            transport=transport
+        )
+        self.breaker = CircuitBreaker(self.config["breaker_threshold"], self.config["breaker_reset_timeout"])
+        self.cache = TTLCache()
+        self.requests_count = 0
+        self.retries_count = 0
+
+    async def request(self, method, path, endpoint="default", **kwargs):
+        """إرسال طلب مع إعادة المحاولة عند أخطاء الشبكة و 429 و 5xx"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"ichancy API غير متاح مؤقتاً ({path})")
+
+        timeout = self.config["timeouts"].get(endpoint, self.config["timeouts"]["default"])
+        attempts = self.config["retries"] + 1
+        for attempt in range(attempts):
+            try:
+                self.requests_count += 1
+                response = await self._client.request(method, path, timeout=timeout, **kwargs)
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise IchancyAPIError(f"استجابة {response.status_code} من {path}", response.status_code)
+                if response.status_code >= 400:
+                    # خطأ في الطلب نفسه: لا فائدة من الإعادة ولا يدل على تعطل الخدمة
+                    self.breaker.record_success()
+                    raise IchancyAPIError(f"استجابة {response.status_code} من {path}: {response.text}", response.status_code)
+                self.breaker.record_success()
+                return response.json()
+            except (httpx.TransportError, IchancyAPIError) as e:
+                retryable = isinstance(e, httpx.TransportError) or e.status_code == 429 or e.status_code >= 500
+                if not retryable:
+                    raise
+                if attempt == attempts - 1:
+                    self.breaker.record_failure()
+                    if isinstance(e, IchancyAPIError):
+                        raise
+                    raise IchancyAPIError(f"فشل الاتصال بـ {path}: {e}") from e
+
+                # تأخير أسي مع تشويش كامل حتى لا تتزامن إعادة المحاولات
+                self.retries_count += 1
+                delay = min(self.config["backoff_max"], self.config["backoff_base"] * 2 ** attempt)
+                await asyncio.sleep(random.uniform(0, delay))
+
+    async def get_cached(self, path, endpoint, params=None):
+        """طلب GET لنقطة قراءة عبر الذاكرة المؤقتة"""
+        key = (path, tuple(sorted((params or {}).items())))
+        return await self.cache.get(
+            key,
+            lambda: self.request("GET", path, endpoint, params=params),
+            ttl=self.config["cache_ttl"].get(endpoint, 0),
+            stale_ttl=self.config["cache_stale_ttl"].get(endpoint, 0)
+        )
+
+    async def get_games(self, category=None):
+        """قائمة ألعاب الكازينو (اختيارياً لفئة محددة)"""
+        return await self.get_cached("/games", "games", {"category": category} if category else None)
+
+    async def get_odds(self, sport=None):
+        """قائمة الرهانات الرياضية واحتمالاتها (اختيارياً لرياضة محددة)"""
+        return await self.get_cached("/odds", "odds", {"sport": sport} if sport else None)
+
+    async def get_player_balance(self, player_id):
+        """رصيد اللاعب في ichancy (بدون ذاكرة مؤقتة)"""
+        return await self.request("GET", f"/players/{player_id}/balance", "balance")
+
+    def stats(self):
+        """إحصائيات العميل للوحة الإدارة"""
+        return {
+            "requests": self.requests_count,
+            "retries": self.retries_count,
+            "breaker": self.breaker.state,
+            "cache": self.cache.stats()
+        }
+
+    async def aclose(self):
+        """إغلاق مجمع الاتصالات"""
+        await self._client.aclose()
+
+_client = None
+
+def get_ichancy_client():
+    """عميل ichancy المشترك للتطبيق"""
+    global _client
+    if _client is None:
+        _client = IchancyClient()
+    return _client
+
+async def close_ichancy_client():
+    """إغلاق العميل المشترك عند إيقاف التطبيق"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -183,37 +183,47 @@ class Keyboards:
         return InlineKeyboardMarkup(keyboard)
     
     @staticmethod
-    def casino_games_menu():
-        """قائمة ألعاب الكازينو"""
-        keyboard = [
-            [
-                InlineKeyboardButton("🎲 الألعاب السريعة", callback_data="fast_games"),
-                InlineKeyboardButton("🃏 ألعاب الطاولة", callback_data="table_games")
-            ],
-            [
-                InlineKeyboardButton("🎰 ماكينات القمار", callback_data="slot_games"),
-                InlineKeyboardButton("🎪 الكازينو المباشر", callback_data="live_casino")
-            ],
-            [InlineKeyboardButton("🌐 العب على ichancy.com", callback_data="open_ichancy")],
-            [InlineKeyboardButton("🔙 العودة للقائمة الرئيسية", callback_data="main_menu")]
+    def catalog_categories_menu(game_type, category_counts):
+        """قائمة فئات الكتالوج لنوع اللعبة مع عدد العناصر في كل فئة"""
+        categories = Config.GAME_TYPES[game_type]["categories"]
+        buttons = [
+            InlineKeyboardButton(f"{categories[category]} ({count})", callback_data=f"catalog:{game_type}:{category}:0")
+            for category, count in category_counts.items()
         ]
+        keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+        keyboard.append([InlineKeyboardButton("🌐 العب على ichancy.com", callback_data="open_ichancy")])
+        keyboard.append([InlineKeyboardButton("🔙 العودة للقائمة الرئيسية", callback_data="main_menu")])
         return InlineKeyboardMarkup(keyboard)
     
     @staticmethod
-    def sports_betting_menu():
+    def casino_games_menu(category_counts=None):
+        """قائمة ألعاب الكازينو"""
+        if category_counts is None:
+            category_counts = {category: 0 for category in Config.GAME_TYPES["casino"]["categories"]}
+        return Keyboards.catalog_categories_menu("casino", category_counts)
+    
+    @staticmethod
+    def sports_betting_menu(category_counts=None):
         """قائمة الرهانات الرياضية"""
+        if category_counts is None:
+            category_counts = {category: 0 for category in Config.GAME_TYPES["sports"]["categories"]}
+        return Keyboards.catalog_categories_menu("sports", category_counts)
+    
+    @staticmethod
+    def catalog_page(game_type, category, page, pages):
+        """أزرار التنقل بين صفحات فئة في الكتالوج"""
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("◀️ السابق", callback_data=f"catalog:{game_type}:{category}:{page - 1}"))
+        navigation.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data=f"catalog:{game_type}:{category}:{page}"))
+        if page < pages - 1:
+            navigation.append(InlineKeyboardButton("التالي ▶️", callback_data=f"catalog:{game_type}:{category}:{page + 1}"))
+        
+        back = "casino_games" if game_type == "casino" else "sports_betting"
         keyboard = [
-            [
-                InlineKeyboardButton("⚽ كرة القدم", callback_data="football_betting"),
-                InlineKeyboardButton("🏀 كرة السلة", callback_data="basketball_betting")
-            ],
-            [
-                InlineKeyboardButton("🎾 التنس", callback_data="tennis_betting"),
-                InlineKeyboardButton("🏈 رياضات أخرى", callback_data="other_sports")
-            ],
-            [InlineKeyboardButton("📊 الرهانات المباشرة", callback_data="live_betting")],
-            [InlineKeyboardButton("🌐 راهن على ichancy.com", callback_data="open_ichancy")],
-            [InlineKeyboardButton("🔙 العودة للقائمة الرئيسية", callback_data="main_menu")]
+            navigation,
+            [InlineKeyboardButton("🌐 العب على ichancy.com", callback_data="open_ichancy")],
+            [InlineKeyboardButton("🔙 العودة للفئات", callback_data=back)]
         ]
         return InlineKeyboardMarkup(keyboard)
     
@@ -290,6 +300,18 @@ class Keyboards:
         ]
         return InlineKeyboardMarkup(keyboard)
     
+    @staticmethod
+    def broadcast_segments_menu(segment_counts):
+        """اختيار فئة الرسالة الجماعية مع عدد المستخدمين في كل فئة"""
+        segments = Config.get_broadcast_segments()
+        buttons = [
+            InlineKeyboardButton(f"{segments[segment]} ({count})", callback_data=f"broadcast_segment:{segment}")
+            for segment, count in segment_counts.items()
+        ]
+        keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+        keyboard.append([InlineKeyboardButton("🔙 العودة للوحة الإدمن", callback_data="admin_panel")])
+        return InlineKeyboardMarkup(keyboard)
+    
     @staticmethod
     def pending_transactions_menu():
         """قائمة المعاملات المعلقة للإدمن"""
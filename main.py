@@ -7,15 +7,24 @@
 import logging
 import os
 import asyncio
-from datetime import time
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
+import signal
+from datetime import datetime, time, timedelta
+from telegram import Bot
+from telegram.ext import CommandHandler, CallbackQueryHandler, MessageHandler, filters
 from telegram.ext import JobQueue
 
 # استيراد الوحدات المحلية
 from config import Config
-from database import DatabaseManager
+from database import get_async_database, dispose_engines, SystemLog, Transaction
 from handlers import BotHandlers
 from gaming_handler import GamingHandler
+from admin_handler import AdminHandler
+from ichancy_client import close_ichancy_client
+from broadcast import get_broadcast_engine
+from outbound import build_application
+from webhook_server import run_webhook
+from bet_ingestion import start_ingestion_server
+from sharding import run_sharded_webhook, serve_shard
 
 # إعداد التسجيل
 logging.basicConfig(
@@ -29,13 +38,32 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+def _delete_old_records(session):
+    """حذف السجلات والمعاملات المنتهية الأقدم من 3 أشهر"""
+    cutoff_date = datetime.utcnow() - timedelta(days=90)
+    
+    # حذف السجلات القديمة
+    old_logs = session.query(SystemLog).filter(
+        SystemLog.created_at < cutoff_date
+    ).delete()
+    
+    # حذف المعاملات المكتملة القديمة (الاحتفاظ بالمعلقة)
+    old_transactions = session.query(Transaction).filter(
+        Transaction.created_at < cutoff_date,
+        Transaction.status.in_(['completed', 'failed', 'cancelled'])
+    ).delete()
+    
+    session.commit()
+    return old_logs, old_transactions
+
 class TelegramBot:
     """فئة البوت الرئيسية"""
     
     def __init__(self):
-        self.db = DatabaseManager()
+        self.db = get_async_database()
         self.handlers = BotHandlers()
         self.gaming_handler = GamingHandler()
+        self.bet_ingestion = None
         
     async def setup_database(self):
         """إعداد قاعدة البيانات"""
@@ -44,7 +72,10 @@ class TelegramBot:
             os.makedirs('data', exist_ok=True)
             
             # إنشاء الجداول
-            self.db.create_tables()
+            await self.db.create_tables()
+            
+            # بناء فهرس مستلمي الرسائل الجماعية
+            await self.db.load_recipient_index()
             logger.info("تم إعداد قاعدة البيانات بنجاح")
             
         except Exception as e:
@@ -65,6 +96,8 @@ class TelegramBot:
             application.add_handler(CommandHandler("broadcast", self.handlers.admin_broadcast))
             
             # معالجات الأزرار
+            application.add_handler(CallbackQueryHandler(self.gaming_handler.catalog_callback, pattern=r"^catalog:"))
+            application.add_handler(CallbackQueryHandler(AdminHandler.broadcast_segment, pattern=r"^broadcast_segment:"))
             application.add_handler(CallbackQueryHandler(self.handlers.button_handler))
             
             # معالجات الرسائل النصية
@@ -82,17 +115,77 @@ class TelegramBot:
             logger.error(f"خطأ في إعداد المعالجات: {str(e)}")
             raise
     
-    def setup_jobs(self, application):
-        """إعداد المهام المجدولة"""
+    def setup_jobs(self, application, shared_jobs=True):
+        """إعداد المهام المجدولة
+        
+        مع عدة عمليات معالجة تُشغل المهام العامة (السحب، الاستئناف، التنظيف،
+        النسخ الاحتياطي) في عملية واحدة فقط (shared_jobs)، أما كتابة البيانات
+        المتراكمة في الذاكرة وتحديث الكتالوج فتعمل في كل عملية.
+        """
         try:
             job_queue = application.job_queue
             
-            # سحب الجاكبوت اليومي
-            jackpot_time = time.fromisoformat(Config.JACKPOT_DRAW_TIME)
-            job_queue.run_daily(
-                self.gaming_handler.daily_jackpot_draw,
-                time=jackpot_time,
-                name="daily_jackpot_draw"
+            # تحديث كتالوج الألعاب والرهانات الرياضية
+            job_queue.run_repeating(
+                self.gaming_handler.refresh_catalog,
+                interval=Config.CATALOG_CONFIG["refresh_interval"],
+                first=0,
+                name="refresh_catalog"
+            )
+            
+            # كتابة مساهمات الجاكبوت المتراكمة
+            job_queue.run_repeating(
+                self.flush_jackpot_contributions,
+                interval=Config.JACKPOT_FLUSH_INTERVAL,
+                name="flush_jackpot_contributions"
+            )
+            
+            # كتابة آخر نشاط المستخدمين المتراكم
+            job_queue.run_repeating(
+                self.flush_activity,
+                interval=Config.ACTIVITY_FLUSH_INTERVAL,
+                name="flush_activity"
+            )
+            
+            if not shared_jobs:
+                logger.info("تم إعداد المهام المجدولة بنجاح")
+                return
+            
+            # سحب لكل مجموعة جاكبوت مفعلة حسب دوريتها
+            for pool_id, pool in Config.get_jackpot_pools().items():
+                draw_time = time.fromisoformat(pool["draw_time"])
+                job_name = f"jackpot_draw_{pool_id}"
+                if pool["cadence"] == "hourly":
+                    now = datetime.now()
+                    first = (draw_time.minute * 60 - now.minute * 60 - now.second) % 3600
+                    job_queue.run_repeating(
+                        self.gaming_handler.jackpot_draw,
+                        interval=3600,
+                        first=first or 3600,
+                        data=pool_id,
+                        name=job_name
+                    )
+                elif pool["cadence"] == "weekly":
+                    job_queue.run_daily(
+                        self.gaming_handler.jackpot_draw,
+                        time=draw_time,
+                        days=(pool["draw_day"],),
+                        data=pool_id,
+                        name=job_name
+                    )
+                else:
+                    job_queue.run_daily(
+                        self.gaming_handler.jackpot_draw,
+                        time=draw_time,
+                        data=pool_id,
+                        name=job_name
+                    )
+            
+            # استئناف الرسائل الجماعية التي قطعتها إعادة التشغيل
+            job_queue.run_once(
+                self.resume_broadcasts,
+                when=0,
+                name="resume_broadcasts"
             )
             
             # تنظيف البيانات القديمة (أسبوعياً)
@@ -120,41 +213,48 @@ class TelegramBot:
         
         # تسجيل الخطأ في قاعدة البيانات
         if update and update.effective_user:
-            self.db.log_system_event(
+            await self.db.log_system_event(
                 log_type="error",
                 module="telegram_bot",
                 message=str(context.error),
                 user_id=update.effective_user.id
             )
     
+    async def flush_jackpot_contributions(self, context):
+        """كتابة مساهمات الجاكبوت المتراكمة في قاعدة البيانات"""
+        try:
+            await self.db.flush_jackpot_contributions()
+        except Exception as e:
+            logger.error(f"خطأ في كتابة مساهمات الجاكبوت: {str(e)}")
+    
+    async def start_bet_ingestion(self):
+        """تشغيل webhook رهانات ichancy في هذه العملية، لتلغي التسويات نسخ المستخدمين من ذاكرتها"""
+        if not Config.ICHANCY_CONFIG["webhook_secret"]:
+            logger.info("ICHANCY_WEBHOOK_SECRET غير معين، لن يتم تشغيل webhook الرهانات")
+            return
+        self.bet_ingestion = await start_ingestion_server(self.db)
+    
+    async def resume_broadcasts(self, context):
+        """استئناف الرسائل الجماعية غير المكتملة"""
+        try:
+            await get_broadcast_engine(context.bot).resume_interrupted()
+        except Exception as e:
+            logger.error(f"خطأ في استئناف الرسائل الجماعية: {str(e)}")
+    
+    async def flush_activity(self, context):
+        """كتابة آخر نشاط المستخدمين المتراكم في قاعدة البيانات"""
+        try:
+            await self.db.flush_activity()
+        except Exception as e:
+            logger.error(f"خطأ في كتابة آخر نشاط المستخدمين: {str(e)}")
+    
     async def cleanup_old_data(self, context):
         """تنظيف البيانات القديمة"""
         try:
             # تنظيف السجلات القديمة (أكثر من 3 أشهر)
-            from datetime import datetime, timedelta
-            from database import SystemLog, Transaction
+            old_logs, old_transactions = await self.db.run(_delete_old_records)
             
-            session = self.db.get_session()
-            try:
-                cutoff_date = datetime.utcnow() - timedelta(days=90)
-                
-                # حذف السجلات القديمة
-                old_logs = session.query(SystemLog).filter(
-                    SystemLog.created_at < cutoff_date
-                ).delete()
-                
-                # حذف المعاملات المكتملة القديمة (الاحتفاظ بالمعلقة)
-                old_transactions = session.query(Transaction).filter(
-                    Transaction.created_at < cutoff_date,
-                    Transaction.status.in_(['completed', 'failed', 'cancelled'])
-                ).delete()
-                
-                session.commit()
-                
-                logger.info(f"تم تنظيف {old_logs} سجل و {old_transactions} معاملة قديمة")
-                
-            finally:
-                session.close()
+            logger.info(f"تم تنظيف {old_logs} سجل و {old_transactions} معاملة قديمة")
                 
         except Exception as e:
             logger.error(f"خطأ في تنظيف البيانات: {str(e)}")
@@ -196,27 +296,86 @@ class TelegramBot:
                 logger.error("يرجى تعيين BOT_TOKEN في متغيرات البيئة")
                 return
             
+            # وضع عدة عمليات: هذه العملية تستقبل التحديثات وتوزعها على العمال فقط
+            if Config.SHARDED:
+                await self.db.create_tables()
+                await run_sharded_webhook(
+                    Bot(Config.BOT_TOKEN),
+                    run_worker,
+                    Config.WEBHOOK_CONFIG["workers"],
+                    allowed_updates=["message", "callback_query"],
+                    drop_pending_updates=True
+                )
+                return
+            
             # إعداد قاعدة البيانات
             await self.setup_database()
             
             # إنشاء التطبيق
-            application = Application.builder().token(Config.BOT_TOKEN).build()
+            application = build_application()
             
             # إعداد المعالجات والمهام
             self.setup_handlers(application)
             self.setup_jobs(application)
+            await self.start_bet_ingestion()
             
             logger.info("بدء تشغيل البوت...")
             
             # تشغيل البوت
-            await application.run_polling(
-                allowed_updates=["message", "callback_query"],
-                drop_pending_updates=True
-            )
+            if Config.WEBHOOK_CONFIG["url"]:
+                await run_webhook(
+                    application,
+                    allowed_updates=["message", "callback_query"],
+                    drop_pending_updates=True
+                )
+            else:
+                await application.run_polling(
+                    allowed_updates=["message", "callback_query"],
+                    drop_pending_updates=True
+                )
             
         except Exception as e:
             logger.error(f"خطأ في تشغيل البوت: {str(e)}")
             raise
+        finally:
+            await self.shutdown()
+    
+    async def run_worker(self, index, updates):
+        """تشغيل عامل معالجة يستقبل تحديثات مستخدميه من العملية الأمامية"""
+        try:
+            await self.db.load_recipient_index()
+            
+            application = build_application()
+            self.setup_handlers(application)
+            self.setup_jobs(application, shared_jobs=index == 0)
+            if index == 0:
+                await self.start_bet_ingestion()
+            
+            logger.info(f"بدء تشغيل العامل {index}...")
+            async with application:
+                await application.start()
+                await serve_shard(application, updates)
+                await application.stop()
+            
+        except Exception as e:
+            logger.error(f"خطأ في تشغيل العامل {index}: {str(e)}")
+            raise
+        finally:
+            await self.shutdown()
+    
+    async def shutdown(self):
+        """إيقاف webhook الرهانات وكتابة النشاط المتبقي ثم إغلاق مجمع اتصالات قاعدة البيانات المشترك"""
+        if self.bet_ingestion is not None:
+            await self.bet_ingestion.cleanup()
+        await self.db.flush_activity()
+        await self.db.flush_jackpot_contributions()
+        await close_ichancy_client()
+        await dispose_engines()
+
+def run_worker(index, updates):
+    """نقطة دخول عملية المعالجة (الإيقاف تتحكم به العملية الأمامية)"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(TelegramBot().run_worker(index, updates))
 
 def main():
     """الدالة الرئيسية"""
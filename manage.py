@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+أوامر إدارة قاعدة البيانات - ichancy.com
+الاستخدام: python manage.py <الأمر> [--database-url URL]
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+# إضافة مسار المشروع
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import get_engine, get_database
+from migrations import (
+    get_missing_indexes, create_missing_indexes,
+    get_unconverted_money_columns, convert_money_columns
+)
+
+def create_indexes(args):
+    """إضافة الفهارس الناقصة إلى قاعدة بيانات قائمة"""
+    engine = get_engine(args.database_url)
+
+    if args.dry_run:
+        missing = get_missing_indexes(engine)
+        for index in missing:
+            print(f"• {index.table.name}.{index.name}")
+        print(f"📋 {len(missing)} فهرس ناقص")
+        return
+
+    created = create_missing_indexes(engine)
+    for name in created:
+        print(f"✅ {name}")
+    print(f"🎉 تم إنشاء {len(created)} فهرس")
+
+def migrate_money(args):
+    """تحويل أعمدة المبالغ من Float إلى أعداد صحيحة بأصغر وحدة للعملة"""
+    engine = get_engine(args.database_url)
+
+    if args.dry_run:
+        pending = get_unconverted_money_columns(engine)
+        for table, columns in pending.items():
+            print(f"• {table.name}: {', '.join(columns)}")
+        print(f"📋 {len(pending)} جدول بحاجة للتحويل")
+        return
+
+    converted = convert_money_columns(engine)
+    for table_name, columns in converted.items():
+        print(f"✅ {table_name}: {', '.join(columns)}")
+    print(f"🎉 تم تحويل {len(converted)} جدول")
+
+def rebuild_betting_stats(args):
+    """إعادة حساب جدول إحصائيات الرهانات من جدول الرهانات أو التحقق منه"""
+    db = get_database(args.database_url)
+    db.create_tables()
+
+    if args.verify:
+        mismatches = db.verify_betting_stats()
+        for user_id, column, expected, actual in mismatches:
+            print(f"• المستخدم {user_id}: {column} المتوقع {expected} والمخزن {actual}")
+        print(f"{'✅' if not mismatches else '❌'} {len(mismatches)} اختلاف")
+        sys.exit(1 if mismatches else 0)
+
+    count = db.rebuild_betting_stats()
+    print(f"🎉 تمت إعادة حساب إحصائيات {count} مستخدم")
+
+def reconcile_jackpot(args):
+    """مقارنة الإجمالي الجاري لمجموعات الجاكبوت بسجلات المساهمات والأرباح"""
+    db = get_database(args.database_url)
+    db.create_tables()
+
+    mismatches = db.reconcile_jackpot_pools(fix=args.fix)
+    for pool_id, expected, actual in mismatches:
+        print(f"• {pool_id}: المتوقع {expected} والمخزن {actual}")
+
+    if args.fix:
+        print(f"🎉 تم تصحيح {len(mismatches)} مجموعة")
+        return
+    print(f"{'✅' if not mismatches else '❌'} {len(mismatches)} اختلاف")
+    sys.exit(1 if mismatches else 0)
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="أوامر إدارة قاعدة البيانات")
+    parser.add_argument("--database-url", default=None, help="رابط قاعدة البيانات (افتراضياً DATABASE_URL)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    indexes_parser = commands.add_parser("create-indexes", help="إضافة الفهارس الناقصة دون إعادة بناء الجداول")
+    indexes_parser.add_argument("--dry-run", action="store_true", help="عرض الفهارس الناقصة فقط")
+    indexes_parser.set_defaults(handler=create_indexes)
+
+    money_parser = commands.add_parser("migrate-money", help="تحويل المبالغ الحالية إلى أعداد صحيحة بأصغر وحدة")
+    money_parser.add_argument("--dry-run", action="store_true", help="عرض الأعمدة غير المحولة فقط")
+    money_parser.set_defaults(handler=migrate_money)
+
+    stats_parser = commands.add_parser("rebuild-betting-stats", help="إعادة حساب إحصائيات الرهانات لكل مستخدم")
+    stats_parser.add_argument("--verify", action="store_true", help="مقارنة الإحصائيات المخزنة بالمحسوبة دون تعديل")
+    stats_parser.set_defaults(handler=rebuild_betting_stats)
+
+    jackpot_parser = commands.add_parser("reconcile-jackpot", help="التحقق من إجماليات الجاكبوت مقابل سجلات المساهمات")
+    jackpot_parser.add_argument("--fix", action="store_true", help="تصحيح الإجماليات المختلفة")
+    jackpot_parser.set_defaults(handler=reconcile_jackpot)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
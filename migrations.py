@@ -0,0 +1,144 @@
+"""
+ترحيلات قاعدة البيانات - تطبق على قاعدة بيانات قائمة مع الحفاظ على بياناتها
+"""
+
+import logging
+from sqlalchemy import inspect, Integer
+from sqlalchemy.schema import CreateTable, CreateIndex
+
+from database import Base, Money, MINOR_UNITS_PER_UNIT
+
+logger = logging.getLogger(__name__)
+
+def get_missing_indexes(engine):
+    """الفهارس المعرفة في النماذج وغير الموجودة في قاعدة البيانات"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue  # سينشئها create_tables مع فهارسها
+
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in table.indexes if index.name not in existing)
+
+    return missing
+
+def create_missing_indexes(engine):
+    """إنشاء الفهارس الناقصة واحداً تلو الآخر، وإرجاع أسمائها"""
+    created = []
+
+    for index in get_missing_indexes(engine):
+        if engine.dialect.name == "postgresql":
+            # إنشاء الفهرس دون قفل الجدول أمام الكتابة
+            index.dialect_options['postgresql']['concurrently'] = True
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                index.create(bind=connection, checkfirst=True)
+        else:
+            # معاملة قصيرة لكل فهرس حتى لا يطول حجز الكتابة
+            with engine.begin() as connection:
+                index.create(bind=connection, checkfirst=True)
+
+        logger.info(f"تم إنشاء الفهرس {index.name} على {index.table.name}")
+        created.append(index.name)
+
+    return created
+
+def get_unconverted_money_columns(engine):
+    """أعمدة المبالغ التي ما زالت مخزنة كأرقام عشرية (Float) في قاعدة البيانات"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    pending = {}
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        reflected = {column['name']: column['type'] for column in inspector.get_columns(table.name)}
+        columns = [
+            column.name for column in table.columns
+            if isinstance(column.type, Money)
+            and column.name in reflected
+            and not isinstance(reflected[column.name], Integer)
+        ]
+        if columns:
+            pending[table] = columns
+
+    return pending
+
+def convert_money_columns(engine):
+    """تحويل أعمدة المبالغ إلى أعداد صحيحة بأصغر وحدة، وإرجاع {الجدول: الأعمدة}"""
+    converted = {}
+
+    for table, columns in get_unconverted_money_columns(engine).items():
+        if engine.dialect.name == "sqlite":
+            _rebuild_sqlite_table(engine, table, columns)
+        elif engine.dialect.name == "postgresql":
+            alterations = ", ".join(
+                f'ALTER COLUMN "{name}" TYPE BIGINT USING ROUND("{name}" * {MINOR_UNITS_PER_UNIT})::BIGINT'
+                for name in columns
+            )
+            with engine.begin() as connection:
+                connection.exec_driver_sql(f'ALTER TABLE "{table.name}" {alterations}')
+        else:
+            assignments = ", ".join(f"`{name}` = ROUND(`{name}` * {MINOR_UNITS_PER_UNIT})" for name in columns)
+            modifications = ", ".join(
+                f"MODIFY `{name}` BIGINT{'' if table.c[name].nullable else ' NOT NULL'}" for name in columns
+            )
+            with engine.begin() as connection:
+                connection.exec_driver_sql(f"UPDATE `{table.name}` SET {assignments}")
+                connection.exec_driver_sql(f"ALTER TABLE `{table.name}` {modifications}")
+
+        logger.info(f"تم تحويل أعمدة المبالغ في {table.name}: {', '.join(columns)}")
+        converted[table.name] = columns
+
+    return converted
+
+def _rebuild_sqlite_table(engine, table, money_columns):
+    """إعادة بناء جدول SQLite بأنواع الأعمدة الجديدة داخل معاملة واحدة
+
+    SQLite لا يدعم تغيير نوع العمود، لذلك يُنشأ الجدول من جديد وتُنسخ البيانات
+    مع تحويل المبالغ، ثم تُعاد الفهارس.
+    """
+    inspector = inspect(engine)
+    existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+    existing_indexes = [index['name'] for index in inspector.get_indexes(table.name)]
+    old_name = f"{table.name}__money_old"
+
+    columns = [column.name for column in table.columns if column.name in existing_columns]
+    selected = [
+        f'CAST(ROUND("{name}" * {MINOR_UNITS_PER_UNIT}) AS INTEGER)' if name in money_columns else f'"{name}"'
+        for name in columns
+    ]
+    column_list = ", ".join(f'"{name}"' for name in columns)
+
+    raw_connection = engine.raw_connection()
+    dbapi_connection = raw_connection.connection
+    isolation_level = dbapi_connection.isolation_level
+    dbapi_connection.isolation_level = None  # التحكم بالمعاملة يدوياً لتشمل أوامر DDL
+    cursor = dbapi_connection.cursor()
+    try:
+        # عدم تعديل مراجع المفاتيح الأجنبية في الجداول الأخرى عند إعادة التسمية
+        cursor.execute("PRAGMA legacy_alter_table=ON")
+        cursor.execute("BEGIN")
+        try:
+            for index_name in existing_indexes:
+                cursor.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+            cursor.execute(f'ALTER TABLE "{table.name}" RENAME TO "{old_name}"')
+            cursor.execute(str(CreateTable(table).compile(dialect=engine.dialect)))
+            cursor.execute(
+                f'INSERT INTO "{table.name}" ({column_list}) SELECT {", ".join(selected)} FROM "{old_name}"'
+            )
+            cursor.execute(f'DROP TABLE "{old_name}"')
+            for index in table.indexes:
+                cursor.execute(str(CreateIndex(index).compile(dialect=engine.dialect)))
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+    finally:
+        cursor.execute("PRAGMA legacy_alter_table=OFF")
+        cursor.close()
+        dbapi_connection.isolation_level = isolation_level
+        raw_connection.close()
@@ -0,0 +1,356 @@
+"""
+مجدول الرسائل الصادرة لتليجرام - ichancy.com
+كل طلبات البوت الموجهة لمحادثة تمر عبر مسارات أولوية (ردود تفاعلية، ثم إشعارات
+المعاملات، ثم الرسائل الجماعية) مع حد عام وحد لكل محادثة، وترتيب FIFO داخل كل
+محادثة، وإيقاف عام عند RetryAfter. ولكل مسار مجمع اتصالات HTTP ومهلات خاصة به
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from telegram.error import RetryAfter
+from telegram.ext import Application, BaseRateLimiter
+from telegram.request import BaseRequest, HTTPXRequest
+
+from config import Config
+from update_processor import PerUserUpdateProcessor
+from state_store import UserStatePersistence
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+TRANSACTIONAL = "transactional"
+BULK = "bulk"
+LANES = (INTERACTIVE, TRANSACTIONAL, BULK)
+
+# تمرر لطرق البوت: context.bot.send_message(..., rate_limit_args=TRANSACTIONAL_LANE)
+TRANSACTIONAL_LANE = {"lane": TRANSACTIONAL}
+BULK_LANE = {"lane": BULK}
+
+# مسار الطلب الجاري، يحدده المجدول ويختار به LaneRequest مجمع الاتصالات
+current_lane = contextvars.ContextVar("outbound_lane", default=INTERACTIVE)
+
+def _percentile(values, percent):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+class _Request:
+    __slots__ = ("lane", "callback", "args", "kwargs", "future", "enqueued_at", "attempts")
+
+    def __init__(self, lane, callback, args, kwargs):
+        self.lane = lane
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+class _Chat:
+    """طابور محادثة واحدة ورصيدها من الرسائل"""
+
+    __slots__ = ("chat_id", "queue", "tokens", "updated", "rate", "burst", "state")
+
+    def __init__(self, chat_id, rate, burst):
+        self.chat_id = chat_id
+        self.queue = deque()
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.state = "idle"  # idle / ready / cooling / busy
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_at(self, now):
+        """وقت توفر رسالة للمحادثة"""
+        self.refill(now)
+        return now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+
+    def lane(self):
+        # أولوية المحادثة هي أعلى أولوية في طابورها، فلا تنتظر رسالة تفاعلية خلف رسائل جماعية
+        return min((request.lane for request in self.queue), key=LANES.index)
+
+class OutboundScheduler(BaseRateLimiter):
+    """مجدول الطلبات الصادرة (يُمرر إلى Application.builder().rate_limiter)
+
+    الطلبات التي لها chat_id تُجدول: يختار المرسل أعلى مسار فيه محادثة جاهزة،
+    بالتناوب بين المحادثات داخل المسار، ضمن حد عام (رسالة/ث) وحد لكل محادثة
+    (أقل للمجموعات). طلب واحد فقط قيد التنفيذ لكل محادثة، فتصل رسائلها بترتيب
+    إرسالها. عند RetryAfter يتوقف الإرسال كله ثم يُعاد نفس الطلب. الطلبات بدون
+    chat_id (getUpdates، answerCallbackQuery...) تُنفذ مباشرة.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or Config.OUTBOUND_CONFIG
+        self.rate = self.config["rate"]
+        self.tokens = self.config["burst"]
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self._chats = {}
+        self._ready = {lane: deque() for lane in LANES}
+        self._cooling = []  # heap: (وقت التوفر، تسلسل، chat_id)
+        self._sequence = itertools.count()
+        self._changed = None
+        self._dispatcher = None
+        self.depth = dict.fromkeys(LANES, 0)
+        self.sent = dict.fromkeys(LANES, 0)
+        self.waits = {lane: deque(maxlen=self.config["wait_samples"]) for lane in LANES}
+        self.retry_after_count = 0
+
+    async def initialize(self):
+        self._start()
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+    def _start(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._changed = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        lane = (rate_limit_args or {}).get("lane", INTERACTIVE)
+        if lane not in LANES:
+            raise ValueError(f"مسار غير معروف: {lane}")
+
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            token = current_lane.set(lane)
+            try:
+                return await callback(*args, **kwargs)
+            finally:
+                current_lane.reset(token)
+
+        request = _Request(lane, callback, args, kwargs)
+        self._submit(str(chat_id), request)
+        return await request.future
+
+    def _submit(self, chat_id, request):
+        self._start()
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            group = chat_id.startswith("-")
+            chat = self._chats[chat_id] = _Chat(
+                chat_id,
+                self.config["group_rate"] if group else self.config["per_chat_rate"],
+                1 if group else self.config["per_chat_burst"]
+            )
+        chat.queue.append(request)
+        self.depth[request.lane] += 1
+
+        if chat.state == "idle":
+            self._schedule(chat)
+        elif chat.state == "ready" and LANES.index(request.lane) < LANES.index(chat.lane()):
+            # ترقية المحادثة لمسار أعلى
+            for lane in LANES:
+                if chat_id in self._ready[lane]:
+                    self._ready[lane].remove(chat_id)
+            self._ready[chat.lane()].append(chat_id)
+        self._changed.set()
+
+    def _schedule(self, chat):
+        """إضافة المحادثة للمسار الجاهز أو لقائمة الانتظار حسب رصيدها"""
+        if not chat.queue:
+            chat.state = "idle"
+            del self._chats[chat.chat_id]
+            return
+
+        now = time.monotonic()
+        ready_at = chat.ready_at(now)
+        if ready_at <= now:
+            chat.state = "ready"
+            self._ready[chat.lane()].append(chat.chat_id)
+        else:
+            chat.state = "cooling"
+            heapq.heappush(self._cooling, (ready_at, next(self._sequence), chat.chat_id))
+
+    def _next_chat(self):
+        for lane in LANES:
+            if self._ready[lane]:
+                return self._chats[self._ready[lane].popleft()]
+        return None
+
+    async def _wait(self, timeout):
+        self._changed.clear()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            while self._cooling and self._cooling[0][0] <= now:
+                _, _, chat_id = heapq.heappop(self._cooling)
+                self._schedule(self._chats[chat_id])
+
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+
+            if not any(self._ready.values()):
+                await self._wait(self._cooling[0][0] - now if self._cooling else None)
+                continue
+
+            self.tokens = min(self.config["burst"], self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                # إعادة الاختيار بعد الانتظار، فقد يصل طلب بأولوية أعلى
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+
+            chat = self._next_chat()
+            self.tokens -= 1
+            chat.tokens -= 1
+            chat.state = "busy"
+            asyncio.create_task(self._execute(chat, chat.queue[0]))
+
+    async def _execute(self, chat, request):
+        current_lane.set(request.lane)  # مهمة مستقلة لكل طلب، فلا حاجة لإعادة القيمة
+        request.attempts += 1
+        if request.attempts == 1:
+            self.waits[request.lane].append(time.monotonic() - request.enqueued_at)
+        try:
+            if request.future.cancelled():
+                self._finish(chat, request)  # المستدعي لم يعد ينتظر
+                return
+            result = await request.callback(*request.args, **request.kwargs)
+        except RetryAfter as e:
+            self.retry_after_count += 1
+            logger.warning(f"RetryAfter {e.retry_after} ثانية، إيقاف كل الرسائل الصادرة")
+            self.paused_until = max(self.paused_until, time.monotonic() + e.retry_after)
+            if request.attempts > self.config["max_retries"]:
+                self._finish(chat, request, error=e)
+        except Exception as e:
+            self._finish(chat, request, error=e)
+        else:
+            self.sent[request.lane] += 1
+            self._finish(chat, request, result=result)
+        finally:
+            self._schedule(chat)
+            self._changed.set()
+
+    def _finish(self, chat, request, result=None, error=None):
+        chat.queue.popleft()
+        self.depth[request.lane] -= 1
+        if request.future.done():
+            return  # المستدعي ألغى الانتظار
+        if error is not None:
+            request.future.set_exception(error)
+        else:
+            request.future.set_result(result)
+
+    def stats(self):
+        """عمق الطوابير وأزمنة الانتظار لكل مسار"""
+        return {
+            "lanes": {
+                lane: {
+                    "depth": self.depth[lane],
+                    "sent": self.sent[lane],
+                    "wait_p50": _percentile(self.waits[lane], 50),
+                    "wait_p95": _percentile(self.waits[lane], 95),
+                    "wait_max": max(self.waits[lane], default=0)
+                }
+                for lane in LANES
+            },
+            "chats": len(self._chats),
+            "paused_for": max(0, self.paused_until - time.monotonic()),
+            "retry_after": self.retry_after_count
+        }
+
+class LaneRequest(BaseRequest):
+    """طلبات HTTP للبوت بمجمع اتصالات منفصل لكل مسار
+
+    يختار HTTPXRequest الخاص بمسار الطلب الجاري (current_lane)، فلا تستهلك رسالة
+    جماعية طويلة اتصالات الردود التفاعلية، ويسجل زمن الطلبات لكل مجمع.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or Config.TELEGRAM_POOLS
+        self.requests = {lane: HTTPXRequest(**self.config[lane]) for lane in LANES}
+        self.latencies = {lane: deque(maxlen=Config.OUTBOUND_CONFIG["wait_samples"]) for lane in LANES}
+        self.counts = dict.fromkeys(LANES, 0)
+        self.errors = dict.fromkeys(LANES, 0)
+
+    async def initialize(self):
+        for request in self.requests.values():
+            await request.initialize()
+
+    async def shutdown(self):
+        for request in self.requests.values():
+            await request.shutdown()
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE):
+        lane = current_lane.get()
+        started = time.monotonic()
+        try:
+            return await self.requests[lane].do_request(
+                url, method, request_data, read_timeout, write_timeout, connect_timeout, pool_timeout
+            )
+        except Exception:
+            self.errors[lane] += 1
+            raise
+        finally:
+            self.counts[lane] += 1
+            self.latencies[lane].append(time.monotonic() - started)
+
+    def stats(self):
+        """عدد الطلبات وأزمنتها لكل مجمع"""
+        return {
+            lane: {
+                "pool_size": self.config[lane]["connection_pool_size"],
+                "requests": self.counts[lane],
+                "errors": self.errors[lane],
+                "latency_p50": _percentile(self.latencies[lane], 50),
+                "latency_p99": _percentile(self.latencies[lane], 99)
+            }
+            for lane in LANES
+        }
+
+_scheduler = None
+_request = None
+
+def get_outbound_scheduler():
+    """مجدول الرسائل الصادرة المشترك للتطبيق"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = OutboundScheduler()
+    return _scheduler
+
+def get_lane_request():
+    """طلبات HTTP المشتركة للبوت بمجمع لكل مسار"""
+    global _request
+    if _request is None:
+        _request = LaneRequest()
+    return _request
+
+def build_application(token=None):
+    """إنشاء تطبيق البوت بمجدول الرسائل الصادرة ومجمعات الاتصال المنفصلة،
+    ومعالجة التحديثات بالتوازي مع ترتيب تحديثات كل مستخدم، وحفظ حالة المحادثة"""
+    return (
+        Application.builder()
+        .token(token or Config.BOT_TOKEN)
+        .request(get_lane_request())
+        .rate_limiter(get_outbound_scheduler())
+        .concurrent_updates(PerUserUpdateProcessor(Config.UPDATE_CONCURRENCY))
+        .persistence(UserStatePersistence())
+        .build()
+    )
@@ -4,26 +4,125 @@
 
 import logging
 from datetime import datetime
+from decimal import Decimal
 from typing import Optional, Dict, Any
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.error import TelegramError
 
-from database import DatabaseManager, User, Transaction
+from database import get_async_database, BalanceLedger, User, Transaction
 from config import Config
 from keyboards import Keyboards
-from utils import format_currency, validate_amount, get_user_display_name, generate_transaction_reference
+from outbound import TRANSACTIONAL_LANE
+from utils import format_currency, validate_amount, get_user_display_name, generate_transaction_reference, calculate_referral_earnings
 
 logger = logging.getLogger(__name__)
-db = DatabaseManager()
+db = get_async_database()
+
+def _create_deposit_transaction(session, user_id, amount, method):
+    """إنشاء معاملة إيداع معلقة"""
+    transaction = Transaction(
+        user_id=user_id,
+        transaction_type="deposit",
+        amount=amount,
+        method=method,
+        status="pending",
+        description=f"طلب إيداع عبر {Config.PAYMENT_METHODS[method]['name']}"
+    )
+    session.add(transaction)
+    session.commit()
+    return transaction
+
+def _create_withdraw_transaction(session, user_id, amount, method):
+    """إنشاء معاملة سحب معلقة مع خصم المبلغ مؤقتاً"""
+    transaction = Transaction(
+        user_id=user_id,
+        transaction_type="withdraw",
+        amount=amount,
+        method=method,
+        status="pending",
+        description=f"طلب سحب عبر {Config.PAYMENT_METHODS[method]['name']}"
+    )
+    
+    # خصم المبلغ مؤقتاً إذا كان الرصيد كافياً (سيتم إرجاعه في حالة الرفض)
+    if BalanceLedger.debit(session, user_id, amount, transaction) is None:
+        return None
+    session.commit()
+    return transaction
+
+def _append_transaction_reference(session, transaction_id, reference):
+    """إضافة مرجع المعاملة إلى وصفها"""
+    transaction = session.query(Transaction).filter(Transaction.id == transaction_id).first()
+    if transaction:
+        transaction.description += f"\nمرجع المعاملة: {reference}"
+        session.commit()
+    return transaction
+
+def _complete_deposit(session, transaction_id):
+    """إتمام الإيداع وإرجاع (المعاملة، المستخدم)"""
+    transaction = session.query(Transaction).filter(Transaction.id == transaction_id).first()
+    if not transaction:
+        return None, None
+    
+    user = session.query(User).filter(User.id == transaction.user_id).first()
+    if not user:
+        return None, None
+    
+    # إضافة الرصيد
+    BalanceLedger.credit(session, user.id, transaction.amount)
+    transaction.status = "completed"
+    transaction.processed_at = datetime.utcnow()
+    
+    # معالجة أرباح الإحالة
+    if user.referred_by:
+        PaymentHandler.process_referral_earnings(user, transaction.amount, session)
+    
+    session.commit()
+    return transaction, user
+
+def _complete_withdrawal(session, transaction_id):
+    """تأكيد السحب وإرجاع (المعاملة، المستخدم)"""
+    transaction = session.query(Transaction).filter(Transaction.id == transaction_id).first()
+    if not transaction:
+        return None, None
+    
+    user = session.query(User).filter(User.id == transaction.user_id).first()
+    if not user:
+        return None, None
+    
+    # تأكيد السحب
+    transaction.status = "completed"
+    transaction.processed_at = datetime.utcnow()
+    session.commit()
+    return transaction, user
+
+def _reject_transaction(session, transaction_id, reason):
+    """رفض المعاملة وإرجاع (المعاملة، المستخدم)"""
+    transaction = session.query(Transaction).filter(Transaction.id == transaction_id).first()
+    if not transaction:
+        return None, None
+    
+    user = session.query(User).filter(User.id == transaction.user_id).first()
+    if not user:
+        return None, None
+    
+    # إرجاع الرصيد في حالة السحب
+    if transaction.transaction_type == "withdraw" and transaction.status == "pending":
+        BalanceLedger.credit(session, user.id, transaction.amount)
+    
+    transaction.status = "failed"
+    transaction.admin_notes = reason
+    transaction.processed_at = datetime.utcnow()
+    session.commit()
+    return transaction, user
 
 class PaymentHandler:
     """معالج المدفوعات"""
     
     @staticmethod
-    async def process_deposit_request(update: Update, context: ContextTypes.DEFAULT_TYPE, amount: float, method: str):
+    async def process_deposit_request(update: Update, context: ContextTypes.DEFAULT_TYPE, amount: Decimal, method: str):
         """معالجة طلب الإيداع"""
-        user = db.get_user(update.effective_user.id)
+        user = await db.get_user(update.effective_user.id)
         
         # التحقق من صحة المبلغ
         is_valid, validated_amount, error_msg = validate_amount(
@@ -40,39 +139,24 @@ class PaymentHandler:
             return
         
         # إنشاء معاملة جديدة
-        session = db.get_session()
-        try:
-            transaction = Transaction(
-                user_id=user.id,
-                transaction_type="deposit",
-                amount=validated_amount,
-                method=method,
-                status="pending",
-                description=f"طلب إيداع عبر {Config.PAYMENT_METHODS[method]['name']}"
-            )
-            session.add(transaction)
-            session.commit()
-            session.refresh(transaction)
-            
-            # التحقق من إمكانية المعالجة التلقائية
-            method_config = Config.PAYMENT_METHODS[method]
-            if method_config.get("auto_enabled", False):
-                # معالجة تلقائية (إذا كان API متوفر)
-                success = await PaymentHandler.process_automatic_deposit(transaction, method_config)
-                if success:
-                    await PaymentHandler.complete_deposit(transaction.id, update, context)
-                    return
-            
-            # معالجة يدوية
-            await PaymentHandler.process_manual_deposit(transaction, update, context)
-            
-        finally:
-            session.close()
+        transaction = await db.run(_create_deposit_transaction, user.id, validated_amount, method)
+        
+        # التحقق من إمكانية المعالجة التلقائية
+        method_config = Config.PAYMENT_METHODS[method]
+        if method_config.get("auto_enabled", False):
+            # معالجة تلقائية (إذا كان API متوفر)
+            success = await PaymentHandler.process_automatic_deposit(transaction, method_config)
+            if success:
+                await PaymentHandler.complete_deposit(transaction.id, update, context)
+                return
+        
+        # معالجة يدوية
+        await PaymentHandler.process_manual_deposit(transaction, update, context)
     
     @staticmethod
-    async def process_withdraw_request(update: Update, context: ContextTypes.DEFAULT_TYPE, amount: float, method: str):
+    async def process_withdraw_request(update: Update, context: ContextTypes.DEFAULT_TYPE, amount: Decimal, method: str):
         """معالجة طلب السحب"""
-        user = db.get_user(update.effective_user.id)
+        user = await db.get_user(update.effective_user.id)
         
         # التحقق من صحة المبلغ
         is_valid, validated_amount, error_msg = validate_amount(
@@ -97,38 +181,25 @@ class PaymentHandler:
             return
         
         # إنشاء معاملة جديدة
-        session = db.get_session()
-        try:
-            transaction = Transaction(
-                user_id=user.id,
-                transaction_type="withdraw",
-                amount=validated_amount,
-                method=method,
-                status="pending",
-                description=f"طلب سحب عبر {Config.PAYMENT_METHODS[method]['name']}"
+        transaction = await db.run(_create_withdraw_transaction, user.id, validated_amount, method)
+        if not transaction:
+            await update.message.reply_text(
+                Config.MESSAGES["insufficient_balance"],
+                reply_markup=Keyboards.main_menu()
             )
-            session.add(transaction)
-            session.commit()
-            session.refresh(transaction)
-            
-            # خصم المبلغ مؤقتاً (سيتم إرجاعه في حالة الرفض)
-            user.balance -= validated_amount
-            session.commit()
-            
-            # التحقق من إمكانية المعالجة التلقائية
-            method_config = Config.PAYMENT_METHODS[method]
-            if method_config.get("auto_enabled", False):
-                # معالجة تلقائية (إذا كان API متوفر)
-                success = await PaymentHandler.process_automatic_withdrawal(transaction, method_config)
-                if success:
-                    await PaymentHandler.complete_withdrawal(transaction.id, update, context)
-                    return
-            
-            # معالجة يدوية
-            await PaymentHandler.process_manual_withdrawal(transaction, update, context)
-            
-        finally:
-            session.close()
+            return
+        
+        # التحقق من إمكانية المعالجة التلقائية
+        method_config = Config.PAYMENT_METHODS[method]
+        if method_config.get("auto_enabled", False):
+            # معالجة تلقائية (إذا كان API متوفر)
+            success = await PaymentHandler.process_automatic_withdrawal(transaction, method_config)
+            if success:
+                await PaymentHandler.complete_withdrawal(transaction.id, update, context)
+                return
+        
+        # معالجة يدوية
+        await PaymentHandler.process_manual_withdrawal(transaction, update, context)
     
     @staticmethod
     async def process_manual_deposit(transaction: Transaction, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -137,12 +208,7 @@ class PaymentHandler:
         reference = generate_transaction_reference()
         
         # تحديث مرجع المعاملة
-        session = db.get_session()
-        try:
-            transaction.description += f"\nمرجع المعاملة: {reference}"
-            session.commit()
-        finally:
-            session.close()
+        await db.run(_append_transaction_reference, transaction.id, reference)
         
         # رسالة للمستخدم
         user_message = f"""
@@ -174,12 +240,7 @@ class PaymentHandler:
         reference = generate_transaction_reference()
         
         # تحديث مرجع المعاملة
-        session = db.get_session()
-        try:
-            transaction.description += f"\nمرجع المعاملة: {reference}"
-            session.commit()
-        finally:
-            session.close()
+        await db.run(_append_transaction_reference, transaction.id, reference)
         
         # رسالة للمستخدم
         user_message = f"""
@@ -223,108 +284,59 @@ class PaymentHandler:
     @staticmethod
     async def complete_deposit(transaction_id: int, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """إتمام عملية الإيداع"""
-        session = db.get_session()
+        transaction, user = await db.run(_complete_deposit, transaction_id)
+        if not transaction:
+            return
+        
+        # إشعار المستخدم
         try:
-            transaction = session.query(Transaction).filter(Transaction.id == transaction_id).first()
-            if not transaction:
-                return
-            
-            user = session.query(User).filter(User.id == transaction.user_id).first()
-            if not user:
-                return
-            
-            # إضافة الرصيد
-            user.balance += transaction.amount
-            transaction.status = "completed"
-            transaction.processed_at = datetime.utcnow()
-            
-            # معالجة أرباح الإحالة
-            if user.referred_by:
-                await PaymentHandler.process_referral_earnings(user, transaction.amount, session)
-            
-            session.commit()
-            
-            # إشعار المستخدم
-            try:
-                await context.bot.send_message(
-                    chat_id=user.telegram_id,
-                    text=f"✅ تم إتمام عملية الإيداع بنجاح!\n💰 المبلغ: {format_currency(transaction.amount)}\n💵 رصيدك الجديد: {format_currency(user.balance)}",
-                    reply_markup=Keyboards.main_menu()
-                )
-            except TelegramError:
-                logger.warning(f"لا يمكن إرسال إشعار للمستخدم {user.telegram_id}")
-            
-        finally:
-            session.close()
+            await context.bot.send_message(
+                chat_id=user.telegram_id,
+                text=f"✅ تم إتمام عملية الإيداع بنجاح!\n💰 المبلغ: {format_currency(transaction.amount)}\n💵 رصيدك الجديد: {format_currency(user.balance)}",
+                reply_markup=Keyboards.main_menu(),
+                rate_limit_args=TRANSACTIONAL_LANE
+            )
+        except TelegramError:
+            logger.warning(f"لا يمكن إرسال إشعار للمستخدم {user.telegram_id}")
     
     @staticmethod
     async def complete_withdrawal(transaction_id: int, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """إتمام عملية السحب"""
-        session = db.get_session()
+        transaction, user = await db.run(_complete_withdrawal, transaction_id)
+        if not transaction:
+            return
+        
+        # إشعار المستخدم
         try:
-            transaction = session.query(Transaction).filter(Transaction.id == transaction_id).first()
-            if not transaction:
-                return
-            
-            user = session.query(User).filter(User.id == transaction.user_id).first()
-            if not user:
-                return
-            
-            # تأكيد السحب
-            transaction.status = "completed"
-            transaction.processed_at = datetime.utcnow()
-            session.commit()
-            
-            # إشعار المستخدم
-            try:
-                await context.bot.send_message(
-                    chat_id=user.telegram_id,
-                    text=f"✅ تم إتمام عملية السحب بنجاح!\n💸 المبلغ: {format_currency(transaction.amount)}\n💵 رصيدك الحالي: {format_currency(user.balance)}",
-                    reply_markup=Keyboards.main_menu()
-                )
-            except TelegramError:
-                logger.warning(f"لا يمكن إرسال إشعار للمستخدم {user.telegram_id}")
-            
-        finally:
-            session.close()
+            await context.bot.send_message(
+                chat_id=user.telegram_id,
+                text=f"✅ تم إتمام عملية السحب بنجاح!\n💸 المبلغ: {format_currency(transaction.amount)}\n💵 رصيدك الحالي: {format_currency(user.balance)}",
+                reply_markup=Keyboards.main_menu(),
+                rate_limit_args=TRANSACTIONAL_LANE
+            )
+        except TelegramError:
+            logger.warning(f"لا يمكن إرسال إشعار للمستخدم {user.telegram_id}")
     
     @staticmethod
     async def reject_transaction(transaction_id: int, reason: str, context: ContextTypes.DEFAULT_TYPE):
         """رفض المعاملة"""
-        session = db.get_session()
+        transaction, user = await db.run(_reject_transaction, transaction_id, reason)
+        if not transaction:
+            return
+        
+        # إشعار المستخدم
         try:
-            transaction = session.query(Transaction).filter(Transaction.id == transaction_id).first()
-            if not transaction:
-                return
-            
-            user = session.query(User).filter(User.id == transaction.user_id).first()
-            if not user:
-                return
-            
-            # إرجاع الرصيد في حالة السحب
-            if transaction.transaction_type == "withdraw" and transaction.status == "pending":
-                user.balance += transaction.amount
-            
-            transaction.status = "failed"
-            transaction.admin_notes = reason
-            transaction.processed_at = datetime.utcnow()
-            session.commit()
-            
-            # إشعار المستخدم
-            try:
-                await context.bot.send_message(
-                    chat_id=user.telegram_id,
-                    text=f"❌ تم رفض طلب {transaction.transaction_type}\n💰 المبلغ: {format_currency(transaction.amount)}\n📝 السبب: {reason}",
-                    reply_markup=Keyboards.main_menu()
-                )
-            except TelegramError:
-                logger.warning(f"لا يمكن إرسال إشعار للمستخدم {user.telegram_id}")
-            
-        finally:
-            session.close()
+            await context.bot.send_message(
+                chat_id=user.telegram_id,
+                text=f"❌ تم رفض طلب {transaction.transaction_type}\n💰 المبلغ: {format_currency(transaction.amount)}\n📝 السبب: {reason}",
+                reply_markup=Keyboards.main_menu(),
+                rate_limit_args=TRANSACTIONAL_LANE
+            )
+        except TelegramError:
+            logger.warning(f"لا يمكن إرسال إشعار للمستخدم {user.telegram_id}")
     
     @staticmethod
-    async def process_referral_earnings(user: User, deposit_amount: float, session):
+    def process_referral_earnings(user: User, deposit_amount: Decimal, session):
         """معالجة أرباح الإحالة"""
         if not user.referred_by:
             return
@@ -335,24 +347,20 @@ class PaymentHandler:
             return
         
         # حساب الأرباح
-        earnings = deposit_amount * (Config.REFERRAL_PERCENTAGE / 100)
+        earnings = calculate_referral_earnings(deposit_amount, Config.REFERRAL_PERCENTAGE)
         
-        # إضافة الأرباح للمُحيل
+        # إضافة الأرباح للمُحيل مع معاملة أرباح الإحالة
         referrer.referral_earnings += earnings
-        referrer.balance += earnings
-        
-        # إنشاء معاملة أرباح الإحالة
-        referral_transaction = Transaction(
+        BalanceLedger.credit(session, referrer.id, earnings, Transaction(
             user_id=referrer.id,
             transaction_type="referral",
             amount=earnings,
             status="completed",
             description=f"أرباح إحالة من {get_user_display_name(user)} - إيداع {format_currency(deposit_amount)}"
-        )
-        session.add(referral_transaction)
+        ))
     
     @staticmethod
-    def get_payment_instructions(method: str, amount: float) -> str:
+    def get_payment_instructions(method: str, amount: Decimal) -> str:
         """الحصول على تعليمات الدفع"""
         instructions = {
             "syriatel_cash": f"""
@@ -383,7 +391,7 @@ class PaymentHandler:
     @staticmethod
     async def notify_admin_deposit(transaction: Transaction, reference: str, context: ContextTypes.DEFAULT_TYPE):
         """إشعار الإدمن بطلب الإيداع"""
-        user = db.get_user_by_id(transaction.user_id)
+        user = await db.get_user_by_id(transaction.user_id)
         method_info = Config.PAYMENT_METHODS[transaction.method]
         
         admin_message = f"""
@@ -403,7 +411,8 @@ class PaymentHandler:
             try:
                 await context.bot.send_message(
                     chat_id=admin_id,
-                    text=admin_message
+                    text=admin_message,
+                    rate_limit_args=TRANSACTIONAL_LANE
                 )
             except TelegramError:
                 logger.warning(f"لا يمكن إرسال إشعار للإدمن {admin_id}")
@@ -411,7 +420,7 @@ class PaymentHandler:
     @staticmethod
     async def notify_admin_withdrawal(transaction: Transaction, reference: str, context: ContextTypes.DEFAULT_TYPE):
         """إشعار الإدمن بطلب السحب"""
-        user = db.get_user_by_id(transaction.user_id)
+        user = await db.get_user_by_id(transaction.user_id)
         method_info = Config.PAYMENT_METHODS[transaction.method]
         
         admin_message = f"""
@@ -432,20 +441,8 @@ class PaymentHandler:
             try:
                 await context.bot.send_message(
                     chat_id=admin_id,
-                    text=admin_message
+                    text=admin_message,
+                    rate_limit_args=TRANSACTIONAL_LANE
                 )
             except TelegramError:
                 logger.warning(f"لا يمكن إرسال إشعار للإدمن {admin_id}")
-
-# إضافة دالة مساعدة لقاعدة البيانات
-def get_user_by_id(user_id: int) -> Optional[User]:
-    """الحصول على مستخدم بواسطة ID"""
-    session = db.get_session()
-    try:
-        return session.query(User).filter(User.id == user_id).first()
-    finally:
-        session.close()
-
-# إضافة الدالة لفئة DatabaseManager
-DatabaseManager.get_user_by_id = get_user_by_id
-
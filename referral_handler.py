@@ -9,13 +9,13 @@ from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.error import TelegramError
 
-from database import DatabaseManager, User, Transaction, Gift, GiftCode, GiftCodeUsage
+from database import get_database, User, Transaction, Gift, GiftCode, GiftCodeUsage
 from config import Config
 from keyboards import Keyboards
 from utils import format_currency, get_user_display_name, format_datetime, validate_gift_code
 
 logger = logging.getLogger(__name__)
-db = DatabaseManager()
+db = get_database()
 
 class ReferralHandler:
     """معالج الإحالات"""
@@ -54,8 +54,8 @@ fi
 if [ ! -f "data/telegram_bot.db" ]; then
     echo "🗄️ إعداد قاعدة البيانات..."
     python3 -c "
-from database import DatabaseManager
-db = DatabaseManager()
+from database import get_database
+db = get_database()
 db.create_tables()
 print('✅ تم إنشاء قاعدة البيانات')
 "
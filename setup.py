@@ -143,9 +143,9 @@ def setup_database():
     print("\n🗄️ إعداد قاعدة البيانات...")
     
     try:
-        from database import DatabaseManager
+        from database import get_database
         
-        db = DatabaseManager()
+        db = get_database()
         db.create_tables()
         
         print("✅ تم إنشاء قاعدة البيانات والجداول بنجاح")
@@ -0,0 +1,128 @@
+"""
+توزيع تحديثات تليجرام على عدة عمليات حسب المستخدم - ichancy.com
+عملية أمامية تستقبل webhook وتوجه كل تحديث لعامل ثابت حسب معرف المستخدم،
+وكل عامل يشغل المعالجات الحالية بحلقة أحداث ومجمع اتصالات خاص به
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import queue
+import signal
+import time
+
+from telegram import Update
+
+from config import Config
+from webhook_server import WebhookServer
+
+logger = logging.getLogger(__name__)
+
+# مدة انتظار العامل لإنهاء تحديثاته عند الإيقاف (ثانية)
+WORKER_STOP_TIMEOUT = 30
+
+def raw_user_key(data):
+    """مفتاح توجيه التحديث من JSON تليجرام: المستخدم، أو المحادثة، أو None"""
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        for field in ("from", "user"):
+            if isinstance(value.get(field), dict) and "id" in value[field]:
+                return value[field]["id"]
+        chat = value.get("chat") or value.get("message", {}).get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return None
+
+def shard_for(data, workers):
+    """رقم العامل المسؤول عن التحديث (تحديث بدون مستخدم يذهب للعامل الأول)"""
+    key = raw_user_key(data)
+    return 0 if key is None else key % workers
+
+class ShardedWebhookServer(WebhookServer):
+    """خادم webhook يوجه التحديثات للعمال بدل معالجتها
+
+    كل تحديثات المستخدم تصل لنفس العامل، فتبقى حالته (user_data وطابور
+    تحديثاته) محلية فيه. طابور كل عامل محدود، فإذا امتلأ يُرد بـ 503 ويعيد
+    تليجرام الإرسال لاحقاً.
+    """
+
+    def __init__(self, queues, secret_token=None, path=None, config=None):
+        super().__init__(None, secret_token, path, config)
+        self.queues = queues
+        self.routed = [0] * len(queues)
+
+    def dispatch(self, data, received_at):
+        shard = shard_for(data, len(self.queues))
+        try:
+            self.queues[shard].put_nowait(data)
+        except queue.Full:
+            return False
+        self.routed[shard] += 1
+        self.counts['processed'] += 1
+        self.latencies.append(time.monotonic() - received_at)
+        return True
+
+    def stats(self):
+        return dict(super().stats(), routed=list(self.routed))
+
+async def serve_shard(application, updates):
+    """تمرير التحديثات من طابور العملية الأمامية لتطبيق العامل حتى علامة الإيقاف"""
+    loop = asyncio.get_running_loop()
+    while True:
+        data = await loop.run_in_executor(None, updates.get)
+        if data is None:
+            return
+        await application.update_queue.put(Update.de_json(data, application.bot))
+
+async def run_sharded_webhook(bot, worker_target, workers, allowed_updates=None, drop_pending_updates=False):
+    """تشغيل العملية الأمامية وعمال المعالجة حتى استقبال إشارة الإيقاف أو توقف عامل
+
+    worker_target(index, updates) دالة على مستوى الوحدة تُشغل في كل عامل.
+    """
+    config = Config.WEBHOOK_CONFIG
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue(max(1, config["max_pending"] // workers)) for _ in range(workers)]
+    processes = [
+        context.Process(target=worker_target, args=(index, queues[index]), name=f"bot-worker-{index}")
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"تم تشغيل {workers} عامل معالجة")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    server = ShardedWebhookServer(queues)
+    try:
+        await server.start()
+        async with bot:
+            await bot.set_webhook(
+                url=config["url"].rstrip("/") + server.path,
+                secret_token=server.secret_token,
+                allowed_updates=allowed_updates,
+                drop_pending_updates=drop_pending_updates,
+                max_connections=config["max_connections"]
+            )
+        while not stop.is_set():
+            stopped = [process.name for process in processes if not process.is_alive()]
+            if stopped:
+                # توقف عامل يعني ضياع مستخدميه، فيُوقف الكل ليعيد المشرف التشغيل
+                logger.error(f"توقف العامل {', '.join(stopped)}، سيتم إيقاف البوت")
+                break
+            try:
+                await asyncio.wait_for(stop.wait(), 1)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await server.stop()
+        for updates in queues:
+            updates.put(None)
+        for process in processes:
+            await loop.run_in_executor(None, process.join, WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning(f"العامل {process.name} لم يتوقف، سيتم إنهاؤه")
+                process.terminate()
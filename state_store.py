@@ -0,0 +1,173 @@
+"""
+حفظ حالة المحادثة (context.user_data) في قاعدة البيانات - ichancy.com
+حتى لا تضيع عمليات الإيداع والإهداء الجارية عند إعادة التشغيل، ولتبقى الحالة
+مشتركة بين عمليات المعالجة
+"""
+
+import asyncio
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from config import Config
+from database import get_async_database, UserState
+
+logger = logging.getLogger(__name__)
+
+_NOT_LOADED = object()
+
+def _encode_value(value):
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    raise TypeError(f"لا يمكن حفظ القيمة من نوع {type(value).__name__} في حالة المحادثة")
+
+def _decode_value(value):
+    if "$decimal" in value:
+        return Decimal(value["$decimal"])
+    if "$datetime" in value:
+        return datetime.fromisoformat(value["$datetime"])
+    return value
+
+def encode_state(data):
+    """تحويل user_data إلى JSON مضغوط (None لحالة فارغة)"""
+    if not data:
+        return None
+    return json.dumps(data, default=_encode_value, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+
+def decode_state(text):
+    return json.loads(text, object_hook=_decode_value) if text else {}
+
+def _load_user_state(session, telegram_id):
+    """حالة المستخدم المحفوظة (JSON) أو None"""
+    return session.query(UserState.data).filter(UserState.telegram_id == telegram_id).scalar()
+
+def _save_user_states(session, states):
+    """كتابة دفعة حالات {telegram_id: JSON أو None للحذف} في معاملة واحدة"""
+    deleted = [telegram_id for telegram_id, data in states.items() if data is None]
+    saved = {telegram_id: data for telegram_id, data in states.items() if data is not None}
+    if deleted:
+        session.query(UserState).filter(UserState.telegram_id.in_(deleted)).delete(synchronize_session=False)
+    if saved:
+        existing = {telegram_id for (telegram_id,) in session.query(UserState.telegram_id).filter(
+            UserState.telegram_id.in_(list(saved))
+        )}
+        now = datetime.utcnow()
+        rows = [{'telegram_id': telegram_id, 'data': data, 'updated_at': now} for telegram_id, data in saved.items()]
+        session.bulk_update_mappings(UserState, [row for row in rows if row['telegram_id'] in existing])
+        session.bulk_insert_mappings(UserState, [row for row in rows if row['telegram_id'] not in existing])
+    session.commit()
+
+class UserStatePersistence(BasePersistence):
+    """حفظ user_data في جدول user_states
+
+    لا يُحمل شيء عند التشغيل: حالة المستخدم تُقرأ عند أول تحديث له
+    (refresh_user_data). التطبيق يمرر كل update_interval ثانية حالات المستخدمين
+    الذين وصلتهم تحديثات، فتُكتب منها التي تغيرت فقط، وكلها في معاملة واحدة.
+    """
+
+    def __init__(self, db=None, update_interval=None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval or Config.USER_STATE_FLUSH_INTERVAL
+        )
+        self.db = db or get_async_database()
+        self._written = {}  # telegram_id -> آخر JSON محفوظ (None = لا يوجد صف)
+        self._pending = {}
+        self._writing = None
+        self.loads = 0
+        self.writes = 0
+
+    async def get_user_data(self):
+        return {}
+
+    async def refresh_user_data(self, user_id, user_data):
+        """تحميل حالة المستخدم عند أول وصول إليه"""
+        if user_id in self._written:
+            return
+        self._written[user_id] = None
+        try:
+            text = await self.db.run(_load_user_state, user_id)
+        except Exception as e:
+            del self._written[user_id]  # إعادة المحاولة مع التحديث التالي
+            logger.error(f"خطأ في تحميل حالة المستخدم {user_id}: {str(e)}")
+            return
+        self.loads += 1
+        self._written[user_id] = text
+        for key, value in decode_state(text).items():
+            user_data.setdefault(key, value)
+
+    async def update_user_data(self, user_id, data):
+        try:
+            text = encode_state(data)
+        except TypeError as e:
+            logger.error(f"خطأ في حفظ حالة المستخدم {user_id}: {str(e)}")
+            return
+        if self._written.get(user_id, _NOT_LOADED) != text:
+            self._pending[user_id] = text
+            await self._write_pending()
+
+    async def drop_user_data(self, user_id):
+        self._pending[user_id] = None
+        await self._write_pending()
+
+    async def flush(self):
+        await self._write_pending()
+
+    async def _write_pending(self):
+        # التطبيق يستدعي update_user_data لكل المستخدمين معاً، فتنتظر كلها نفس الكتابة
+        if self._writing is None:
+            self._writing = asyncio.ensure_future(self._write())
+        await asyncio.shield(self._writing)
+
+    async def _write(self):
+        self._writing = None
+        states, self._pending = self._pending, {}
+        if not states:
+            return
+        try:
+            await self.db.run(_save_user_states, states)
+        except Exception as e:
+            logger.error(f"خطأ في كتابة حالات {len(states)} مستخدم: {str(e)}")
+            for user_id, text in states.items():
+                self._pending.setdefault(user_id, text)
+            return
+        self.writes += 1
+        self._written.update(states)
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
@@ -5,12 +5,33 @@
 
 import sys
 import os
+import time
+import asyncio
 import unittest
 from unittest.mock import Mock, patch
 
 # إضافة مسار المشروع
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+def create_fake_telegram_api():
+    """خادم Bot API بديل للتوكن 123:abc: الرسائل الجماعية (محادثات 5xxx) بطيئة"""
+    from aiohttp import web
+    
+    async def telegram_api(request):
+        method = request.match_info["method"]
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "bot", "username": "bot"}})
+        chat_id = int((await request.post())["chat_id"])
+        if str(chat_id).startswith("5"):
+            await asyncio.sleep(0.5)
+        return web.json_response({"ok": True, "result": {
+            "message_id": chat_id, "date": 0, "chat": {"id": chat_id, "type": "private"}, "text": "ok"
+        }})
+    
+    app = web.Application()
+    app.router.add_post("/bot123:abc/{method}", telegram_api)
+    return app
+
 class TestBotComponents(unittest.TestCase):
     """اختبارات مكونات البوت"""
     
@@ -121,6 +142,656 @@ class TestUtilityFunctions(unittest.TestCase):
         self.assertFalse(validate_amount("-100"))
         print("✅ دالة التحقق من المبلغ تعمل بشكل صحيح")
 
+class TestIchancyClient(unittest.TestCase):
+    """اختبارات عميل ichancy API مقابل خادم محلي بديل"""
+    
+    def setUp(self):
+        from config import Config
+        self.config = dict(
+            Config.ICHANCY_CLIENT_CONFIG,
+            backoff_base=0.01, backoff_max=0.02, breaker_threshold=3, breaker_reset_timeout=60,
+            cache_ttl={"games": 60, "odds": 0.05}, cache_stale_ttl={"games": 0, "odds": 60}
+        )
+        self.hits = {}
+        self.failures_left = 0
+    
+    def _mock_app(self, latency=0.02):
+        """خادم ichancy بديل بزمن استجابة ثابت"""
+        from aiohttp import web
+        
+        def endpoint(name, payload):
+            async def handler(request):
+                self.hits[name] = self.hits.get(name, 0) + 1
+                await asyncio.sleep(latency)
+                if self.failures_left:
+                    self.failures_left -= 1
+                    return web.json_response({"error": "unavailable"}, status=503)
+                return web.json_response(payload(request))
+            return handler
+        
+        app = web.Application()
+        app.router.add_get("/games", endpoint("games", lambda request: {"games": ["Book of Ra", "Roulette"]}))
+        app.router.add_get("/odds", endpoint("odds", lambda request: {"version": self.hits["odds"]}))
+        app.router.add_get("/players/{player_id}/balance", endpoint(
+            "balance", lambda request: {"player_id": request.match_info["player_id"], "balance": "10.00"}
+        ))
+        return app
+    
+    def _run(self, scenario):
+        from aiohttp.test_utils import TestServer
+        from ichancy_client import IchancyClient
+        
+        async def wrapper():
+            server = TestServer(self._mock_app())
+            await server.start_server()
+            client = IchancyClient(str(server.make_url("")), "key", "partner", config=self.config)
+            try:
+                await scenario(client)
+            finally:
+                await client.aclose()
+                await server.close()
+        
+        asyncio.run(wrapper())
+    
+    def test_cache_latency(self):
+        """اختبار زمن الاستجابة مع الذاكرة المؤقتة وبدونها"""
+        async def scenario(client):
+            started = time.perf_counter()
+            for _ in range(20):
+                await client.get_player_balance(7)
+            uncached = time.perf_counter() - started
+            
+            started = time.perf_counter()
+            for _ in range(20):
+                self.assertEqual((await client.get_games())["games"][0], "Book of Ra")
+            cached = time.perf_counter() - started
+            
+            self.assertEqual((self.hits["balance"], self.hits["games"]), (20, 1))
+            self.assertLess(cached * 5, uncached)
+            print(f"📊 بدون ذاكرة مؤقتة {uncached * 50:.1f}ms/طلب | مع الذاكرة المؤقتة {cached * 50:.1f}ms/طلب")
+            
+            # الطلبات المتزامنة لنفس المفتاح تشترك في طلب واحد
+            await asyncio.gather(*(client.get_games("slots") for _ in range(10)))
+            self.assertEqual(self.hits["games"], 2)
+        
+        self._run(scenario)
+        print("✅ الذاكرة المؤقتة تقلل زمن الاستجابة والطلبات للمصدر")
+    
+    def test_stale_while_revalidate(self):
+        """اختبار تقديم القيمة القديمة أثناء التحديث بالخلفية"""
+        async def scenario(client):
+            self.assertEqual(await client.get_odds(), {"version": 1})
+            await asyncio.sleep(0.1)
+            
+            started = time.perf_counter()
+            self.assertEqual(await client.get_odds(), {"version": 1})
+            self.assertLess(time.perf_counter() - started, 0.015)
+            
+            await asyncio.sleep(0.05)
+            self.assertEqual(await client.get_odds(), {"version": 2})
+            self.assertEqual(client.cache.stats()["stale_hits"], 1)
+        
+        self._run(scenario)
+        print("✅ القيمة القديمة تُقدم أثناء التحديث بالخلفية")
+    
+    def test_retry_and_circuit_breaker(self):
+        """اختبار إعادة المحاولة ثم فتح الدائرة بعد الإخفاقات المتتالية"""
+        from ichancy_client import IchancyAPIError, CircuitOpenError
+        
+        async def scenario(client):
+            self.failures_left = 2
+            self.assertEqual((await client.get_player_balance(1))["balance"], "10.00")
+            self.assertEqual((self.hits["balance"], client.retries_count), (3, 2))
+            
+            self.failures_left = 1000
+            for _ in range(3):
+                with self.assertRaises(IchancyAPIError):
+                    await client.get_player_balance(1)
+            self.assertEqual(client.breaker.state, "open")
+            
+            hits = self.hits["balance"]
+            with self.assertRaises(CircuitOpenError):
+                await client.get_player_balance(1)
+            self.assertEqual(self.hits["balance"], hits)
+        
+        self._run(scenario)
+        print("✅ إعادة المحاولة وقاطع الدائرة يعملان بشكل صحيح")
+
+class TestCatalogService(unittest.TestCase):
+    """اختبارات كتالوج الألعاب والرهانات الرياضية"""
+    
+    def setUp(self):
+        self.version = 1
+        self.hits = 0
+        self.fail = False
+    
+    def _mock_app(self):
+        """خادم ichancy بديل يعيد كتالوجاً يتغير مع كل إصدار"""
+        from aiohttp import web
+        
+        async def games(request):
+            self.hits += 1
+            await asyncio.sleep(0.05)
+            if self.fail:
+                return web.json_response({"error": "unavailable"}, status=500)
+            return web.json_response({"games": [
+                {"name": f"Slot {self.version}-{i:02d}", "category": "slots", "provider": "NetEnt"} for i in range(20)
+            ] + [{"name": f"Table {self.version}", "category": "table_games"}, {"name": "Unknown", "category": "bingo"}]})
+        
+        async def odds(request):
+            self.hits += 1
+            return web.json_response({"events": [
+                {"sport": "football", "home": "Real Madrid", "away": "Barcelona", "odds": {"home": 2.1, "draw": 3.4, "away": 3.2}},
+                {"sport": "hockey", "home": "A", "away": "B"}
+            ]})
+        
+        app = web.Application()
+        app.router.add_get("/games", games)
+        app.router.add_get("/odds", odds)
+        return app
+    
+    def _run(self, scenario):
+        from aiohttp.test_utils import TestServer
+        from config import Config
+        from ichancy_client import IchancyClient
+        from catalog import CatalogService
+        
+        async def wrapper():
+            server = TestServer(self._mock_app())
+            await server.start_server()
+            config = dict(Config.ICHANCY_CLIENT_CONFIG, retries=0, cache_ttl={}, cache_stale_ttl={})
+            client = IchancyClient(str(server.make_url("")), config=config)
+            try:
+                await scenario(CatalogService(client, page_size=8))
+            finally:
+                await client.aclose()
+                await server.close()
+        
+        asyncio.run(wrapper())
+    
+    def test_paged_index(self):
+        """اختبار فهرسة الكتالوج حسب الفئة والتنقل بين الصفحات دون طلبات للمصدر"""
+        async def scenario(service):
+            self.assertTrue(await service.refresh())
+            hits = self.hits
+            
+            self.assertEqual(service.snapshot.category_counts("casino"), {
+                "slots": 20, "table_games": 1, "live_casino": 0, "fast_games": 0
+            })
+            self.assertEqual(service.snapshot.category_counts("sports")["other_sports"], 1)
+            
+            items, page, pages = service.get_page("casino", "slots", 2)
+            self.assertEqual((len(items), page, pages), (4, 2, 3))
+            self.assertEqual(items[0]["name"], "Slot 1-16")
+            self.assertEqual(service.get_page("casino", "slots", 99)[1], 2)
+            self.assertEqual(service.get_page("casino", "live_casino", 0), ((), 0, 1))
+            self.assertEqual(self.hits, hits)
+        
+        self._run(scenario)
+        print("✅ صفحات الكتالوج تُقدم من الفهرس في الذاكرة")
+    
+    def test_atomic_snapshot_swap(self):
+        """اختبار أن القراء يرون نسخة كاملة قديمة أو جديدة فقط"""
+        async def scenario(service):
+            await service.refresh()
+            old = service.snapshot
+            
+            self.version = 2
+            refresh = asyncio.ensure_future(service.refresh())
+            seen = set()
+            while not refresh.done():
+                snapshot = service.snapshot
+                names = {item["name"].split("-")[0] for item in snapshot.items("casino", "slots")}
+                names.add(snapshot.items("casino", "table_games")[0]["name"].replace("Table", "Slot"))
+                self.assertEqual(len(names), 1)
+                seen.update(names)
+                await asyncio.sleep(0.005)
+            
+            self.assertTrue(await refresh)
+            self.assertEqual(seen, {"Slot 1"})
+            self.assertEqual(old.items("casino", "slots")[0]["name"], "Slot 1-00")
+            self.assertEqual(service.snapshot.items("casino", "slots")[0]["name"], "Slot 2-00")
+            
+            # فشل التحديث يبقي النسخة الحالية
+            current = service.snapshot
+            self.fail = True
+            self.assertFalse(await service.refresh())
+            self.assertIs(service.snapshot, current)
+        
+        self._run(scenario)
+        print("✅ استبدال نسخة الكتالوج ذري")
+    
+    def test_pagination_keyboard(self):
+        """اختبار أزرار التنقل بين الصفحات"""
+        from keyboards import Keyboards
+        
+        markup = Keyboards.catalog_page("casino", "slots", 1, 3)
+        self.assertEqual(
+            [button.callback_data for button in markup.inline_keyboard[0]],
+            ["catalog:casino:slots:0", "catalog:casino:slots:1", "catalog:casino:slots:2"]
+        )
+        self.assertEqual(len(Keyboards.catalog_page("casino", "slots", 0, 1).inline_keyboard[0]), 1)
+        print("✅ أزرار صفحات الكتالوج صحيحة")
+
+class TestOutboundScheduler(unittest.TestCase):
+    """اختبارات مجدول الرسائل الصادرة"""
+    
+    CONFIG = {
+        "rate": 50.0, "burst": 1, "per_chat_rate": 20.0, "per_chat_burst": 1,
+        "group_rate": 1.0, "max_retries": 3, "wait_samples": 100
+    }
+    
+    def _run(self, scenario, **config):
+        from outbound import OutboundScheduler
+        
+        async def wrapper():
+            scheduler = OutboundScheduler(dict(self.CONFIG, **config))
+            await scheduler.initialize()
+            try:
+                await scenario(scheduler)
+            finally:
+                await scheduler.shutdown()
+        
+        asyncio.run(wrapper())
+    
+    @staticmethod
+    def _send(scheduler, log, chat_id, text, lane=None, error=None):
+        """طلب send_message وهمي يسجل (المحادثة، النص، الوقت)"""
+        async def callback():
+            if error:
+                raised = error.pop(0) if isinstance(error, list) else error
+                if raised is not None:
+                    raise raised
+            log.append((chat_id, text, time.monotonic()))
+            return text
+        
+        return scheduler.process_request(
+            callback, (), {}, "sendMessage", {"chat_id": chat_id, "text": text},
+            {"lane": lane} if lane else None
+        )
+    
+    def test_priority_lanes(self):
+        """اختبار تقديم الردود التفاعلية على الإشعارات والرسائل الجماعية"""
+        async def scenario(scheduler):
+            log = []
+            bulk = [asyncio.ensure_future(self._send(scheduler, log, 1000 + i, f"bulk {i}", "bulk")) for i in range(10)]
+            await asyncio.sleep(0.05)
+            urgent = [
+                asyncio.ensure_future(self._send(scheduler, log, 1, "notice", "transactional")),
+                asyncio.ensure_future(self._send(scheduler, log, 2, "reply"))
+            ]
+            await asyncio.gather(*bulk, *urgent)
+            
+            order = [text for _, text, _ in log]
+            self.assertLess(order.index("reply"), order.index("notice"))
+            self.assertLess(order.index("notice"), 5)
+            self.assertEqual(scheduler.stats()["lanes"]["bulk"]["sent"], 10)
+        
+        self._run(scenario)
+        print("✅ المسارات التفاعلية تتقدم على الرسائل الجماعية")
+    
+    def test_per_chat_fifo_and_spacing(self):
+        """اختبار ترتيب الرسائل داخل المحادثة والحد لكل محادثة"""
+        async def scenario(scheduler):
+            log = []
+            lanes = ["bulk", None, "transactional", "bulk", None]
+            results = await asyncio.gather(*(
+                self._send(scheduler, log, 42, f"m{i}", lane) for i, lane in enumerate(lanes)
+            ))
+            self.assertEqual(results, [f"m{i}" for i in range(5)])
+            self.assertEqual([text for _, text, _ in log], [f"m{i}" for i in range(5)])
+            
+            gaps = [b[2] - a[2] for a, b in zip(log, log[1:])]
+            self.assertGreaterEqual(min(gaps), 0.04)
+            
+            # الطلبات بدون chat_id تُنفذ مباشرة
+            async def get_updates():
+                return []
+            self.assertEqual(await scheduler.process_request(get_updates, (), {}, "getUpdates", {}, None), [])
+        
+        self._run(scenario)
+        print("✅ رسائل المحادثة الواحدة تصل بالترتيب وبفاصل زمني")
+    
+    def test_retry_after_pauses_all_chats(self):
+        """اختبار إيقاف كل الرسائل عند RetryAfter ثم إعادة الطلب"""
+        from telegram.error import RetryAfter
+        
+        async def scenario(scheduler):
+            log = []
+            started = time.monotonic()
+            first = asyncio.ensure_future(self._send(scheduler, log, 1, "first", error=[RetryAfter(1), None]))
+            await asyncio.sleep(0.05)
+            second = await self._send(scheduler, log, 2, "second")
+            self.assertEqual((await first, second), ("first", "second"))
+            
+            # المحادثة الأخرى تنتظر انتهاء الإيقاف أيضاً
+            self.assertGreaterEqual(min(sent_at for _, _, sent_at in log) - started, 0.95)
+            
+            stats = scheduler.stats()
+            self.assertEqual(stats["retry_after"], 1)
+            self.assertEqual(stats["lanes"]["interactive"]["depth"], 0)
+            self.assertGreater(stats["lanes"]["interactive"]["wait_max"], 0.9)
+            
+            # الأخطاء الأخرى تصل للمستدعي
+            with self.assertRaises(ValueError):
+                await self._send(scheduler, log, 3, "bad", error=ValueError("bad request"))
+        
+        self._run(scenario)
+        print("✅ RetryAfter يوقف كل الرسائل ويعيد الطلب")
+
+    def test_lane_connection_pools(self):
+        """اختبار عدم تأثر الردود التفاعلية بامتلاء مجمع الرسائل الجماعية"""
+        from aiohttp.test_utils import TestServer
+        from telegram.ext import ExtBot
+        from outbound import OutboundScheduler, LaneRequest, BULK_LANE
+        
+        pool = {"connect_timeout": 5.0, "read_timeout": 5.0, "write_timeout": 5.0, "pool_timeout": 5.0}
+        pools = {lane: dict(pool, connection_pool_size=2) for lane in ("interactive", "transactional", "bulk")}
+        
+        async def scenario(scheduler):
+            server = TestServer(create_fake_telegram_api())
+            await server.start_server()
+            request = LaneRequest(pools)
+            bot = ExtBot("123:abc", base_url=str(server.make_url("/bot")), request=request, rate_limiter=scheduler)
+            try:
+                await bot.initialize()
+                bulk = [
+                    asyncio.ensure_future(bot.send_message(5000 + i, "bulk", rate_limit_args=BULK_LANE))
+                    for i in range(6)
+                ]
+                await asyncio.sleep(0.1)
+                
+                started = time.monotonic()
+                message = await bot.send_message(42, "reply")
+                self.assertEqual(message.chat.id, 42)
+                self.assertLess(time.monotonic() - started, 0.3)
+                
+                await asyncio.gather(*bulk)
+                stats = request.stats()
+                self.assertEqual(stats["bulk"]["requests"], 6)
+                self.assertGreaterEqual(stats["bulk"]["latency_p99"], 0.5)
+                self.assertEqual(stats["interactive"]["requests"], 2)  # getMe + الرد
+                self.assertLess(stats["interactive"]["latency_p50"], 0.3)
+            finally:
+                await bot.shutdown()
+                await server.close()
+        
+        self._run(scenario, rate=1000.0, burst=100)
+        print("✅ مجمع اتصالات منفصل لكل مسار")
+
+class TestWebhookServer(unittest.TestCase):
+    """اختبارات وضع webhook"""
+    
+    UPDATES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_data", "telegram_updates.jsonl")
+    
+    def test_replay_recorded_updates(self):
+        """اختبار إرسال تحديثات مسجلة مع التكرار والتحقق من الرمز السري وحد التوازي"""
+        import aiohttp
+        from aiohttp.test_utils import TestServer
+        from telegram import Update
+        from telegram.ext import Application, TypeHandler
+        from config import Config
+        from update_processor import PerUserUpdateProcessor
+        from webhook_server import WebhookServer, SECRET_HEADER
+        
+        with open(self.UPDATES_FILE, encoding="utf-8") as updates_file:
+            bodies = [line.strip().encode() for line in updates_file if line.strip()]
+        
+        async def scenario():
+            api = TestServer(create_fake_telegram_api())
+            await api.start_server()
+            application = (
+                Application.builder().token("123:abc").base_url(str(api.make_url("/bot"))).updater(None)
+                .concurrent_updates(PerUserUpdateProcessor(4)).build()
+            )
+            handled = []
+            concurrency = {"current": 0, "max": 0}
+            
+            async def handle(update, context):
+                concurrency["current"] += 1
+                concurrency["max"] = max(concurrency["max"], concurrency["current"])
+                await asyncio.sleep(0.05)
+                handled.append(update.update_id)
+                concurrency["current"] -= 1
+            
+            application.add_handler(TypeHandler(Update, handle))
+            webhook = WebhookServer(application, "s3cret", "/telegram")
+            server = TestServer(webhook.create_app())
+            await server.start_server()
+            url = str(server.make_url("/telegram"))
+            
+            async with application:
+                async with aiohttp.ClientSession() as session:
+                    async def post(body, secret="s3cret"):
+                        async with session.post(url, data=body, headers={SECRET_HEADER: secret}) as response:
+                            return response.status
+                    
+                    statuses = await asyncio.gather(*(post(body) for body in bodies))
+                    # تليجرام يعيد إرسال التحديثات التي لم يصله ردها
+                    statuses += await asyncio.gather(*(post(body) for body in bodies[:10]))
+                    self.assertEqual(set(statuses), {200})
+                    self.assertEqual(await post(bodies[0], "wrong"), 403)
+                    self.assertEqual(await post(b"not json"), 400)
+                
+                await webhook.stop()
+            await server.close()
+            await api.close()
+            
+            self.assertEqual(sorted(handled), sorted(set(handled)))
+            self.assertEqual(len(handled), 30)
+            self.assertEqual(concurrency["max"], 4)
+            
+            stats = webhook.stats()
+            self.assertEqual((stats["processed"], stats["duplicates"], stats["rejected"]), (30, 10, 2))
+            self.assertEqual(stats["pending"], 0)
+            self.assertGreaterEqual(stats["latency_p50"], 0.05)
+            self.assertGreaterEqual(stats["latency_p99"], stats["latency_p50"])
+            print(f"✅ webhook: p50={stats['latency_p50'] * 1000:.0f}ms p99={stats['latency_p99'] * 1000:.0f}ms")
+        
+        asyncio.run(scenario())
+
+class TestUpdateProcessor(unittest.TestCase):
+    """اختبارات معالجة التحديثات المتوازية مع ترتيب كل مستخدم"""
+    
+    def test_interleaved_updates_stress(self):
+        """اختبار ضغط: تحديثات متداخلة لنفس المستخدمين تُعالج بالترتيب ودون سباق"""
+        import random
+        from aiohttp.test_utils import TestServer
+        from telegram import Update
+        from telegram.ext import Application, TypeHandler
+        from update_processor import PerUserUpdateProcessor
+        
+        users, per_user = 6, 50
+        
+        async def scenario():
+            api = TestServer(create_fake_telegram_api())
+            await api.start_server()
+            processor = PerUserUpdateProcessor(8)
+            application = (
+                Application.builder().token("123:abc").base_url(str(api.make_url("/bot"))).updater(None)
+                .concurrent_updates(processor).build()
+            )
+            order = {}
+            running = {"total": 0, "max": 0, "per_user": {}, "max_per_user": 0}
+            done = asyncio.Event()
+            
+            async def handle(update, context):
+                user_id = update.effective_user.id
+                running["total"] += 1
+                running["per_user"][user_id] = running["per_user"].get(user_id, 0) + 1
+                running["max"] = max(running["max"], running["total"])
+                running["max_per_user"] = max(running["max_per_user"], running["per_user"][user_id])
+                
+                # قراءة ثم كتابة بعد انتظار، كما في معالجات إدخال المبالغ
+                balance = context.user_data.get("balance", 0)
+                await asyncio.sleep(random.uniform(0, 0.004))
+                context.user_data["balance"] = balance + 1
+                order.setdefault(user_id, []).append(int(update.message.text))
+                
+                running["per_user"][user_id] -= 1
+                running["total"] -= 1
+                if sum(len(seen) for seen in order.values()) == users * per_user:
+                    done.set()
+            
+            application.add_handler(TypeHandler(Update, handle))
+            async with application:
+                await application.start()
+                update_id = 0
+                for seq in range(per_user):
+                    for user in range(users):
+                        update_id += 1
+                        await application.update_queue.put(Update.de_json({
+                            "update_id": update_id,
+                            "message": {
+                                "message_id": update_id, "date": 0, "text": str(seq),
+                                "chat": {"id": 2000 + user, "type": "private"},
+                                "from": {"id": 2000 + user, "is_bot": False, "first_name": "u"}
+                            }
+                        }, application.bot))
+                await asyncio.wait_for(done.wait(), 30)
+                await application.stop()
+            await api.close()
+            
+            for user in range(users):
+                self.assertEqual(order[2000 + user], list(range(per_user)))
+                self.assertEqual(application.user_data[2000 + user]["balance"], per_user)
+            self.assertEqual(running["max_per_user"], 1)
+            self.assertEqual(running["max"], users)
+            
+            stats = processor.stats()
+            self.assertEqual((stats["active_users"], stats["waiting"]), (0, 0))
+            self.assertEqual(stats["processed"], users * per_user)
+            self.assertGreater(stats["queued"], 0)
+        
+        asyncio.run(scenario())
+        print("✅ تحديثات المستخدم الواحد تُعالج بالترتيب والمستخدمون بالتوازي")
+
+    def test_default_secret_shared_between_instances(self):
+        """اختبار أن الرمز السري الافتراضي ثابت لكل النسخ بنفس التوكن"""
+        from telegram.ext import Application
+        from config import Config
+        from sharding import ShardedWebhookServer
+        from webhook_server import WebhookServer, derive_secret_token
+
+        config = dict(Config.WEBHOOK_CONFIG, secret_token="")
+        first = WebhookServer(Application.builder().token("123:abc").updater(None).build(), config=config)
+        second = WebhookServer(Application.builder().token("123:abc").updater(None).build(), config=config)
+        other = WebhookServer(Application.builder().token("456:def").updater(None).build(), config=config)
+        self.assertEqual(first.secret_token, second.secret_token)
+        self.assertNotEqual(first.secret_token, other.secret_token)
+        self.assertRegex(first.secret_token, r"^[A-Za-z0-9_-]{1,256}$")
+        self.assertEqual(ShardedWebhookServer([], config=config).secret_token, derive_secret_token(Config.BOT_TOKEN))
+        self.assertEqual(WebhookServer(None, "explicit", config=config).secret_token, "explicit")
+        print("✅ الرمز السري الافتراضي مشتق من التوكن ومتطابق بين النسخ")
+
+class TestSharding(unittest.TestCase):
+    """اختبارات توزيع التحديثات على عمليات المعالجة"""
+
+    def test_workers_share_global_send_rate(self):
+        """اختبار تقسيم حد الإرسال العام على العمال حتى لا يتجاوز مجموعهم حد تليجرام"""
+        import json
+        import subprocess
+        from broadcast import TokenBucket
+
+        env = dict(os.environ, WEBHOOK_URL="https://bot.example.com", WORKER_PROCESSES="4",
+                   OUTBOUND_RATE="30", BROADCAST_RATE="25")
+        script = (
+            "import json; from config import Config; "
+            "print(json.dumps([Config.SHARDED, Config.OUTBOUND_CONFIG['rate'], Config.OUTBOUND_CONFIG['burst'], "
+            "Config.BROADCAST_CONFIG['rate']]))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", script], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout
+        self.assertEqual(json.loads(output.strip().splitlines()[-1]), [True, 7.5, 7, 6.25])
+
+        async def acquire_with_small_rate():
+            bucket = TokenBucket(0.5)
+            await asyncio.wait_for(bucket.acquire(), 1)
+
+        asyncio.run(acquire_with_small_rate())
+        print("✅ العمال يتقاسمون حد الإرسال العام")
+
+    def test_route_updates_by_user(self):
+        """اختبار توجيه كل تحديثات المستخدم لنفس العامل بالترتيب، و503 عند امتلاء طابوره"""
+        import json
+        import multiprocessing
+        import aiohttp
+        from aiohttp.test_utils import TestServer
+        from telegram import Update
+        from telegram.ext import Application, TypeHandler
+        from sharding import ShardedWebhookServer, raw_user_key, serve_shard, shard_for
+        from webhook_server import SECRET_HEADER
+        
+        with open(TestWebhookServer.UPDATES_FILE, encoding="utf-8") as updates_file:
+            updates = [json.loads(line) for line in updates_file if line.strip()]
+        
+        async def scenario():
+            queues = [multiprocessing.get_context("spawn").Queue(20) for _ in range(3)]
+            webhook = ShardedWebhookServer(queues, "s3cret", "/telegram")
+            server = TestServer(webhook.create_app())
+            await server.start_server()
+            url = str(server.make_url("/telegram"))
+            
+            async with aiohttp.ClientSession() as session:
+                async def post(update):
+                    async with session.post(url, json=update, headers={SECRET_HEADER: "s3cret"}) as response:
+                        return response.status
+                
+                statuses = [await post(update) for update in updates]
+                self.assertEqual(set(statuses), {200})
+                
+                received = []
+                for shard, updates_queue in enumerate(queues):
+                    received.append([updates_queue.get(timeout=1) for _ in range(webhook.routed[shard])])
+                
+                # امتلاء طابور عامل يرفض تحديثاته حتى يفرغ
+                crowded = queues[shard_for(updates[0], 3)]
+                for _ in range(20):
+                    crowded.put_nowait(updates[0])
+                retried = dict(updates[0], update_id=10 ** 6)
+                self.assertEqual(await post(retried), 503)
+                crowded.get(timeout=1)
+                self.assertEqual(await post(retried), 200)
+                for _ in range(20):
+                    crowded.get(timeout=1)
+            
+            await webhook.stop()
+            await server.close()
+            
+            self.assertEqual(sum(len(shard_updates) for shard_updates in received), len(updates))
+            self.assertEqual(webhook.stats()["overloaded"], 1)
+            self.assertEqual(sum(1 for shard_updates in received if shard_updates), 3)
+            for shard, shard_updates in enumerate(received):
+                for update in shard_updates:
+                    self.assertEqual(raw_user_key(update) % 3, shard)
+                ids = [update["update_id"] for update in shard_updates]
+                self.assertEqual(ids, sorted(ids))
+            
+            # العامل يمرر تحديثات طابوره للتطبيق حتى علامة الإيقاف
+            api = TestServer(create_fake_telegram_api())
+            await api.start_server()
+            application = Application.builder().token("123:abc").base_url(str(api.make_url("/bot"))).updater(None).build()
+            handled = []
+            
+            async def handle(update, context):
+                handled.append(update.update_id)
+            
+            application.add_handler(TypeHandler(Update, handle))
+            for update in received[0]:
+                queues[0].put(update)
+            queues[0].put(None)
+            async with application:
+                await application.start()
+                await serve_shard(application, queues[0])
+                await application.stop()
+            await api.close()
+            self.assertEqual(handled, [update["update_id"] for update in received[0]])
+        
+        asyncio.run(scenario())
+        print("✅ تحديثات كل مستخدم تصل لنفس العامل بالترتيب")
+
 def run_tests():
     """تشغيل جميع الاختبارات"""
     print("🧪 بدء اختبارات بوت التليجرام العربي...\n")
@@ -132,6 +803,12 @@ def run_tests():
     # إضافة اختبارات المكونات
     suite.addTests(loader.loadTestsFromTestCase(TestBotComponents))
     suite.addTests(loader.loadTestsFromTestCase(TestUtilityFunctions))
+    suite.addTests(loader.loadTestsFromTestCase(TestIchancyClient))
+    suite.addTests(loader.loadTestsFromTestCase(TestCatalogService))
+    suite.addTests(loader.loadTestsFromTestCase(TestOutboundScheduler))
+    suite.addTests(loader.loadTestsFromTestCase(TestWebhookServer))
+    suite.addTests(loader.loadTestsFromTestCase(TestUpdateProcessor))
+    suite.addTests(loader.loadTestsFromTestCase(TestSharding))
     
     # تشغيل الاختبارات
     runner = unittest.TextTestRunner(verbosity=2)
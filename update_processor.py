@@ -0,0 +1,84 @@
+"""
+معالجة تحديثات تليجرام بالتوازي مع ترتيب تحديثات كل مستخدم - ichancy.com
+"""
+
+import logging
+from collections import deque
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """معالج تحديثات متوازٍ بين المستخدمين ومتسلسل لكل مستخدم
+
+    المعالجات (مثل إدخال المبالغ وأكواد الهدايا) تعدل context.user_data والأرصدة
+    على افتراض تحديث واحد لكل مستخدم في نفس الوقت. لكل مستخدم لديه تحديث جارٍ
+    طابور: التحديث التالي له يُضاف للطابور ويُرجع فوراً (فلا يحجز مكاناً من حد
+    التوازي)، ويعالجه التحديث الجاري بعد انتهائه بترتيب الوصول. يُحذف الطابور
+    عند فراغه، فلا تبقى ذاكرة للمستخدمين الخاملين.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._queues = {}  # مفتاح المستخدم -> التحديثات المنتظرة خلف التحديث الجاري
+        self.processed = 0
+        self.queued = 0
+        self.max_queue = 0
+
+    @staticmethod
+    def user_key(update):
+        """مفتاح ترتيب التحديث: المستخدم، أو المحادثة، أو None لتحديث بدون مرسل"""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self.user_key(update)
+        if key is None:
+            await coroutine
+            self.processed += 1
+            return
+
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append(coroutine)
+            self.queued += 1
+            self.max_queue = max(self.max_queue, len(queue))
+            return
+
+        queue = self._queues[key] = deque()
+        try:
+            while coroutine is not None:
+                try:
+                    await coroutine
+                except Exception as e:
+                    # لا يتوقف طابور المستخدم بسبب تحديث فاشل
+                    logger.error(f"خطأ في معالجة تحديث المستخدم {key}: {str(e)}")
+                self.processed += 1
+                coroutine = queue.popleft() if queue else None
+        finally:
+            del self._queues[key]
+            for pending in queue:
+                pending.close()  # عند الإلغاء أثناء الإيقاف
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self):
+        """عدد المستخدمين الجارية تحديثاتهم والتحديثات المنتظرة"""
+        return {
+            "active_users": len(self._queues),
+            "waiting": sum(len(queue) for queue in self._queues.values()),
+            "processed": self.processed,
+            "queued": self.queued,
+            "max_queue": self.max_queue
+        }
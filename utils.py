@@ -3,32 +3,54 @@
 """
 
 import re
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
 from typing import Optional, List, Dict, Any
-from database import User, Transaction
+from database import User, Transaction, to_money
 
-def format_currency(amount: float) -> str:
+def format_currency(amount: Decimal) -> str:
     """تنسيق العملة"""
     return f"{amount:,.2f}"
 
-def validate_amount(amount_str: str, min_amount: float = 0, max_amount: float = float('inf')) -> tuple[bool, float, str]:
+class AmountValidation(tuple):
+    """نتيجة التحقق من المبلغ: (صالح، المبلغ، رسالة الخطأ)، وقيمتها المنطقية هي الصلاحية"""
+    
+    def __new__(cls, is_valid, amount, error_msg):
+        return super().__new__(cls, (is_valid, amount, error_msg))
+    
+    def __bool__(self):
+        return self[0]
+
+def parse_amount(amount_str: str) -> Decimal:
+    """تحويل نص المبلغ إلى Decimal دقيق بخانات العملة، أو ValueError"""
+    try:
+        amount = Decimal(str(amount_str).strip())
+        # التقريب يرفض الأعداد الأطول من دقة Decimal (مثل 1e30)
+        if not amount.is_finite() or amount != to_money(amount):
+            raise ValueError(f"مبلغ غير صالح: {amount_str}")
+    except InvalidOperation:
+        raise ValueError(f"مبلغ غير صالح: {amount_str}")
+    return to_money(amount)
+
+def validate_amount(amount_str: str, min_amount: Decimal = 0, max_amount: Decimal = Decimal('Infinity')) -> AmountValidation:
     """التحقق من صحة المبلغ"""
     try:
-        amount = float(amount_str)
+        amount = parse_amount(amount_str)
         
         if amount <= 0:
-            return False, 0, "❌ المبلغ يجب أن يكون أكبر من صفر"
+            return AmountValidation(False, 0, "❌ المبلغ يجب أن يكون أكبر من صفر")
         
         if amount < min_amount:
-            return False, 0, f"❌ الحد الأدنى هو {format_currency(min_amount)}"
+            return AmountValidation(False, 0, f"❌ الحد الأدنى هو {format_currency(min_amount)}")
         
         if amount > max_amount:
-            return False, 0, f"❌ الحد الأقصى هو {format_currency(max_amount)}"
+            return AmountValidation(False, 0, f"❌ الحد الأقصى هو {format_currency(max_amount)}")
         
-        return True, amount, ""
+        return AmountValidation(True, amount, "")
         
     except ValueError:
-        return False, 0, "❌ يرجى إدخال مبلغ صحيح"
+        return AmountValidation(False, 0, "❌ يرجى إدخال مبلغ صحيح")
 
 def get_user_display_name(user: User) -> str:
     """الحصول على اسم المستخدم للعرض"""
@@ -153,9 +175,9 @@ def format_transaction_history(transactions: List[Transaction], page: int = 1, p
     
     return message.strip()
 
-def calculate_referral_earnings(deposit_amount: float, referral_percentage: float) -> float:
+def calculate_referral_earnings(deposit_amount: Decimal, referral_percentage: Decimal) -> Decimal:
     """حساب أرباح الإحالة"""
-    return deposit_amount * (referral_percentage / 100)
+    return to_money(Decimal(deposit_amount) * Decimal(referral_percentage) / 100)
 
 def generate_transaction_reference() -> str:
     """توليد مرجع المعاملة"""
@@ -165,7 +187,7 @@ def generate_transaction_reference() -> str:
 def is_valid_amount_format(amount_str: str) -> bool:
     """التحقق من تنسيق المبلغ"""
     try:
-        float(amount_str)
+        parse_amount(amount_str)
         return True
     except ValueError:
         return False
@@ -257,3 +279,21 @@ def validate_gift_code(code: str) -> tuple[bool, str, str]:
     
     return True, code, ""
 
+class RecentIds:
+    """مجموعة محدودة الحجم لمفاتيح الأحداث المعالجة مؤخراً (الأقدم يُحذف أولاً)"""
+    
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._keys = OrderedDict()
+    
+    def __contains__(self, key):
+        return key in self._keys
+    
+    def add(self, key):
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.max_size:
+            self._keys.popitem(last=False)
+    
+    def __len__(self):
+        return len(self._keys)
@@ -0,0 +1,165 @@
+"""
+وضع webhook للبوت - ichancy.com
+خادم aiohttp مدمج يستقبل تحديثات تليجرام، يتحقق من الرمز السري، يتجاهل
+التحديثات المكررة عند إعادة إرسالها، ويعالجها بالتوازي ضمن حد قابل للضبط
+"""
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import signal
+import time
+from collections import deque
+
+from aiohttp import web
+from telegram import Update
+
+from config import Config
+from utils import RecentIds
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+def derive_secret_token(bot_token=None):
+    """رمز سري ثابت مشتق من توكن البوت، فتستخدم كل النسخ خلف موزع الحمل نفس الرمز"""
+    return hmac.new((bot_token or Config.BOT_TOKEN).encode(), b"telegram-webhook", hashlib.sha256).hexdigest()
+
+def _percentile(values, percent):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+class WebhookServer:
+    """خادم تحديثات تليجرام
+
+    يرد على تليجرام فور قبول التحديث ثم يعالجه بالخلفية عبر معالج تحديثات
+    التطبيق (application.update_processor)، الذي يحدد التوازي وترتيب تحديثات كل
+    مستخدم (انظر update_processor.PerUserUpdateProcessor). إذا تجاوز عدد
+    التحديثات المنتظرة max_pending يُرد بـ 503 فيعيد تليجرام إرسالها لاحقاً.
+    معرفات التحديثات المقبولة مؤخراً تُحفظ لتجاهل إعادة الإرسال.
+    """
+
+    def __init__(self, application, secret_token=None, path=None, config=None):
+        self.application = application
+        self.config = config or Config.WEBHOOK_CONFIG
+        self.secret_token = (
+            secret_token or self.config["secret_token"]
+            or derive_secret_token(application.bot.token if application is not None else None)
+        )
+        self.path = path or self.config["path"]
+        self.recent = RecentIds(self.config["dedupe_size"])
+        self.latencies = deque(maxlen=self.config["latency_samples"])
+        self.counts = {'received': 0, 'processed': 0, 'duplicates': 0, 'rejected': 0, 'overloaded': 0, 'errors': 0}
+        self.pending = 0
+        self._tasks = set()
+        self._runner = None
+
+    def create_app(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        return app
+
+    async def handle_update(self, request):
+        """استقبال تحديث واحد من تليجرام"""
+        received_at = time.monotonic()
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret_token):
+            self.counts['rejected'] += 1
+            return web.Response(status=403)
+
+        try:
+            data = await request.json()
+            update_id = data["update_id"]
+        except (ValueError, KeyError, TypeError):
+            self.counts['rejected'] += 1
+            return web.Response(status=400)
+
+        self.counts['received'] += 1
+        if update_id in self.recent:
+            self.counts['duplicates'] += 1
+            return web.Response()
+
+        if not self.dispatch(data, received_at):
+            # لا يُسجل المعرف، فتُقبل إعادة الإرسال لاحقاً
+            self.counts['overloaded'] += 1
+            return web.Response(status=503)
+
+        self.recent.add(update_id)
+        return web.Response()
+
+    def dispatch(self, data, received_at):
+        """تسليم تحديث مقبول للمعالجة، وإرجاع False إذا تجاوز الانتظار max_pending"""
+        if self.pending >= self.config["max_pending"]:
+            return False
+        self.pending += 1
+        task = asyncio.create_task(self._process(Update.de_json(data, self.application.bot), received_at))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _process(self, update, received_at):
+        async def handle():
+            try:
+                await self.application.process_update(update)
+                self.counts['processed'] += 1
+            except Exception as e:
+                self.counts['errors'] += 1
+                logger.error(f"خطأ في معالجة التحديث {update.update_id}: {str(e)}")
+            finally:
+                self.pending -= 1
+                self.latencies.append(time.monotonic() - received_at)
+
+        await self.application.update_processor.process_update(update, handle())
+
+    async def start(self, host=None, port=None):
+        """تشغيل الخادم"""
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host or self.config["listen"], port or self.config["port"])
+        await site.start()
+        logger.info(f"خادم webhook يعمل على {host or self.config['listen']}:{port or self.config['port']}{self.path}")
+
+    async def stop(self):
+        """إيقاف الخادم بعد انتهاء التحديثات الجارية"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        logger.info(f"تم إيقاف خادم webhook: {self.stats()}")
+
+    def stats(self):
+        """عدادات التحديثات وزمن معالجتها"""
+        return dict(
+            self.counts,
+            pending=self.pending,
+            latency_p50=_percentile(self.latencies, 50),
+            latency_p99=_percentile(self.latencies, 99)
+        )
+
+async def run_webhook(application, allowed_updates=None, drop_pending_updates=False):
+    """تشغيل البوت بوضع webhook حتى استقبال إشارة الإيقاف"""
+    config = Config.WEBHOOK_CONFIG
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    async with application:
+        await application.start()
+        server = WebhookServer(application)
+        await server.start()
+        try:
+            await application.bot.set_webhook(
+                url=config["url"].rstrip("/") + server.path,
+                secret_token=server.secret_token,
+                allowed_updates=allowed_updates,
+                drop_pending_updates=drop_pending_updates,
+                max_connections=config["max_connections"]
+            )
+            await stop.wait()
+        finally:
+            await server.stop()
+            await application.stop()